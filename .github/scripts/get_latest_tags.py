@@ -6,30 +6,103 @@ import os
 import re
 import subprocess
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatchcase
 from typing import Literal
 
 Repo = Literal["frappe", "erpnext"]
 MajorVersion = Literal["12", "13", "14", "15", "16", "develop"]
 
-
-def get_latest_tag(repo: Repo, version: MajorVersion) -> str:
+REMOTE_BASE = "https://github.com/frappe"
+CACHE_DIR = os.path.join(
+    os.getenv("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+    "frappe_docker",
+    "tags",
+)
+
+
+class RefsCache:
+    """
+    Tag listings of remote repositories, sorted by version.
+
+    Every repository is listed once per invocation; listings are also kept
+    on disk for `ttl` seconds and reused by later invocations.
+    """
+
+    def __init__(self, remote_base: str, cache_dir: str, ttl: float):
+        self.remote_base = remote_base.rstrip("/")
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.refs: dict[str, list[str]] = {}
+
+    def get_url(self, repo: Repo) -> str:
+        return f"{self.remote_base}/{repo}"
+
+    def _get_cache_path(self, url: str) -> str:
+        return os.path.join(self.cache_dir, re.sub(r"[^\w.-]+", "_", url) + ".json")
+
+    def _read_cache(self, url: str) -> list[str] | None:
+        if self.ttl <= 0:
+            return None
+        try:
+            with open(self._get_cache_path(url)) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if time.time() - data["fetched_at"] > self.ttl:
+            return None
+        return data["refs"]
+
+    def _write_cache(self, url: str, refs: list[str]) -> None:
+        if self.ttl <= 0:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._get_cache_path(url)
+        with open(f"{path}.tmp", "w") as f:
+            json.dump({"fetched_at": time.time(), "refs": refs}, f)
+        os.replace(f"{path}.tmp", path)
+
+    def list_refs(self, url: str) -> list[str]:
+        return subprocess.check_output(
+            (
+                "git",
+                "-c",
+                "versionsort.suffix=-",
+                "ls-remote",
+                "--refs",
+                "--tags",
+                "--sort=v:refname",
+                url,
+            ),
+            encoding="UTF-8",
+        ).split()[1::2]
+
+    def get(self, repo: Repo) -> list[str]:
+        if repo not in self.refs:
+            url = self.get_url(repo)
+            refs = self._read_cache(url)
+            if refs is None:
+                refs = self.list_refs(url)
+                self._write_cache(url, refs)
+            self.refs[repo] = refs
+        return self.refs[repo]
+
+    def prefetch(self, repos: list[Repo]) -> None:
+        with ThreadPoolExecutor(max_workers=len(repos) or 1) as executor:
+            list(executor.map(self.get, repos))
+
+
+def get_latest_tag(repo: Repo, version: MajorVersion, cache: RefsCache) -> str:
     if version == "develop":
         return "develop"
     regex = rf"v{version}.*"
-    refs = subprocess.check_output(
-        (
-            "git",
-            "-c",
-            "versionsort.suffix=-",
-            "ls-remote",
-            "--refs",
-            "--tags",
-            "--sort=v:refname",
-            f"https://github.com/frappe/{repo}",
-            str(regex),
-        ),
-        encoding="UTF-8",
-    ).split()[1::2]
+    # Same matching as the pattern argument of `git ls-remote`
+    refs = [
+        ref
+        for ref in cache.get(repo)
+        if fnmatchcase(ref.removeprefix("refs/tags/"), regex)
+    ]
 
     if not refs:
         raise RuntimeError(f'No tags found for version "{regex}"')
@@ -40,6 +113,27 @@ def get_latest_tag(repo: Repo, version: MajorVersion) -> str:
     return matches[0]
 
 
+def get_repos(repos: list[Repo]) -> list[Repo]:
+    # frappe tag is always resolved, erpnext one only if asked for
+    return ["frappe", "erpnext"] if "erpnext" in repos else ["frappe"]
+
+
+def resolve_matrix(
+    repos: list[Repo], versions: list[MajorVersion], cache: RefsCache
+) -> dict[str, dict[str, str | None]]:
+    repos = get_repos(repos)
+    if any(v != "develop" for v in versions):
+        cache.prefetch(repos)
+
+    matrix: dict[str, dict[str, str | None]] = {}
+    for version in versions:
+        matrix[version] = {
+            repo: get_latest_tag(repo, version, cache) if repo in repos else None
+            for repo in ("frappe", "erpnext")
+        }
+    return matrix
+
+
 def update_env(file_name: str, frappe_tag: str, erpnext_tag: str | None = None):
     text = f"\nFRAPPE_VERSION={frappe_tag}"
     if erpnext_tag:
@@ -56,23 +150,54 @@ def update_output(file_name: str, frappe_tag: str, erpnext_tag: str | None = Non
             f.write(f"erpnext_version={erpnext_tag}\n")
 
 
+def update_matrix_output(file_name: str, matrix: dict[str, dict[str, str | None]]):
+    with open(file_name, "a", encoding="utf-8") as f:
+        f.write(f"matrix={json.dumps(matrix)}\n")
+
+
 def _print_resp(frappe_tag: str, erpnext_tag: str | None = None):
     print(json.dumps({"frappe": frappe_tag, "erpnext": erpnext_tag}))
 
 
 def main(_args: list[str]) -> int:
     parser = argparse.ArgumentParser()
-    parser.add_argument("--repo", choices=["frappe", "erpnext"], required=True)
     parser.add_argument(
-        "--version", choices=["12", "13", "14", "15", "16", "develop"], required=True
+        "--repo", choices=["frappe", "erpnext"], action="append", required=True
+    )
+    parser.add_argument(
+        "--version",
+        choices=["12", "13", "14", "15", "16", "develop"],
+        action="append",
+        required=True,
+    )
+    parser.add_argument(
+        "--remote-base",
+        default=REMOTE_BASE,
+        help=f"Repositories are listed from <remote-base>/<repo>, default: {REMOTE_BASE}",
+    )
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument(
+        "--cache-ttl",
+        type=float,
+        default=600,
+        help="Seconds to reuse tag listings, 0 disables the cache, default: 600",
     )
     args = parser.parse_args(_args)
 
-    frappe_tag = get_latest_tag("frappe", args.version)
-    if args.repo == "erpnext":
-        erpnext_tag = get_latest_tag("erpnext", args.version)
-    else:
-        erpnext_tag = None
+    cache = RefsCache(args.remote_base, args.cache_dir, args.cache_ttl)
+    versions = list(dict.fromkeys(args.version))
+    matrix = resolve_matrix(args.repo, versions, cache)
+
+    if len(versions) > 1:
+        file_name = os.getenv("GITHUB_OUTPUT")
+        if file_name:
+            update_matrix_output(file_name, matrix)
+        print(json.dumps(matrix))
+        return 0
+
+    frappe_tag = matrix[versions[0]]["frappe"]
+    erpnext_tag = matrix[versions[0]]["erpnext"]
+    assert frappe_tag
 
     file_name = os.getenv("GITHUB_ENV")
     if file_name:
@@ -1,7 +1,31 @@
 #!/usr/bin/env python3
 import argparse
+import hashlib
+import importlib
+import json
 import os
+import re
+import shutil
 import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+
+# Shared with the configurator service of compose.yaml
+CORE_RESOURCES_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "resources", "core"
+)
+# Completed steps are stored in the bench, so reruns resume after them
+STATE_FILE = ".installer-state.json"
+# Steps that set up the apps from apps json after they are cloned
+APP_INSTALL_STEPS = (
+    "install-python-deps",
+    "install-node-deps",
+    "register-apps",
+    "build-assets",
+)
 
 
 def cprint(*args, level: int = 1):
@@ -29,8 +53,14 @@ def cprint(*args, level: int = 1):
 def main():
     parser = get_args_parser()
     args = parser.parse_args()
-    init_bench_if_not_exist(args)
-    create_site_in_bench(args)
+    state = InstallerState(os.path.join(os.getcwd(), args.bench_name))
+    start = time.monotonic()
+    try:
+        ok = run_steps(args, state)
+    finally:
+        print_summary(state, time.monotonic() - start)
+    if not ok:
+        sys.exit(1)
 
 
 def get_args_parser():
@@ -54,10 +84,22 @@ def get_args_parser():
     parser.add_argument(
         "-s",
         "--site-name",
+        action="append",
+        type=str,
+        help="Site name, should end with .localhost, can be repeated, default: development.localhost",  # noqa: E501
+    )
+    parser.add_argument(
+        "--sites-file",
         action="store",
         type=str,
-        help="Site name, should end with .localhost, default: development.localhost",  # noqa: E501
-        default="development.localhost",
+        help="File with site names to create, one per line",
+    )
+    parser.add_argument(
+        "--jobs",
+        action="store",
+        type=int,
+        help="Number of sites created or apps fetched at the same time, default: 4",
+        default=4,
     )
     parser.add_argument(
         "-r",
@@ -97,6 +139,14 @@ def get_args_parser():
         action="store_true",
         help="verbose output",  # noqa: E501
     )
+    parser.add_argument(
+        "-c",
+        "--cache-dir",
+        action="store",
+        type=str,
+        help="Directory with git mirrors and Python wheels reused by later runs, default: Not Set",  # noqa: E501
+        default=None,
+    )
     parser.add_argument(
         "-a",
         "--admin-password",
@@ -105,6 +155,11 @@ def get_args_parser():
         help="admin password for site, default: admin",  # noqa: E501
         default="admin",
     )
+    parser.add_argument(
+        "--from-template",
+        action="store_true",
+        help="Install apps on a template site once and create sites as its copies",
+    )
     parser.add_argument(
         "-d",
         "--db-type",
@@ -116,94 +171,438 @@ def get_args_parser():
     return parser
 
 
-def init_bench_if_not_exist(args):
-    if os.path.exists(args.bench_name):
-        cprint("Bench already exists. Only site will be created", level=3)
-        return
+class InstallerState:
+    def __init__(self, bench_path: str):
+        self.bench_path = bench_path
+        self.path = os.path.join(bench_path, STATE_FILE)
+        self.steps = {}
+        # Steps in order of execution: name, status, duration
+        self.results = []
+        self.lock = threading.Lock()
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.steps = json.load(f)["steps"]
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def is_done(self, name: str):
+        return name in self.steps
+
+    def record(self, name: str, status: str, duration: float = 0.0):
+        with self.lock:
+            self.results.append((name, status, duration))
+            if status != "done":
+                return
+            self.steps[name] = {"duration": round(duration, 3), "finished": time.time()}
+            self.save()
+
+    def assume_done(self, names: list):
+        for name in names:
+            self.steps[name] = {"duration": None, "finished": time.time()}
+        self.save()
+
+    def save(self):
+        # Nothing to save before `bench init` created the bench directory
+        if not os.path.isdir(self.bench_path):
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"steps": self.steps}, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+
+def run_step(state: InstallerState, name: str, func):
+    if state.is_done(name):
+        cprint(f"Skipping {name}, already done", level=3)
+        state.record(name, "skipped")
+        return True
+    cprint(f"Running {name} ...", level=2)
+    start = time.monotonic()
     try:
-        env = os.environ.copy()
-        if args.py_version:
-            env["PYENV_VERSION"] = args.py_version
-        init_command = ""
-        if args.node_version:
-            init_command = f"nvm use {args.node_version};"
-        if args.py_version:
-            init_command += f"PYENV_VERSION={args.py_version} "
-        init_command += "bench init "
-        init_command += "--skip-redis-config-generation "
-        init_command += "--verbose " if args.verbose else " "
-        init_command += f"--frappe-path={args.frappe_repo} "
-        init_command += f"--frappe-branch={args.frappe_branch} "
-        init_command += f"--apps_path={args.apps_json} "
-        init_command += args.bench_name
-        command = [
-            "/bin/bash",
-            "-i",
-            "-c",
-            init_command,
-        ]
-        subprocess.call(command, env=env, cwd=os.getcwd())
-        cprint("Configuring Bench ...", level=2)
-        cprint("Set db_host", level=3)
-        if args.db_type:
-            cprint(f"Setting db_type to {args.db_type}", level=3)
-            subprocess.call(
-                ["bench", "set-config", "-g", "db_type", args.db_type],
-                cwd=os.path.join(os.getcwd(), args.bench_name),
-            )
+        func()
+    except (subprocess.CalledProcessError, OSError) as e:
+        state.record(name, "failed", time.monotonic() - start)
+        state.save()
+        cprint(f"Step {name} failed: {e}", level=1)
+        cprint("Rerun installer.py to resume from this step", level=1)
+        return False
+    state.record(name, "done", time.monotonic() - start)
+    return True
 
-        cprint("Set redis_cache to redis://redis-cache:6379", level=3)
-        subprocess.call(
-            [
-                "bench",
-                "set-config",
-                "-g",
-                "redis_cache",
-                "redis://redis-cache:6379",
-            ],
-            cwd=os.getcwd() + "/" + args.bench_name,
-        )
-        cprint("Set redis_queue to redis://redis-queue:6379", level=3)
-        subprocess.call(
-            [
-                "bench",
-                "set-config",
-                "-g",
-                "redis_queue",
-                "redis://redis-queue:6379",
-            ],
-            cwd=os.getcwd() + "/" + args.bench_name,
-        )
+
+def run_steps(args, state: InstallerState):
+    bench_exists = os.path.exists(state.bench_path)
+    apps = read_apps_json(args.apps_json)
+    app_steps = [f"get-app:{get_app_name(app)}" for app in apps]
+
+    if bench_exists and not state.exists():
+        cprint("Bench already exists. Skipping bench init and apps", level=3)
+        state.assume_done(["init", *app_steps, *APP_INSTALL_STEPS])
+    elif bench_exists and not state.is_done("init"):
         cprint(
-            "Set redis_socketio to redis://redis-queue:6379 for backward compatibility",  # noqa: E501
-            level=3,
+            f"bench init didn't finish in {args.bench_name}, remove it and rerun",
+            level=1,
         )
-        subprocess.call(
-            [
-                "bench",
-                "set-config",
-                "-g",
-                "redis_socketio",
-                "redis://redis-queue:6379",
-            ],
-            cwd=os.getcwd() + "/" + args.bench_name,
+        return False
+
+    steps = []
+    if args.cache_dir:
+        steps.append(("update-mirrors", partial(update_mirrors, args, apps)))
+    steps.append(("init", partial(init_bench, args)))
+    for name, func in steps:
+        if not run_step(state, name, func):
+            return False
+
+    if apps:
+        clone_steps = [
+            (name, partial(clone_app, args, app)) for name, app in zip(app_steps, apps)
+        ]
+        if not run_steps_in_parallel(state, clone_steps, args.jobs):
+            return False
+
+        app_names = get_app_names(args, apps)
+        steps = [
+            ("install-python-deps", partial(install_python_deps, args, app_names)),
+            ("install-node-deps", partial(install_node_deps, args, app_names)),
+            ("register-apps", partial(register_apps, args, app_names)),
+            ("build-assets", partial(build_assets, args)),
+        ]
+    else:
+        steps = []
+    if args.cache_dir:
+        steps.append(("cache-wheels", partial(cache_wheels, args)))
+    steps += [
+        (f"config:{key}", partial(set_config, args, {key: value}))
+        for key, value in get_bench_config(args).items()
+    ]
+    for name, func in steps:
+        if not run_step(state, name, func):
+            return False
+
+    return create_sites(args, state)
+
+
+def run_timed(func):
+    start = time.monotonic()
+    try:
+        func()
+    except (subprocess.CalledProcessError, OSError) as e:
+        return e, time.monotonic() - start
+    return None, time.monotonic() - start
+
+
+def run_steps_in_parallel(state: InstallerState, steps: list, jobs: int):
+    pending = []
+    for name, func in steps:
+        if state.is_done(name):
+            cprint(f"Skipping {name}, already done", level=3)
+            state.record(name, "skipped")
+        else:
+            pending.append((name, func))
+    if not pending:
+        return True
+
+    cprint(f"Running {len(pending)} steps, {jobs} at a time ...", level=2)
+    ok = True
+    # Every step waits on its own child process,
+    # so threads are enough to run them in parallel.
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {executor.submit(run_timed, func): name for name, func in pending}
+        for future in as_completed(futures):
+            name = futures[future]
+            error, duration = future.result()
+            if error:
+                cprint(f"Step {name} failed: {error}", level=1)
+                state.record(name, "failed", duration)
+                ok = False
+            else:
+                cprint(f"Finished {name} in {duration:.1f}s", level=2)
+                state.record(name, "done", duration)
+    if not ok:
+        cprint("Rerun installer.py to resume from the failed steps", level=1)
+    return ok
+
+
+def get_mirror_path(cache_dir: str, url: str):
+    name = re.sub(r"^\w+://", "", url.rstrip("/"))
+    name = re.sub(r"[^\w.-]+", "_", name)
+    if not name.endswith(".git"):
+        name += ".git"
+    return os.path.join(os.path.abspath(cache_dir), "git", name)
+
+
+def get_wheelhouse_path(cache_dir: str):
+    return os.path.join(os.path.abspath(cache_dir), "wheels")
+
+
+def update_mirror(url: str, mirror_path: str):
+    if os.path.exists(mirror_path):
+        # Only new objects are fetched
+        returncode = subprocess.call(
+            ["git", "-C", mirror_path, "fetch", "--prune", "--quiet"]
         )
-        cprint("Set developer_mode", level=3)
-        subprocess.call(
-            ["bench", "set-config", "-gp", "developer_mode", "1"],
-            cwd=os.getcwd() + "/" + args.bench_name,
+        if returncode != 0:
+            cprint(f"Couldn't update {url}, using cached mirror", level=3)
+    else:
+        os.makedirs(os.path.dirname(mirror_path), exist_ok=True)
+        subprocess.check_call(["git", "clone", "--mirror", "--quiet", url, mirror_path])
+
+
+def update_mirrors(args, apps: list):
+    urls = [args.frappe_repo, *(app["url"] for app in apps)]
+    cprint(f"Updating mirrors of {', '.join(urls)}", level=3)
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        futures = [
+            executor.submit(update_mirror, url, get_mirror_path(args.cache_dir, url))
+            for url in urls
+        ]
+        for future in futures:
+            future.result()
+
+
+def get_cache_env(args, apps: list):
+    """
+    Environment that makes git clone from local mirrors
+    and pip prefer wheels from the cache directory.
+    """
+    urls = [args.frappe_repo, *(app["url"] for app in apps)]
+    env = {"GIT_CONFIG_COUNT": str(len(urls))}
+    for i, url in enumerate(urls):
+        # git ignores --depth for plain local paths and copies the whole
+        # history, file:// keeps clones shallow
+        mirror_url = f"file://{get_mirror_path(args.cache_dir, url)}"
+        env[f"GIT_CONFIG_KEY_{i}"] = f"url.{mirror_url}.insteadOf"
+        env[f"GIT_CONFIG_VALUE_{i}"] = url
+    wheelhouse = get_wheelhouse_path(args.cache_dir)
+    os.makedirs(wheelhouse, exist_ok=True)
+    env["PIP_FIND_LINKS"] = wheelhouse
+    env["PIP_CACHE_DIR"] = os.path.join(os.path.abspath(args.cache_dir), "pip")
+    env["UV_CACHE_DIR"] = os.path.join(os.path.abspath(args.cache_dir), "uv")
+    env["UV_FIND_LINKS"] = wheelhouse
+    return env
+
+
+def cache_wheels(args):
+    bench_path = os.path.join(os.getcwd(), args.bench_name)
+    python = os.path.join(bench_path, "env", "bin", "python")
+    wheelhouse = get_wheelhouse_path(args.cache_dir)
+    requirements = subprocess.check_output(
+        [python, "-m", "pip", "freeze", "--exclude-editable"], encoding="utf-8"
+    )
+    requirements_path = os.path.join(bench_path, "logs", "cached-requirements.txt")
+    with open(requirements_path, "w") as f:
+        f.write(requirements)
+    returncode = subprocess.call(
+        [
+            python,
+            "-m",
+            "pip",
+            "wheel",
+            "--quiet",
+            f"--wheel-dir={wheelhouse}",
+            f"--find-links={wheelhouse}",
+            f"--requirement={requirements_path}",
+        ]
+    )
+    # Cache is an optimization, the bench works without it
+    if returncode != 0:
+        cprint("Some wheels couldn't be cached", level=3)
+
+
+def get_env(args):
+    env = os.environ.copy()
+    if args.cache_dir:
+        env.update(get_cache_env(args, read_apps_json(args.apps_json)))
+    return env
+
+
+def run_in_bench_shell(args, command: str, cwd: str):
+    # Interactive shell to have nvm and pyenv loaded
+    env = get_env(args)
+    prefix = ""
+    if args.node_version:
+        prefix = f"nvm use {args.node_version};"
+    if args.py_version:
+        env["PYENV_VERSION"] = args.py_version
+        prefix += f"PYENV_VERSION={args.py_version} "
+    subprocess.check_call(["/bin/bash", "-i", "-c", prefix + command], env=env, cwd=cwd)
+
+
+def init_bench(args):
+    init_command = "bench init "
+    init_command += "--skip-redis-config-generation "
+    init_command += "--verbose " if args.verbose else " "
+    init_command += f"--frappe-path={args.frappe_repo} "
+    init_command += f"--frappe-branch={args.frappe_branch} "
+    init_command += args.bench_name
+    run_in_bench_shell(args, init_command, cwd=os.getcwd())
+
+
+def read_apps_json(path: str):
+    with open(path) as f:
+        return json.load(f)
+
+
+def get_app_name(app: dict):
+    """Repository name, used for step names before the app is cloned."""
+    name = app["url"].rstrip("/").rsplit("/", 1)[-1]
+    return name[:-4] if name.endswith(".git") else name
+
+
+def read_app_name(app_path: str):
+    """Python package name of the app, `bench get-app` names the directory after it."""
+    patterns = (
+        ("setup.cfg", r"^name\s*=\s*(\S+)"),
+        ("setup.py", r"name\s*=\s*['\"]([^'\"]+)['\"]"),
+        ("pyproject.toml", r"^name\s*=\s*['\"]([^'\"]+)['\"]"),
+    )
+    for file_name, pattern in patterns:
+        path = os.path.join(app_path, file_name)
+        if not os.path.exists(path):
+            continue
+        with open(path) as f:
+            match = re.search(pattern, f.read(), re.MULTILINE)
+        if match:
+            return match.group(1).strip().replace("-", "_")
+    return os.path.basename(app_path)
+
+
+def find_app_path(args, app: dict):
+    """Directory of an app cloned before, found by its upstream URL."""
+    apps_path = os.path.join(os.getcwd(), args.bench_name, "apps")
+    if not os.path.isdir(apps_path):
+        return None
+    for name in sorted(os.listdir(apps_path)):
+        path = os.path.join(apps_path, name)
+        if name.startswith(".") or not os.path.isdir(os.path.join(path, ".git")):
+            continue
+        # Configured URL, `git remote get-url` would apply the mirror rewrite
+        url = subprocess.run(
+            ["git", "-C", path, "config", "--get", "remote.upstream.url"],
+            stdout=subprocess.PIPE,
+            encoding="utf-8",
+        ).stdout.strip()
+        if url.rstrip("/") == app["url"].rstrip("/"):
+            return path
+    return None
+
+
+def clone_app(args, app: dict):
+    env = get_env(args)
+    app_path = find_app_path(args, app)
+    if app_path:
+        # Shallow clones can't always be fast-forwarded, fetch only the
+        # branch and move to it
+        command = ["git", "-C", app_path, "fetch", "--quiet", "--depth=1", "upstream"]
+        command.append(app.get("branch") or "HEAD")
+        subprocess.check_call(command, env=env)
+        subprocess.check_call(
+            ["git", "-C", app_path, "reset", "--quiet", "--hard", "FETCH_HEAD"]
         )
-    except subprocess.CalledProcessError as e:
-        cprint(e.output, level=1)
+        return
+
+    apps_path = os.path.join(os.getcwd(), args.bench_name, "apps")
+    tmp_path = os.path.join(apps_path, f".clone-{get_app_name(app)}")
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    # Same as `bench get-app`
+    command = ["git", "clone", "--quiet", "--depth=1", "--origin=upstream"]
+    if app.get("branch"):
+        command.append(f"--branch={app['branch']}")
+    command += [app["url"], tmp_path]
+    subprocess.check_call(command, env=env)
+    os.rename(tmp_path, os.path.join(apps_path, read_app_name(tmp_path)))
+
+
+def get_app_names(args, apps: list):
+    names = []
+    for app in apps:
+        app_path = find_app_path(args, app)
+        names.append(os.path.basename(app_path) if app_path else get_app_name(app))
+    return names
+
+
+def install_python_deps(args, app_names: list):
+    # All apps are installed at once, so their requirements
+    # are resolved together instead of once per app.
+    bench_path = os.path.join(os.getcwd(), args.bench_name)
+    python = os.path.join(bench_path, "env", "bin", "python")
+    editables = []
+    for app_name in app_names:
+        editables += ["-e", os.path.join(bench_path, "apps", app_name)]
+    if shutil.which("uv"):
+        command = ["uv", "pip", "install", f"--python={python}", *editables]
+    else:
+        command = [python, "-m", "pip", "install", "--quiet", *editables]
+    subprocess.check_call(command, env=get_env(args), cwd=bench_path)
 
 
-def create_site_in_bench(args):
+def install_node_deps(args, app_names: list):
+    apps_path = os.path.join(os.getcwd(), args.bench_name, "apps")
+    paths = [
+        os.path.join(apps_path, app_name)
+        for app_name in app_names
+        if os.path.exists(os.path.join(apps_path, app_name, "package.json"))
+    ]
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        futures = [
+            executor.submit(
+                run_in_bench_shell, args, "yarn install --check-files", path
+            )
+            for path in paths
+        ]
+        for future in futures:
+            future.result()
+
+
+def register_apps(args, app_names: list):
+    apps_txt = os.path.join(os.getcwd(), args.bench_name, "sites", "apps.txt")
+    with open(apps_txt) as f:
+        installed = [line.strip() for line in f if line.strip()]
+    with open(apps_txt, "w") as f:
+        f.write("\n".join(dict.fromkeys(installed + app_names)))
+
+
+def build_assets(args):
+    run_in_bench_shell(
+        args, "bench build", cwd=os.path.join(os.getcwd(), args.bench_name)
+    )
+
+
+def get_bench_config(args):
+    config = {}
+    if args.db_type:
+        config["db_type"] = args.db_type
+    config["redis_cache"] = "redis://redis-cache:6379"
+    config["redis_queue"] = "redis://redis-queue:6379"
+    # redis_socketio for backward compatibility
+    config["redis_socketio"] = "redis://redis-queue:6379"
+    config["developer_mode"] = 1
+    # Should match the compose service name
+    config["db_host"] = "mariadb" if args.db_type == "mariadb" else "postgresql"
+    return config
+
+
+def import_core_module(name: str):
+    if CORE_RESOURCES_PATH not in sys.path:
+        sys.path.append(CORE_RESOURCES_PATH)
+    return importlib.import_module(name)
+
+
+def set_config(args, config: dict):
+    config_writer = import_core_module("set_config")
+
+    for key, value in config.items():
+        cprint(f"Set {key} to {value}", level=3)
+    config_path = os.path.join(
+        os.getcwd(), args.bench_name, "sites", "common_site_config.json"
+    )
+    config_writer.update_config(config_path, config.items())
+
+
+def get_new_site_cmd(args):
     if "mariadb" == args.db_type:
-        cprint("Set db_host", level=3)
-        subprocess.call(
-            ["bench", "set-config", "-g", "db_host", "mariadb"],
-            cwd=os.getcwd() + "/" + args.bench_name,
-        )
         new_site_cmd = [
             "bench",
             "new-site",
@@ -215,11 +614,6 @@ def create_site_in_bench(args):
             f"--admin-password={args.admin_password}",
         ]
     else:
-        cprint("Set db_host", level=3)
-        subprocess.call(
-            ["bench", "set-config", "-g", "db_host", "postgresql"],
-            cwd=os.getcwd() + "/" + args.bench_name,
-        )
         new_site_cmd = [
             "bench",
             "new-site",
@@ -229,16 +623,121 @@ def create_site_in_bench(args):
             f"--db-root-password=123",  # Replace with your PostgreSQL password
             f"--admin-password={args.admin_password}",
         ]
-    apps = os.listdir(f"{os.getcwd()}/{args.bench_name}/apps")
-    apps.remove("frappe")
+    apps_txt = os.path.join(os.getcwd(), args.bench_name, "sites", "apps.txt")
+    with open(apps_txt) as f:
+        apps = [line.strip() for line in f if line.strip() not in ("", "frappe")]
     for app in apps:
         new_site_cmd.append(f"--install-app={app}")
-    new_site_cmd.append(args.site_name)
-    cprint(f"Creating Site {args.site_name} ...", level=2)
-    subprocess.call(
-        new_site_cmd,
-        cwd=os.getcwd() + "/" + args.bench_name,
-    )
+    return new_site_cmd
+
+
+def create_sites(args, state: InstallerState):
+    new_site_cmd = get_new_site_cmd(args)
+    site_names = get_site_names(args)
+    if args.from_template:
+        return clone_sites(args, state, new_site_cmd, site_names)
+    os.makedirs(os.path.join(state.bench_path, "logs"), exist_ok=True)
+    if len(site_names) == 1:
+        return run_step(
+            state,
+            f"new-site:{site_names[0]}",
+            partial(create_site, new_site_cmd, site_names[0], state.bench_path),
+        )
+
+    steps = [
+        (
+            f"new-site:{site_name}",
+            partial(create_site, new_site_cmd, site_name, state.bench_path),
+        )
+        for site_name in site_names
+    ]
+    return run_steps_in_parallel(state, steps, args.jobs)
+
+
+def get_template_site_name(args, bench_path: str):
+    # Template is rebuilt when any app is updated
+    apps_path = os.path.join(bench_path, "apps")
+    key = [args.db_type]
+    for app in sorted(os.listdir(apps_path)):
+        key.append(
+            subprocess.check_output(
+                ["git", "-C", os.path.join(apps_path, app), "rev-parse", "HEAD"],
+                encoding="utf-8",
+            ).strip()
+        )
+    digest = hashlib.sha256(" ".join(key).encode()).hexdigest()[:10]
+    return f"template-{digest}.localhost"
+
+
+def clone_sites(args, state: InstallerState, new_site_cmd: list, site_names: list):
+    os.makedirs(os.path.join(state.bench_path, "logs"), exist_ok=True)
+    template = get_template_site_name(args, state.bench_path)
+    if not run_step(
+        state,
+        f"template-site:{template}",
+        partial(create_site, new_site_cmd, template, state.bench_path),
+    ):
+        return False
+
+    cloner = import_core_module("clone_site")
+    steps = [
+        (
+            f"new-site:{site_name}",
+            partial(
+                cloner.clone_site,
+                state.bench_path,
+                template,
+                site_name,
+                args.admin_password,
+                # Same credentials as get_new_site_cmd
+                "root",
+                "123",
+            ),
+        )
+        for site_name in site_names
+    ]
+    return run_steps_in_parallel(state, steps, args.jobs)
+
+
+def get_site_names(args):
+    site_names = list(args.site_name or [])
+    if args.sites_file:
+        with open(args.sites_file) as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    site_names.append(line)
+    if not site_names:
+        site_names.append("development.localhost")
+    # Drop duplicates, keep order
+    return list(dict.fromkeys(site_names))
+
+
+def create_site(new_site_cmd: list, site_name: str, bench_path: str):
+    log_path = os.path.join(bench_path, "logs", f"new-site-{site_name}.log")
+    cmd = new_site_cmd + [site_name]
+    if os.path.exists(os.path.join(bench_path, "sites", site_name)):
+        # Left over by a failed attempt, recreate its database and config
+        cprint(f"Recreating {site_name} left over by a failed run", level=3)
+        cmd.append("--force")
+    with open(log_path, "w") as log:
+        returncode = subprocess.call(
+            cmd,
+            cwd=bench_path,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+        )
+    if returncode != 0:
+        cprint(f"Failed to create {site_name}, see {log_path}", level=1)
+        raise subprocess.CalledProcessError(returncode, cmd)
+
+
+def print_summary(state: InstallerState, total: float):
+    cprint("Summary:", level=2)
+    for name, status, duration in state.results:
+        level = {"done": 2, "skipped": 3}.get(status, 1)
+        cprint(f"{name:<48} {status:<8} {duration:>8.1f}s", level=level)
+    cprint(f"Total wall-clock time: {total:.1f}s", level=2)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Back up sites into a restic repository, several at a time.
+
+`bench --site all backup` dumps one site after the other into files under
+`sites/` that restic then reads again. Here every database dump is streamed
+through gzip straight into `restic backup --stdin`, nothing is written to
+disk. Site config, and with --with-files the public and private files, are
+backed up from the sites directory. A failing site doesn't stop the others.
+
+Configure the repository with the usual restic variables (RESTIC_REPOSITORY,
+RESTIC_PASSWORD, AWS_ACCESS_KEY_ID, ...), e.g.:
+
+    backup_sites.py --jobs 8 --with-files
+
+Snapshots are tagged with the site name and `database` or `files`, the dump
+is stored as `/<site>.sql.gz`.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import ExitStack, suppress
+from dataclasses import dataclass
+from typing import Any, Optional, Sequence
+
+from clone_site import Database, read_json
+
+BENCH_PATH = "/home/frappe/frappe-bench"
+# Paths in the site directory backed up as files
+CONFIG_FILES = ("site_config.json",)
+FILES_PATHS = ("public/files", "private/files")
+
+Command = tuple[Sequence[str], Optional[dict[str, str]]]
+
+
+class PipelineError(Exception):
+    def __init__(self, cmd: Sequence[str], returncode: int, stderr: str, output: str):
+        self.cmd = cmd
+        self.returncode = returncode
+        self.stderr = stderr
+        # Stdout of the last command
+        self.output = output
+        super().__init__(
+            f"{cmd[0]} exited with code {returncode}: {stderr.strip()[-500:]}"
+        )
+
+
+def run_pipeline(commands: Sequence[Command], cwd: Optional[str] = None) -> str:
+    """
+    Run `commands` piped into each other and return stdout of the last one.
+
+    All commands are waited for. If any of them fails, PipelineError is raised
+    for the first one, with its stderr and stdout of the last command.
+    """
+    processes: list[subprocess.Popen] = []
+    with ExitStack() as stack:
+        stderrs = [stack.enter_context(tempfile.TemporaryFile()) for _ in commands]
+        try:
+            stdin = None
+            for (cmd, env), stderr in zip(commands, stderrs):
+                process = subprocess.Popen(
+                    cmd,
+                    stdin=stdin,
+                    stdout=subprocess.PIPE,
+                    stderr=stderr,
+                    env=env,
+                    cwd=cwd,
+                )
+                # Next process owns the pipe, previous one gets SIGPIPE
+                # if it fails
+                if stdin is not None:
+                    stdin.close()
+                stdin = process.stdout
+                processes.append(process)
+            output = processes[-1].communicate()[0]
+        except BaseException:
+            for process in processes:
+                process.kill()
+            raise
+        finally:
+            for process in processes:
+                process.wait()
+
+        for (cmd, _), process, stderr in zip(commands, processes, stderrs):
+            if process.returncode != 0:
+                stderr.seek(0)
+                raise PipelineError(
+                    cmd, process.returncode, stderr.read().decode(), output.decode()
+                )
+        return output.decode()
+
+
+def restic_summary(output: str) -> dict[str, Any]:
+    # Last line of `restic backup --json`
+    for line in reversed(output.splitlines()):
+        message = json.loads(line)
+        if message.get("message_type") == "summary":
+            return message
+    raise ValueError(f"No summary in restic output: {output[-500:]}")
+
+
+@dataclass
+class SiteBackup:
+    site: str
+    duration: float = 0
+    # Bytes of the compressed dump and of site files read by restic
+    database_size: int = 0
+    files_size: int = 0
+    # Bytes restic stored after deduplication
+    added: int = 0
+    error: Optional[str] = None
+
+
+class SiteBackupRunner:
+    def __init__(
+        self, bench_path: str, restic: str, with_files: bool, tags: Sequence[str]
+    ):
+        self.sites_path = os.path.join(bench_path, "sites")
+        self.restic = restic
+        self.with_files = with_files
+        self.tags = tags
+        self.common_config = read_json(
+            os.path.join(self.sites_path, "common_site_config.json")
+        )
+
+    def get_sites(self) -> list[str]:
+        return sorted(
+            name
+            for name in os.listdir(self.sites_path)
+            if os.path.isfile(os.path.join(self.sites_path, name, "site_config.json"))
+        )
+
+    def restic_backup(self, site: str, kind: str, *args: str) -> list[str]:
+        cmd = [self.restic, "backup", "--json", "--quiet", "--tag", site]
+        cmd += ["--tag", kind]
+        for tag in self.tags:
+            cmd += ["--tag", tag]
+        return cmd + list(args)
+
+    def backup_database(self, site: str, config: dict[str, Any]) -> dict[str, Any]:
+        # Site's own credentials, root credentials aren't needed to dump it
+        db = Database(config, config["db_name"], config["db_password"])
+        dump_cmd, dump_env = db.dump(config["db_name"])
+        restic_cmd = self.restic_backup(
+            site, "database", "--stdin", "--stdin-filename", f"{site}.sql.gz"
+        )
+        try:
+            output = run_pipeline(
+                (
+                    (dump_cmd, dump_env),
+                    # --rsyncable keeps unchanged parts of the dump
+                    # deduplicated by restic between backups
+                    (("gzip", "--fast", "--rsyncable"), None),
+                    (restic_cmd, None),
+                )
+            )
+        except PipelineError as exc:
+            if exc.cmd != restic_cmd:
+                # restic stored the truncated dump as a snapshot, there's
+                # no summary if restic failed too
+                with suppress(ValueError, KeyError):
+                    snapshot_id = restic_summary(exc.output)["snapshot_id"]
+                    subprocess.check_call((self.restic, "forget", snapshot_id))
+            raise
+        return restic_summary(output)
+
+    def backup_files(self, site: str) -> dict[str, Any]:
+        paths = list(CONFIG_FILES)
+        if self.with_files:
+            paths += FILES_PATHS
+        paths = [
+            os.path.join(site, path)
+            for path in paths
+            if os.path.exists(os.path.join(self.sites_path, site, path))
+        ]
+        cmd = self.restic_backup(site, "files", *paths)
+        return restic_summary(run_pipeline(((cmd, None),), cwd=self.sites_path))
+
+    def backup_site(self, site: str) -> SiteBackup:
+        result = SiteBackup(site)
+        start = time.monotonic()
+        try:
+            config = {
+                **self.common_config,
+                **read_json(os.path.join(self.sites_path, site, "site_config.json")),
+            }
+            database = self.backup_database(site, config)
+            files = self.backup_files(site)
+        except (PipelineError, OSError, KeyError, ValueError) as exc:
+            result.error = str(exc)
+        else:
+            result.database_size = database["total_bytes_processed"]
+            result.files_size = files["total_bytes_processed"]
+            result.added = database["data_added"] + files["data_added"]
+        result.duration = time.monotonic() - start
+        return result
+
+
+def format_size(size: float) -> str:
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if size < 1024:
+            break
+        size /= 1024
+    return f"{size:.1f} {unit}"
+
+
+def format_results(results: list[SiteBackup]) -> str:
+    lines = [f"{'site':<40} {'time':>8} {'database':>11} {'files':>11} {'added':>11}"]
+    for r in sorted(results, key=lambda r: r.site):
+        if r.error:
+            lines.append(f"{r.site:<40} {r.duration:>7.1f}s failed: {r.error}")
+            continue
+        lines.append(
+            f"{r.site:<40} {r.duration:>7.1f}s {format_size(r.database_size):>11} "
+            f"{format_size(r.files_size):>11} {format_size(r.added):>11}"
+        )
+    return "\n".join(lines)
+
+
+def main(_args: list[str]) -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--site",
+        action="append",
+        dest="sites",
+        help="Site to back up, can be repeated, default: all sites",
+    )
+    parser.add_argument(
+        "--bench-path", default=BENCH_PATH, help=f"default: {BENCH_PATH}"
+    )
+    parser.add_argument(
+        "--jobs", type=int, default=4, help="Sites backed up at the same time"
+    )
+    parser.add_argument(
+        "--with-files", action="store_true", help="Back up public and private files"
+    )
+    parser.add_argument(
+        "--tag", action="append", default=[], help="Extra restic tag for snapshots"
+    )
+    parser.add_argument(
+        "--init", action="store_true", help="Initialize the repository if missing"
+    )
+    parser.add_argument("--restic", default="restic", help="restic binary")
+    parser.add_argument("--output", help="Write JSON results to this file")
+    args = parser.parse_args(_args)
+
+    runner = SiteBackupRunner(args.bench_path, args.restic, args.with_files, args.tag)
+    if args.init:
+        exists = subprocess.run(
+            (args.restic, "cat", "config"), stdout=subprocess.DEVNULL
+        )
+        if exists.returncode != 0:
+            subprocess.check_call((args.restic, "init"))
+
+    start = time.monotonic()
+    results = []
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        futures = [
+            executor.submit(runner.backup_site, site)
+            for site in args.sites or runner.get_sites()
+        ]
+        for future in as_completed(futures):
+            result = future.result()
+            status = f"failed: {result.error}" if result.error else "done"
+            print(f"{result.site}: {status} in {result.duration:.1f}s", flush=True)
+            results.append(result)
+
+    print(format_results(results))
+    failed = sum(1 for r in results if r.error)
+    print(
+        f"Backed up {len(results) - failed} of {len(results)} sites "
+        f"in {time.monotonic() - start:.1f}s"
+    )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump([r.__dict__ for r in results], f, indent=2)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Wait until services from common_site_config.json are ready to serve requests.
+
+Every dependency is probed concurrently on protocol level: database servers
+have to complete the MySQL/PostgreSQL handshake and Redis has to answer PING
+and report that it has finished loading its dataset. An open port alone is not
+enough.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import random
+import struct
+import sys
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Awaitable, Callable, Iterable, Optional
+from urllib.parse import urlparse
+
+Probe = Callable[["Dependency"], Awaitable[None]]
+
+CONFIG_PATH = "/home/frappe/frappe-bench/sites/common_site_config.json"
+POSTGRES_PORT = 5432
+# https://www.postgresql.org/docs/current/errcodes-appendix.html
+POSTGRES_NOT_READY_CODES = ("57P03",)  # cannot_connect_now
+
+
+class NotReady(Exception):
+    pass
+
+
+@dataclass
+class Dependency:
+    name: str
+    protocol: str
+    host: str
+    port: int
+    username: Optional[str] = None
+    password: Optional[str] = field(default=None, repr=False)
+
+
+@dataclass
+class Result:
+    name: str
+    protocol: str
+    address: str
+    ready: bool = False
+    attempts: int = 0
+    time_to_ready: Optional[float] = None
+    error: Optional[str] = None
+
+
+async def read_mysql_greeting(dep: Dependency) -> None:
+    reader, writer = await asyncio.open_connection(dep.host, dep.port)
+    try:
+        header = await reader.readexactly(4)
+        length = int.from_bytes(header[:3], "little")
+        payload = await reader.readexactly(length)
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+    # Initial handshake packet starts with protocol version 10,
+    # error packet starts with 0xff followed by error code and message.
+    if not payload:
+        raise NotReady("Empty MySQL greeting")
+    if payload[0] == 0xFF:
+        code = int.from_bytes(payload[1:3], "little")
+        message = payload[3:].decode(errors="replace").lstrip("#")
+        raise NotReady(f"MySQL error {code}: {message}")
+    if payload[0] != 10:
+        raise NotReady(f"Unexpected MySQL protocol version {payload[0]}")
+
+
+def _postgres_startup_message(user: str) -> bytes:
+    params = b"user\0" + user.encode() + b"\0database\0postgres\0\0"
+    # Protocol version 3.0
+    body = struct.pack("!I", 196608) + params
+    return struct.pack("!I", len(body) + 4) + body
+
+
+def _parse_postgres_error(payload: bytes) -> dict[str, str]:
+    fields: dict[str, str] = {}
+    for item in payload.split(b"\0"):
+        if item:
+            fields[chr(item[0])] = item[1:].decode(errors="replace")
+    return fields
+
+
+async def read_postgres_auth_request(dep: Dependency) -> None:
+    reader, writer = await asyncio.open_connection(dep.host, dep.port)
+    try:
+        writer.write(_postgres_startup_message(dep.username or "postgres"))
+        await writer.drain()
+        kind = await reader.readexactly(1)
+        (length,) = struct.unpack("!I", await reader.readexactly(4))
+        payload = await reader.readexactly(length - 4)
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+    if kind == b"R":
+        # Server asks for authentication, so it accepts connections.
+        return
+    if kind == b"E":
+        error = _parse_postgres_error(payload)
+        if error.get("C") in POSTGRES_NOT_READY_CODES:
+            raise NotReady(f"PostgreSQL: {error.get('M')}")
+        # Any other error (wrong user, missing database) is reported by
+        # a server that is up and running.
+        return
+    raise NotReady(f"Unexpected PostgreSQL message {kind!r}")
+
+
+def _redis_command(*args: str) -> bytes:
+    parts = [f"*{len(args)}\r\n".encode()]
+    for arg in args:
+        encoded = arg.encode()
+        parts.append(b"$%d\r\n%s\r\n" % (len(encoded), encoded))
+    return b"".join(parts)
+
+
+async def _redis_reply(reader: asyncio.StreamReader) -> str:
+    line = (await reader.readline()).rstrip(b"\r\n")
+    if not line:
+        raise ConnectionError("Connection closed by Redis")
+    kind, rest = line[:1], line[1:].decode(errors="replace")
+    if kind == b"-":
+        raise NotReady(f"Redis: {rest}")
+    if kind == b"$":
+        data = await reader.readexactly(int(rest) + 2)
+        return data[:-2].decode(errors="replace")
+    return rest
+
+
+async def read_redis_ping(dep: Dependency) -> None:
+    reader, writer = await asyncio.open_connection(dep.host, dep.port)
+    try:
+        if dep.password:
+            auth = (dep.username, dep.password) if dep.username else (dep.password,)
+            writer.write(_redis_command("AUTH", *auth))
+            await writer.drain()
+            await _redis_reply(reader)
+
+        writer.write(_redis_command("PING"))
+        await writer.drain()
+        if await _redis_reply(reader) != "PONG":
+            raise NotReady("Redis didn't reply to PING")
+
+        writer.write(_redis_command("INFO", "persistence"))
+        await writer.drain()
+        info = await _redis_reply(reader)
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+    if "loading:1" in info.split():
+        raise NotReady("Redis is loading the dataset in memory")
+
+
+PROBES: dict[str, Probe] = {
+    "mysql": read_mysql_greeting,
+    "postgres": read_postgres_auth_request,
+    "redis": read_redis_ping,
+}
+
+
+def get_redis_dependency(name: str, url: str) -> Dependency:
+    if "://" not in url:
+        url = f"redis://{url}"
+    parsed = urlparse(url)
+    assert parsed.hostname, f"Can't parse Redis address from {url}"
+    return Dependency(
+        name=name,
+        protocol="redis",
+        host=parsed.hostname,
+        port=parsed.port or 6379,
+        username=parsed.username or None,
+        password=parsed.password,
+    )
+
+
+def get_db_dependency(config: dict[str, Any]) -> Dependency:
+    port = int(config.get("db_port") or 3306)
+    db_type = config.get("db_type")
+    if not db_type:
+        db_type = "postgres" if port == POSTGRES_PORT else "mariadb"
+    return Dependency(
+        name="db",
+        protocol="postgres" if db_type == "postgres" else "mysql",
+        host=config["db_host"],
+        port=port,
+        username=config.get("root_login"),
+    )
+
+
+def get_dependencies(config: dict[str, Any]) -> Iterable[Dependency]:
+    yield get_db_dependency(config)
+    for key in ("redis_cache", "redis_queue"):
+        yield get_redis_dependency(key, config[key])
+
+
+def get_backoff(attempt: int, base: float, cap: float) -> float:
+    # Exponential backoff with "full jitter"
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+async def wait_for_dependency(
+    dep: Dependency, result: Result, base_delay: float, max_delay: float
+) -> None:
+    probe = PROBES[dep.protocol]
+    start = time.monotonic()
+    while True:
+        result.attempts += 1
+        try:
+            await probe(dep)
+        except (NotReady, OSError, EOFError, ValueError) as exc:
+            result.error = str(exc) or exc.__class__.__name__
+        else:
+            result.ready = True
+            result.error = None
+            result.time_to_ready = round(time.monotonic() - start, 3)
+            return
+        await asyncio.sleep(get_backoff(result.attempts - 1, base_delay, max_delay))
+
+
+async def probe_dependency(
+    dep: Dependency, timeout: float, base_delay: float, max_delay: float
+) -> Result:
+    result = Result(
+        name=dep.name, protocol=dep.protocol, address=f"{dep.host}:{dep.port}"
+    )
+    try:
+        await asyncio.wait_for(
+            wait_for_dependency(dep, result, base_delay, max_delay), timeout=timeout
+        )
+    except asyncio.TimeoutError:
+        result.error = f"Not ready after {timeout}s: {result.error}"
+    return result
+
+
+async def async_main(
+    dependencies: Iterable[Dependency],
+    timeout: float,
+    base_delay: float = 0.05,
+    max_delay: float = 2,
+) -> list[Result]:
+    tasks = [
+        probe_dependency(dep, timeout, base_delay, max_delay) for dep in dependencies
+    ]
+    return await asyncio.gather(*tasks)
+
+
+def get_report(results: list[Result]) -> dict[str, Any]:
+    return {
+        "ready": all(r.ready for r in results),
+        "dependencies": [asdict(r) for r in results],
+    }
+
+
+def main(_args: list[str]) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--config", default=CONFIG_PATH)
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=30,
+        help="Seconds to wait for each dependency, default: 30",
+    )
+    parser.add_argument("--report", help="Also write JSON report to this file")
+    args = parser.parse_args(_args)
+
+    with open(args.config) as f:
+        config = json.load(f)
+
+    results = asyncio.run(async_main(get_dependencies(config), timeout=args.timeout))
+    report = get_report(results)
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.report:
+        with open(args.report, "w") as f:
+            f.write(output)
+    return 0 if report["ready"] else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
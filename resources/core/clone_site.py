@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Create sites as copies of a template site.
+
+`bench new-site` installs every app and runs all patches and fixtures, which
+takes minutes for ERPNext. Cloning streams the database dump of an already
+installed template site into a new database and copies its files instead.
+Only site specific values are rewritten: database name and password,
+encryption key and Administrator password.
+
+Create the template once per image version, e.g.:
+
+    bench new-site --install-app=erpnext template.localhost
+    clone_site.py template.localhost tenant1.localhost tenant2.localhost
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import hashlib
+import json
+import os
+import secrets
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Optional
+
+from set_config import write_config
+
+BENCH_PATH = "/home/frappe/frappe-bench"
+# Not copied from the template, site_config.json is written separately
+IGNORED_FILES = ("site_config.json", "locks", "logs", "backups")
+
+
+def read_json(path: str) -> dict[str, Any]:
+    with open(path) as f:
+        return json.load(f)
+
+
+def get_db_name(site_name: str) -> str:
+    # Same as frappe.installer.make_site_config
+    return "_" + hashlib.sha1(site_name.encode()).hexdigest()[:16]
+
+
+def get_encryption_key() -> str:
+    # Same format as Fernet.generate_key()
+    return base64.urlsafe_b64encode(os.urandom(32)).decode()
+
+
+def which(*names: str) -> str:
+    for name in names:
+        path = shutil.which(name)
+        if path:
+            return path
+    raise FileNotFoundError(f"None of {', '.join(names)} found")
+
+
+class Database:
+    """Client commands of the database server sites are on."""
+
+    def __init__(self, config: dict[str, Any], root_login: str, root_password: str):
+        self.db_type = config.get("db_type", "mariadb")
+        self.host = config.get("db_host", "localhost")
+        self.port = str(config.get("db_port") or "")
+        self.root_login = root_login
+        self.root_password = root_password
+
+    def client(self, user: str, password: str, database: Optional[str] = None):
+        env = os.environ.copy()
+        if self.db_type == "postgres":
+            env["PGPASSWORD"] = password
+            cmd = [which("psql"), "-q", "-v", "ON_ERROR_STOP=1", "-h", self.host]
+            cmd += ["-U", user, "-d", database or "postgres"]
+            if self.port:
+                cmd += ["-p", self.port]
+        else:
+            env["MYSQL_PWD"] = password
+            cmd = [which("mariadb", "mysql"), "-h", self.host, "-u", user]
+            if self.port:
+                cmd += ["-P", self.port]
+            if database:
+                cmd.append(database)
+        return cmd, env
+
+    def dump(self, database: str):
+        env = os.environ.copy()
+        if self.db_type == "postgres":
+            env["PGPASSWORD"] = self.root_password
+            cmd = [which("pg_dump"), "--no-owner", "--no-privileges"]
+            cmd += ["-h", self.host, "-U", self.root_login]
+            if self.port:
+                cmd += ["-p", self.port]
+        else:
+            env["MYSQL_PWD"] = self.root_password
+            cmd = [which("mariadb-dump", "mysqldump"), "--single-transaction"]
+            cmd += ["--quick", "--routines", "-h", self.host, "-u", self.root_login]
+            if self.port:
+                cmd += ["-P", self.port]
+        return cmd + [database], env
+
+    def execute(self, sql: str, database: Optional[str] = None) -> None:
+        cmd, env = self.client(self.root_login, self.root_password, database)
+        subprocess.run(cmd, input=sql, env=env, text=True, check=True)
+
+    def create(self, db_name: str, db_password: str) -> None:
+        # Database name is derived from the site name, leftovers can only
+        # come from a failed clone of the same site.
+        if self.db_type == "postgres":
+            self.execute(f'DROP DATABASE IF EXISTS "{db_name}"')
+            self.execute(f'DROP USER IF EXISTS "{db_name}"')
+            self.execute(f"CREATE USER \"{db_name}\" WITH PASSWORD '{db_password}'")
+            self.execute(f'CREATE DATABASE "{db_name}" OWNER "{db_name}"')
+        else:
+            self.execute(
+                f"DROP DATABASE IF EXISTS `{db_name}`;\n"
+                f"DROP USER IF EXISTS '{db_name}'@'%';\n"
+                f"CREATE DATABASE `{db_name}` CHARACTER SET utf8mb4 "
+                "COLLATE utf8mb4_unicode_ci;\n"
+                f"CREATE USER '{db_name}'@'%' IDENTIFIED BY '{db_password}';\n"
+                f"GRANT ALL PRIVILEGES ON `{db_name}`.* TO '{db_name}'@'%';\n"
+                "FLUSH PRIVILEGES;\n"
+            )
+
+    def copy(self, source: str, db_name: str, db_password: str) -> None:
+        """Stream dump of `source` into `db_name` without temporary files."""
+        dump_cmd, dump_env = self.dump(source)
+        # Restore as the site user on PostgreSQL, so it owns the tables
+        if self.db_type == "postgres":
+            restore_cmd, restore_env = self.client(db_name, db_password, db_name)
+        else:
+            restore_cmd, restore_env = self.client(
+                self.root_login, self.root_password, db_name
+            )
+
+        dump = subprocess.Popen(dump_cmd, stdout=subprocess.PIPE, env=dump_env)
+        assert dump.stdout
+        try:
+            restore = subprocess.Popen(restore_cmd, stdin=dump.stdout, env=restore_env)
+            # Restore gets the pipe, dump gets SIGPIPE if restore fails
+            dump.stdout.close()
+            restore.wait()
+        finally:
+            dump.wait()
+        if dump.returncode != 0:
+            raise subprocess.CalledProcessError(dump.returncode, dump_cmd)
+        if restore.returncode != 0:
+            raise subprocess.CalledProcessError(restore.returncode, restore_cmd)
+
+    def reset_secrets(self, db_name: str) -> None:
+        # Encrypted passwords can't be decrypted with the new encryption key
+        # and sessions of the template must not be valid on the new site.
+        q = '"' if self.db_type == "postgres" else "`"
+        self.execute(
+            f"DELETE FROM {q}__Auth{q} WHERE encrypted = 1;\n"
+            f"DELETE FROM {q}tabSessions{q};\n",
+            db_name,
+        )
+
+
+def clone_site(
+    bench_path: str,
+    template: str,
+    site_name: str,
+    admin_password: str,
+    root_login: Optional[str] = None,
+    root_password: Optional[str] = None,
+) -> None:
+    sites_path = os.path.join(bench_path, "sites")
+    template_path = os.path.join(sites_path, template)
+    site_path = os.path.join(sites_path, site_name)
+    if os.path.exists(site_path):
+        raise FileExistsError(f"Site {site_name} already exists")
+
+    common_config = read_json(os.path.join(sites_path, "common_site_config.json"))
+    template_config = read_json(os.path.join(template_path, "site_config.json"))
+    config = {**common_config, **template_config}
+    db = Database(
+        config,
+        root_login or config.get("root_login") or "root",
+        root_password or config.get("root_password") or "",
+    )
+
+    db_name = get_db_name(site_name)
+    db_password = secrets.token_hex(8)
+    start = time.monotonic()
+    db.create(db_name, db_password)
+    db.copy(template_config["db_name"], db_name, db_password)
+    db.reset_secrets(db_name)
+    print(f"{site_name}: copied database in {time.monotonic() - start:.1f}s")
+
+    try:
+        shutil.copytree(
+            template_path, site_path, ignore=shutil.ignore_patterns(*IGNORED_FILES)
+        )
+        write_config(
+            os.path.join(site_path, "site_config.json"),
+            {
+                **template_config,
+                "db_name": db_name,
+                "db_password": db_password,
+                "encryption_key": get_encryption_key(),
+            },
+        )
+        subprocess.check_call(
+            ("bench", "--site", site_name, "set-admin-password", admin_password),
+            cwd=bench_path,
+        )
+    except BaseException:
+        # Leave no half configured site behind, database is dropped
+        # and recreated on the next attempt.
+        shutil.rmtree(site_path, ignore_errors=True)
+        raise
+    print(f"{site_name}: cloned from {template} in {time.monotonic() - start:.1f}s")
+
+
+def main(_args: list[str]) -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("template", help="Installed site to copy")
+    parser.add_argument("site_names", nargs="+", metavar="site-name")
+    parser.add_argument(
+        "--bench-path", default=BENCH_PATH, help=f"default: {BENCH_PATH}"
+    )
+    parser.add_argument("--admin-password", required=True)
+    parser.add_argument(
+        "--db-root-username", help="default: root_login from common_site_config.json"
+    )
+    parser.add_argument(
+        "--db-root-password",
+        help="default: root_password from common_site_config.json",
+    )
+    parser.add_argument(
+        "--jobs", type=int, default=4, help="Sites cloned at the same time, default: 4"
+    )
+    args = parser.parse_args(_args)
+
+    def clone(site_name: str) -> Optional[Exception]:
+        try:
+            clone_site(
+                args.bench_path,
+                args.template,
+                site_name,
+                args.admin_password,
+                args.db_root_username,
+                args.db_root_password,
+            )
+        except (subprocess.CalledProcessError, OSError, KeyError) as exc:
+            print(f"{site_name}: failed: {exc}", file=sys.stderr)
+            return exc
+        return None
+
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        errors = list(executor.map(clone, args.site_names))
+    return 1 if any(errors) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
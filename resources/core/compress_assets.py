@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Precompress built assets for nginx gzip_static and record their hashes.
+
+Writes a `.gz` sibling, and a `.br` sibling when a Brotli encoder is
+available (`brotli` Python module or CLI), next to every compressible asset.
+The frontend then sends those files as they are instead of compressing
+bundles on every request. Files are compressed in parallel.
+
+The manifest in the assets directory has the content hash of every asset and
+marks bundles with a content hash in their name, which the frontend serves as
+immutable. Running it again after `bench build` only compresses changed files
+and removes siblings of deleted ones:
+
+    compress_assets.py /home/frappe/frappe-bench/assets
+
+--verify checks that assets still match the manifest, --previous that no
+hashed bundle name of an older build got different content:
+
+    compress_assets.py --verify --previous old-manifest.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Iterator, Optional
+
+try:
+    import brotli  # type: ignore[import-not-found]
+except ImportError:
+    brotli = None
+
+ASSETS_PATH = "/home/frappe/frappe-bench/assets"
+MANIFEST_NAME = ".asset-manifest.json"
+# Bundle names from `bench build` end with a hash of their content, e.g.
+# desk.bundle.F3XJ2DJN.js. Same pattern as /assets in nginx-template.conf.
+HASHED_NAME = re.compile(r"\.[0-9A-Z]{8}\.(js|css)(\.map)?$")
+# Types of gzip_types in nginx-template.conf, images and fonts like woff2
+# are compressed already.
+EXTENSIONS = (
+    ".js",
+    ".mjs",
+    ".map",
+    ".css",
+    ".json",
+    ".svg",
+    ".html",
+    ".txt",
+    ".xml",
+    ".ico",
+    ".ttf",
+    ".otf",
+    ".eot",
+)
+# Same as gzip_min_length
+MIN_SIZE = 256
+# Symlinked from app public folders, not served
+SKIPPED_DIRS = ("node_modules", ".git")
+SIBLING_SUFFIXES = (".gz", ".br", ".tmp")
+
+
+def file_hash(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def get_brotli_command() -> Optional[str]:
+    return None if brotli else shutil.which("brotli")
+
+
+def find_assets(root: str) -> Iterator[str]:
+    """Yield paths relative to `root`, following app symlinks once."""
+    seen: set[str] = set()
+    for dirpath, dirnames, filenames in os.walk(root, followlinks=True):
+        real = os.path.realpath(dirpath)
+        if real in seen:
+            dirnames[:] = []
+            continue
+        seen.add(real)
+        dirnames[:] = sorted(d for d in dirnames if d not in SKIPPED_DIRS)
+        for name in sorted(filenames):
+            if name == MANIFEST_NAME or name.endswith(SIBLING_SUFFIXES):
+                continue
+            path = os.path.join(dirpath, name)
+            if os.path.isfile(path):
+                yield os.path.relpath(path, root)
+
+
+def is_compressible(path: str) -> bool:
+    return path.endswith(EXTENSIONS) and os.path.getsize(path) >= MIN_SIZE
+
+
+def write_sibling(path: str, suffix: str, data: bytes, size: int) -> bool:
+    """Write compressed `data` next to `path` unless it doesn't save anything."""
+    target = path + suffix
+    if len(data) >= size:
+        if os.path.exists(target):
+            os.remove(target)
+        return False
+    tmp = f"{target}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    # nginx sends Last-Modified of the compressed file
+    stat = os.stat(path)
+    os.utime(tmp, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    os.replace(tmp, target)
+    return True
+
+
+def process_file(path: str, brotli_command: Optional[str]) -> dict[str, Any]:
+    with open(path, "rb") as f:
+        data = f.read()
+    entry: dict[str, Any] = {
+        "hash": hashlib.sha256(data).hexdigest(),
+        "immutable": bool(HASHED_NAME.search(path)),
+    }
+    if not is_compressible(path):
+        return entry
+    # mtime=0 keeps output reproducible between builds
+    gz = gzip.compress(data, compresslevel=9, mtime=0)
+    entry["gz"] = write_sibling(path, ".gz", gz, len(data))
+    if brotli:
+        br = brotli.compress(data, quality=11)
+    elif brotli_command:
+        br = subprocess.run(
+            (brotli_command, "--best", "--stdout"),
+            input=data,
+            stdout=subprocess.PIPE,
+            check=True,
+        ).stdout
+    else:
+        return entry
+    entry["br"] = write_sibling(path, ".br", br, len(data))
+    return entry
+
+
+def is_current(path: str, entry: Optional[dict[str, Any]], with_brotli: bool) -> bool:
+    if not entry:
+        return False
+    if is_compressible(path) and (
+        "gz" not in entry or (with_brotli and "br" not in entry)
+    ):
+        return False
+    for suffix in (".gz", ".br"):
+        if entry.get(suffix[1:]) and not os.path.exists(path + suffix):
+            return False
+    return entry["hash"] == file_hash(path)
+
+
+def remove_siblings(path: str) -> None:
+    for suffix in (".gz", ".br"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def read_manifest(path: str) -> dict[str, dict[str, Any]]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def compress_assets(root: str, jobs: Optional[int] = None) -> dict[str, int]:
+    manifest_path = os.path.join(root, MANIFEST_NAME)
+    old_manifest = read_manifest(manifest_path)
+    brotli_command = get_brotli_command()
+    with_brotli = bool(brotli or brotli_command)
+
+    manifest: dict[str, dict[str, Any]] = {}
+    changed: list[str] = []
+    for name in find_assets(root):
+        entry = old_manifest.get(name)
+        if entry and is_current(os.path.join(root, name), entry, with_brotli):
+            manifest[name] = entry
+        else:
+            changed.append(name)
+
+    current = set(changed).union(manifest)
+    removed = [name for name in old_manifest if name not in current]
+    for name in removed:
+        remove_siblings(os.path.join(root, name))
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        paths = [os.path.join(root, name) for name in changed]
+        entries = executor.map(
+            process_file, paths, [brotli_command] * len(paths), chunksize=16
+        )
+        manifest.update(zip(changed, entries))
+
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    return {
+        "processed": len(changed),
+        "unchanged": len(manifest) - len(changed),
+        "removed": len(removed),
+    }
+
+
+def verify_assets(
+    root: str, previous: Optional[dict[str, dict[str, Any]]] = None
+) -> list[str]:
+    """Describe assets that don't match the manifest or `previous` manifest."""
+    manifest = read_manifest(os.path.join(root, MANIFEST_NAME))
+    if not manifest:
+        return [f"No manifest in {root}"]
+    errors = []
+    names = set(find_assets(root))
+    for name in sorted(names - set(manifest)):
+        errors.append(f"{name}: not in manifest")
+    for name, entry in sorted(manifest.items()):
+        if name not in names:
+            errors.append(f"{name}: missing")
+        elif file_hash(os.path.join(root, name)) != entry["hash"]:
+            errors.append(f"{name}: content changed after build")
+    for name, entry in sorted((previous or {}).items()):
+        current = manifest.get(name)
+        if entry.get("immutable") and current and current["hash"] != entry["hash"]:
+            errors.append(f"{name}: content changed without its hash in the name")
+    return errors
+
+
+def main(_args: list[str]) -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "path", nargs="?", default=ASSETS_PATH, help=f"default: {ASSETS_PATH}"
+    )
+    parser.add_argument(
+        "--jobs", type=int, help="Parallel compression processes, default: CPUs"
+    )
+    parser.add_argument(
+        "--verify", action="store_true", help="Check assets instead of processing"
+    )
+    parser.add_argument(
+        "--previous", help="Manifest of an older build to check hashed names against"
+    )
+    args = parser.parse_args(_args)
+
+    if args.verify or args.previous:
+        previous = read_manifest(args.previous) if args.previous else None
+        errors = verify_assets(args.path, previous)
+        for error in errors:
+            print(error, file=sys.stderr)
+        if errors:
+            return 1
+        print(f"Assets in {args.path} match the manifest")
+        return 0
+
+    if not (brotli or get_brotli_command()):
+        print("Brotli encoder not found, writing .gz files only", file=sys.stderr)
+    start = time.monotonic()
+    counts = compress_assets(args.path, args.jobs)
+    print(
+        f"Processed {counts['processed']} assets, {counts['unchanged']} "
+        f"unchanged, {counts['removed']} removed in {time.monotonic() - start:.1f}s"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
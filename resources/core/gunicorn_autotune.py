@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Pick Gunicorn worker and thread counts that fit the container limits.
+
+Reads CPU quota and memory limit of the container's cgroup, measures the RSS
+of one process with the Frappe app preloaded and prints shell variable
+assignments for start.sh. Values that are not set to `auto` are kept. The
+reasoning is logged to stderr.
+"""
+
+from __future__ import annotations
+
+import math
+import os
+import subprocess
+import sys
+from typing import Optional
+
+BENCH_PATH = "/home/frappe/frappe-bench"
+PYTHON_PATH = f"{BENCH_PATH}/env/bin/python"
+CGROUP_PATH = "/sys/fs/cgroup"
+
+# Share of the memory limit workers may use, rest is left for the master
+# process, page cache and spikes.
+MEMORY_BUDGET = 0.8
+# Workers grow after serving requests, reserve this much on top of
+# RSS measured right after import.
+WORKER_GROWTH = 1.5
+DEFAULT_THREADS = 4
+MAX_THREADS = 8
+
+
+def log(message: str) -> None:
+    print(f"[gunicorn-autotune] {message}", file=sys.stderr)
+
+
+def read_file(path: str) -> Optional[str]:
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def get_cpu_limit() -> tuple[float, str]:
+    # cgroup v2: "<quota> <period>" or "max <period>"
+    cpu_max = read_file(f"{CGROUP_PATH}/cpu.max")
+    if cpu_max:
+        quota, period = cpu_max.split()
+        if quota != "max":
+            return int(quota) / int(period), "cgroup v2 cpu.max"
+    # cgroup v1
+    quota = read_file(f"{CGROUP_PATH}/cpu/cpu.cfs_quota_us")
+    period = read_file(f"{CGROUP_PATH}/cpu/cpu.cfs_period_us")
+    if quota and period and int(quota) > 0:
+        return int(quota) / int(period), "cgroup v1 cpu.cfs_quota_us"
+    return float(len(os.sched_getaffinity(0))), "available CPUs"
+
+
+def get_memory_limit() -> tuple[int, str]:
+    memory_max = read_file(f"{CGROUP_PATH}/memory.max")
+    if memory_max and memory_max != "max":
+        return int(memory_max), "cgroup v2 memory.max"
+    limit = read_file(f"{CGROUP_PATH}/memory/memory.limit_in_bytes")
+    # Unlimited cgroup v1 reports a huge number close to 2^63
+    if limit and int(limit) < 2**60:
+        return int(limit), "cgroup v1 memory.limit_in_bytes"
+    pages = os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    return pages, "host memory"
+
+
+def measure_worker_rss() -> int:
+    """Max RSS in bytes of a process that imported the app like --preload does."""
+    code = (
+        "import resource, frappe.app; "
+        "print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)"
+    )
+    output = subprocess.check_output(
+        (PYTHON_PATH, "-c", code), cwd=f"{BENCH_PATH}/sites", encoding="utf-8"
+    )
+    # ru_maxrss is in kilobytes on Linux
+    return int(output.strip().splitlines()[-1]) * 1024
+
+
+def get_workers(cpus: float, memory: int, worker_rss: int) -> tuple[int, int, int]:
+    by_cpu = 2 * math.ceil(cpus) + 1
+    # Master process holds the preloaded app as well
+    budget = memory * MEMORY_BUDGET - worker_rss
+    by_memory = max(1, int(budget // (worker_rss * WORKER_GROWTH)))
+    return max(1, min(by_cpu, by_memory)), by_cpu, by_memory
+
+
+def get_threads(workers: int, by_cpu: int) -> int:
+    # When memory caps the number of workers, keep total concurrency
+    # closer to the CPU based target with more threads per worker.
+    target = by_cpu * DEFAULT_THREADS
+    return min(MAX_THREADS, max(DEFAULT_THREADS, math.ceil(target / workers)))
+
+
+def main() -> int:
+    workers_env = os.getenv("GUNICORN_WORKERS", "auto")
+    threads_env = os.getenv("GUNICORN_THREADS", "auto")
+
+    cpus, cpu_source = get_cpu_limit()
+    memory, memory_source = get_memory_limit()
+    log(f"CPU limit: {cpus:g} ({cpu_source})")
+    log(f"Memory limit: {memory / 2**20:.0f} MiB ({memory_source})")
+
+    try:
+        worker_rss = measure_worker_rss()
+    except (OSError, subprocess.CalledProcessError, ValueError) as exc:
+        # Fall back to a typical size of a Frappe worker
+        worker_rss = 250 * 2**20
+        log(f"Couldn't measure worker RSS ({exc}), assuming 250 MiB")
+    else:
+        log(f"Preloaded worker RSS: {worker_rss / 2**20:.0f} MiB")
+
+    workers, by_cpu, by_memory = get_workers(cpus, memory, worker_rss)
+    log(
+        f"Workers: {by_cpu} by CPU ((2 x {math.ceil(cpus)}) + 1), "
+        f"{by_memory} by memory ({MEMORY_BUDGET:.0%} of limit minus master, "
+        f"{WORKER_GROWTH}x RSS per worker)"
+    )
+    if workers_env != "auto":
+        workers = int(workers_env)
+        log(f"Keeping GUNICORN_WORKERS={workers}")
+
+    threads = get_threads(workers, by_cpu)
+    if threads_env != "auto":
+        threads = int(threads_env)
+        log(f"Keeping GUNICORN_THREADS={threads}")
+
+    log(f"Using {workers} workers and {threads} threads")
+    print(f"GUNICORN_WORKERS={workers}")
+    print(f"GUNICORN_THREADS={threads}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
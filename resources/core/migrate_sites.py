@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Migrate all sites of the bench, several at a time.
+
+`bench --site all migrate` migrates one site after the other and stops at the
+first failure. Here sites are migrated in parallel and a failing site
+doesn't stop the others. While sites fail, the result of every site is
+recorded in `sites/.migrate-state.json` together with a fingerprint of the
+installed app code, so running it again, e.g. when the migrator container is
+restarted after a failure, only migrates the sites that failed or didn't run
+yet. A new image changes the fingerprint and migrates all sites again. Once
+all sites are migrated the state is cleared, the next run migrates every
+site.
+
+Output of every migration is written to `logs/migrate/<site>.log`, the end
+of it is printed for failed sites.
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import suppress
+from dataclasses import asdict, dataclass
+from typing import Any, Iterable
+
+from set_config import write_config
+
+BENCH_PATH = "/home/frappe/frappe-bench"
+STATE_NAME = ".migrate-state.json"
+# Files of an app that change when migrations do
+FINGERPRINT_FILES = ("__init__.py", "hooks.py", "patches.txt")
+LOG_TAIL_LINES = 20
+
+
+@dataclass
+class MigrateResult:
+    site: str
+    status: str
+    duration: float = 0
+    fingerprint: str = ""
+    finished_at: float = 0
+
+
+def get_sites(sites_path: str) -> list[str]:
+    return sorted(
+        name
+        for name in os.listdir(sites_path)
+        if os.path.isfile(os.path.join(sites_path, name, "site_config.json"))
+    )
+
+
+def get_fingerprint(bench_path: str) -> str:
+    """Hash of the files that identify the installed version of every app."""
+    h = hashlib.sha256()
+    apps_path = os.path.join(bench_path, "apps")
+    for app in sorted(os.listdir(apps_path)):
+        for name in FINGERPRINT_FILES:
+            path = os.path.join(apps_path, app, app, name)
+            if not os.path.isfile(path):
+                continue
+            # Images are built from scratch, files of a new build have new
+            # mtimes even if their content didn't change
+            stat = os.stat(path)
+            h.update(f"{app}/{name}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+            with open(path, "rb") as f:
+                h.update(hashlib.sha256(f.read()).digest())
+    return h.hexdigest()[:16]
+
+
+def read_state(path: str) -> dict[str, dict[str, Any]]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def forget_sites(sites_path: str, sites: Iterable[str]) -> None:
+    """Drop sites from the state, so the next run migrates them."""
+    path = os.path.join(sites_path, STATE_NAME)
+    state = read_state(path)
+    for site in sites:
+        state.pop(site, None)
+    if state:
+        write_config(path, state)
+    else:
+        with suppress(FileNotFoundError):
+            os.remove(path)
+
+
+class MigrationRunner:
+    def __init__(self, bench_path: str, fingerprint: str):
+        self.bench_path = bench_path
+        self.sites_path = os.path.join(bench_path, "sites")
+        self.logs_path = os.path.join(bench_path, "logs", "migrate")
+        self.state_path = os.path.join(self.sites_path, STATE_NAME)
+        self.fingerprint = fingerprint
+        self.state = read_state(self.state_path)
+        self._lock = threading.Lock()
+
+    def is_migrated(self, site: str) -> bool:
+        entry = self.state.get(site) or {}
+        return (
+            entry.get("status") == "success"
+            and entry.get("fingerprint") == self.fingerprint
+        )
+
+    def record(self, result: MigrateResult) -> None:
+        # Written after every site, a killed run keeps finished sites
+        with self._lock:
+            self.state[result.site] = asdict(result)
+            write_config(self.state_path, self.state)
+
+    def migrate_site(self, site: str) -> MigrateResult:
+        os.makedirs(self.logs_path, exist_ok=True)
+        log_path = os.path.join(self.logs_path, f"{site}.log")
+        start = time.monotonic()
+        with open(log_path, "w") as log:
+            process = subprocess.run(
+                ("bench", "--site", site, "migrate"),
+                cwd=self.bench_path,
+                stdout=log,
+                stderr=subprocess.STDOUT,
+            )
+        result = MigrateResult(
+            site,
+            "success" if process.returncode == 0 else "failed",
+            time.monotonic() - start,
+            self.fingerprint,
+            time.time(),
+        )
+        self.record(result)
+        return result
+
+
+def read_tail(path: str, lines: int) -> str:
+    with open(path, errors="replace") as f:
+        return "".join(deque(f, maxlen=lines))
+
+
+def format_results(results: list[MigrateResult], skipped: list[str]) -> str:
+    lines = [f"{'site':<40} {'status':>8} {'time':>9}"]
+    # Slowest first, that's where the downtime goes
+    for r in sorted(results, key=lambda r: r.duration, reverse=True):
+        lines.append(f"{r.site:<40} {r.status:>8} {r.duration:>8.1f}s")
+    for site in skipped:
+        lines.append(f"{site:<40} {'skipped':>8}")
+    return "\n".join(lines)
+
+
+def main(_args: list[str]) -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--site",
+        action="append",
+        dest="sites",
+        help="Site to migrate, can be repeated, default: all sites",
+    )
+    parser.add_argument(
+        "--bench-path", default=BENCH_PATH, help=f"default: {BENCH_PATH}"
+    )
+    parser.add_argument(
+        "--jobs", type=int, default=4, help="Sites migrated at the same time"
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Migrate sites that were migrated with the same apps already",
+    )
+    args = parser.parse_args(_args)
+
+    runner = MigrationRunner(args.bench_path, get_fingerprint(args.bench_path))
+    sites = args.sites or get_sites(runner.sites_path)
+    if not sites:
+        print("No sites found, skipping migration")
+        return 0
+    skipped = [] if args.force else [s for s in sites if runner.is_migrated(s)]
+    pending = [s for s in sites if s not in skipped]
+    print(
+        f"Migrating {len(pending)} sites with {args.jobs} jobs, {len(skipped)} "
+        f"already migrated with apps {runner.fingerprint}",
+        flush=True,
+    )
+
+    start = time.monotonic()
+    results = []
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        futures = [executor.submit(runner.migrate_site, site) for site in pending]
+        for future in as_completed(futures):
+            result = future.result()
+            print(f"{result.site}: {result.status} in {result.duration:.1f}s")
+            if result.status != "success":
+                log_path = os.path.join(runner.logs_path, f"{result.site}.log")
+                print(read_tail(log_path, LOG_TAIL_LINES), file=sys.stderr)
+            sys.stdout.flush()
+            results.append(result)
+
+    print(format_results(results, skipped))
+    failed = [r.site for r in results if r.status != "success"]
+    print(
+        f"Migrated {len(results) - len(failed)} of {len(pending)} sites "
+        f"in {time.monotonic() - start:.1f}s"
+    )
+    if failed:
+        print(f"Failed: {', '.join(sorted(failed))}", file=sys.stderr)
+        return 1
+    # Retries are over, sites restored or created later aren't skipped
+    forget_sites(runner.sites_path, sites)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
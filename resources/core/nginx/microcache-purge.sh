@@ -0,0 +1,32 @@
+#!/bin/bash
+# Delete pages from the guest page cache of the frontend, see
+# PROXY_CACHE_VALID. Run it in the frontend container:
+#
+#   microcache-purge.sh                                  # every page
+#   microcache-purge.sh http://mysite.localhost/about    # single pages
+#
+# Pages are given by their cache key, the URL as the frontend got it: scheme
+# from X-Forwarded-Proto, site name and path with query string. nginx treats
+# deleted files as misses.
+set -e
+
+MICROCACHE_PATH=/var/lib/nginx/microcache
+
+if [[ $# -eq 0 ]]; then
+  echo "Purging microcache"
+  find "$MICROCACHE_PATH" -type f -delete
+  exit 0
+fi
+
+for key in "$@"; do
+  # Files are named by the md5 of the key, levels=1:2 of proxy_cache_path
+  # takes the directories from the end of the name
+  hash=$(printf '%s' "$key" | md5sum | cut -d ' ' -f 1)
+  path="${MICROCACHE_PATH}/${hash: -1}/${hash: -3:2}/${hash}"
+  if [[ -f "$path" ]]; then
+    rm -f "$path"
+    echo "Purged ${key}"
+  else
+    echo "Not cached: ${key}"
+  fi
+done
@@ -33,19 +33,65 @@ if [[ -z "$PROXY_READ_TIMEOUT" ]]; then
   export PROXY_READ_TIMEOUT=120
 fi
 
+if [[ -z "$UPSTREAM_KEEPALIVE" ]]; then
+  echo "UPSTREAM_KEEPALIVE defaulting to 32"
+  export UPSTREAM_KEEPALIVE=32
+fi
+
+if [[ -z "$UPSTREAM_MAX_FAILS" ]]; then
+  echo "UPSTREAM_MAX_FAILS defaulting to 3"
+  export UPSTREAM_MAX_FAILS=3
+fi
+
+if [[ -z "$UPSTREAM_FAIL_TIMEOUT" ]]; then
+  echo "UPSTREAM_FAIL_TIMEOUT defaulting to 10s"
+  export UPSTREAM_FAIL_TIMEOUT=10s
+fi
+
 if [[ -z "$CLIENT_MAX_BODY_SIZE" ]]; then
   echo "CLIENT_MAX_BODY_SIZE defaulting to 50m"
   export CLIENT_MAX_BODY_SIZE=50m
 fi
 
+# Cache guest pages for PROXY_CACHE_VALID, off by default
+if [[ -z "$PROXY_CACHE_VALID" || "$PROXY_CACHE_VALID" == "0" ]]; then
+  export MICROCACHE_LOCATION=@webserver
+  # Unused with the cache off, keeps the template valid
+  export PROXY_CACHE_VALID=1s
+else
+  echo "Caching guest pages for ${PROXY_CACHE_VALID}"
+  export MICROCACHE_LOCATION=@microcache
+fi
+
+# Render upstream servers from comma or space separated addresses. A replica
+# that fails UPSTREAM_MAX_FAILS times within UPSTREAM_FAIL_TIMEOUT gets no
+# requests for UPSTREAM_FAIL_TIMEOUT. Names that resolve to several addresses,
+# like a scaled compose service, add a server per address.
+upstream_servers() {
+  local address servers=()
+  for address in ${1//,/ }; do
+    servers+=("server ${address} max_fails=${UPSTREAM_MAX_FAILS} fail_timeout=${UPSTREAM_FAIL_TIMEOUT};")
+  done
+  # Indent continuation lines like the rest of the upstream block
+  local IFS=$'\n'
+  echo "${servers[*]}" | sed '2,$s/^/\t/'
+}
+
+BACKEND_SERVERS=$(upstream_servers "$BACKEND")
+SOCKETIO_SERVERS=$(upstream_servers "$SOCKETIO")
+export BACKEND_SERVERS SOCKETIO_SERVERS
+
 # shellcheck disable=SC2016
-envsubst '${BACKEND}
-  ${SOCKETIO}
+envsubst '${BACKEND_SERVERS}
+  ${SOCKETIO_SERVERS}
   ${UPSTREAM_REAL_IP_ADDRESS}
   ${UPSTREAM_REAL_IP_HEADER}
   ${UPSTREAM_REAL_IP_RECURSIVE}
   ${FRAPPE_SITE_NAME_HEADER}
   ${PROXY_READ_TIMEOUT}
+  ${UPSTREAM_KEEPALIVE}
+  ${MICROCACHE_LOCATION}
+  ${PROXY_CACHE_VALID}
 	${CLIENT_MAX_BODY_SIZE}' \
   </templates/nginx/frappe.conf.template >/etc/nginx/conf.d/frappe.conf
 
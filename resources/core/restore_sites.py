@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+"""
+Restore sites from a restic repository, several at a time.
+
+Every database dump is streamed from `restic dump` through gunzip straight
+into the database, nothing is restored to disk first. Public and private
+files are unpacked into the site next to it. Existing databases of restored
+sites are replaced. Two repository layouts are supported:
+
+  bench   `bench --site all backup --with-files` followed by
+          `restic backup sites`, the latest backup of every site in the
+          snapshot is restored (default)
+  sites   snapshots written by backup_sites.py, the latest database and
+          files snapshot of every site is restored
+
+Configure the repository with the usual restic variables (RESTIC_REPOSITORY,
+RESTIC_PASSWORD, AWS_ACCESS_KEY_ID, ...), e.g.:
+
+    restore_sites.py --jobs 8 --db-root-password 123
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+from backup_sites import PipelineError, run_pipeline
+from clone_site import Database, read_json
+from migrate_sites import forget_sites
+from set_config import write_config
+
+BENCH_PATH = "/home/frappe/frappe-bench"
+# <sites>/<site>/private/backups/20240101_000000-site_localhost-database.sql.gz
+BENCH_BACKUP = re.compile(
+    r"/sites/(?P<site>[^/]+)/private/backups/(?P<timestamp>\d{8}_\d{6})-[^/]+-"
+    r"(?P<kind>database\.sql\.gz|files\.tgz|files\.tar|private-files\.tgz"
+    r"|private-files\.tar|site_config_backup\.json)$"
+)
+
+
+@dataclass
+class SiteRestore:
+    """Where the backup of a site is in the repository."""
+
+    site: str
+    # (snapshot, path) of gzipped dump and site config
+    database: tuple[str, str]
+    config: tuple[str, str]
+    # (snapshot, path) of tar archives with public and private files,
+    # extracted in the site directory like `bench restore` does
+    archives: list[tuple[str, str]] = field(default_factory=list)
+    # Snapshot restored to its original location, backup_sites.py layout
+    files_snapshot: Optional[str] = None
+
+
+@dataclass
+class RestoreResult:
+    site: str
+    database_time: float = 0
+    files_time: float = 0
+    duration: float = 0
+    error: Optional[str] = None
+
+
+def restic_json(restic: str, *args: str) -> Any:
+    return json.loads(subprocess.check_output((restic, *args, "--json")))
+
+
+def restic_ls(restic: str, snapshot: str) -> list[dict[str, Any]]:
+    # Snapshot first, then one object per node, each on its own line
+    output = subprocess.check_output((restic, "ls", snapshot, "--json"), text=True)
+    return [json.loads(line) for line in output.splitlines() if line.strip()]
+
+
+def find_bench_backups(restic: str, snapshot: str) -> dict[str, SiteRestore]:
+    """Find the latest complete `bench backup` of every site in `snapshot`."""
+    backups: dict[tuple[str, str], dict[str, str]] = {}
+    snapshot_id = snapshot
+    for node in restic_ls(restic, snapshot):
+        if node.get("struct_type") == "snapshot":
+            snapshot_id = node["short_id"]
+            continue
+        match = BENCH_BACKUP.search(node.get("path", ""))
+        if match:
+            key = (match["site"], match["timestamp"])
+            backups.setdefault(key, {})[match["kind"]] = node["path"]
+
+    restores: dict[str, SiteRestore] = {}
+    for (site, _), files in sorted(backups.items()):
+        # Later timestamps replace earlier ones
+        if "database.sql.gz" not in files or "site_config_backup.json" not in files:
+            continue
+        restores[site] = SiteRestore(
+            site,
+            database=(snapshot_id, files["database.sql.gz"]),
+            config=(snapshot_id, files["site_config_backup.json"]),
+            archives=[
+                (snapshot_id, path)
+                for kind, path in sorted(files.items())
+                if kind.endswith((".tar", ".tgz"))
+            ],
+        )
+    return restores
+
+
+def find_site_snapshots(restic: str) -> dict[str, SiteRestore]:
+    """Find the latest database and files snapshot of every site."""
+    databases: dict[str, tuple[str, str]] = {}
+    configs: dict[str, tuple[str, str]] = {}
+    # Sorted by time, later snapshots replace earlier ones
+    for snapshot in restic_json(restic, "snapshots"):
+        tags = snapshot.get("tags") or []
+        if "database" in tags:
+            # Dump is stored as /<site>.sql.gz
+            path = snapshot["paths"][0]
+            site = os.path.basename(path)[: -len(".sql.gz")]
+            databases[site] = (snapshot["short_id"], path)
+        elif "files" in tags:
+            for path in snapshot["paths"]:
+                if os.path.basename(path) == "site_config.json":
+                    site = os.path.basename(os.path.dirname(path))
+                    configs[site] = (snapshot["short_id"], path)
+
+    return {
+        site: SiteRestore(
+            site,
+            database=database,
+            config=configs[site],
+            files_snapshot=configs[site][0],
+        )
+        for site, database in sorted(databases.items())
+        if site in configs
+    }
+
+
+class SiteRestoreRunner:
+    def __init__(
+        self,
+        bench_path: str,
+        restic: str,
+        root_login: Optional[str],
+        root_password: Optional[str],
+    ):
+        self.sites_path = os.path.join(bench_path, "sites")
+        self.restic = restic
+        common_config = read_json(
+            os.path.join(self.sites_path, "common_site_config.json")
+        )
+        self.common_config = common_config
+        self.root_login = root_login or common_config.get("root_login") or "root"
+        self.root_password = root_password or common_config.get("root_password") or ""
+
+    def restore_config(self, restore: SiteRestore) -> dict[str, Any]:
+        snapshot, path = restore.config
+        output = subprocess.check_output((self.restic, "dump", snapshot, path))
+        config = json.loads(output)
+        site_path = os.path.join(self.sites_path, restore.site)
+        os.makedirs(site_path, exist_ok=True)
+        write_config(os.path.join(site_path, "site_config.json"), config)
+        return config
+
+    def restore_database(self, restore: SiteRestore, config: dict[str, Any]) -> None:
+        db = Database(
+            {**self.common_config, **config}, self.root_login, self.root_password
+        )
+        db_name, db_password = config["db_name"], config["db_password"]
+        db.create(db_name, db_password)
+        # Restore as the site user on PostgreSQL, so it owns the tables
+        if db.db_type == "postgres":
+            client = db.client(db_name, db_password, db_name)
+        else:
+            client = db.client(self.root_login, self.root_password, db_name)
+        snapshot, path = restore.database
+        run_pipeline(
+            (
+                ((self.restic, "dump", snapshot, path), None),
+                (("gzip", "-dc"), None),
+                client,
+            )
+        )
+
+    def restore_files(self, restore: SiteRestore) -> None:
+        site_path = os.path.join(self.sites_path, restore.site)
+        for snapshot, path in restore.archives:
+            # Members are ./<site>/public/files/..., same as
+            # frappe.installer.extract_files
+            tar = ["tar", "-x", "--strip-components", "2"]
+            if path.endswith(".tgz"):
+                tar.append("-z")
+            run_pipeline(
+                (((self.restic, "dump", snapshot, path), None), (tar, None)),
+                cwd=site_path,
+            )
+        if restore.files_snapshot:
+            # Paths in the snapshot are absolute
+            cmd = (self.restic, "restore", restore.files_snapshot, "--target", "/")
+            subprocess.run(cmd, stdout=subprocess.DEVNULL, check=True)
+
+    def restore_site(self, restore: SiteRestore) -> RestoreResult:
+        result = RestoreResult(restore.site)
+        start = time.monotonic()
+        try:
+            config = self.restore_config(restore)
+            self.restore_database(restore, config)
+            result.database_time = time.monotonic() - start
+            print(
+                f"{restore.site}: database restored in {result.database_time:.1f}s",
+                flush=True,
+            )
+            files_start = time.monotonic()
+            self.restore_files(restore)
+            result.files_time = time.monotonic() - files_start
+        except (
+            PipelineError,
+            subprocess.CalledProcessError,
+            OSError,
+            KeyError,
+            ValueError,
+        ) as exc:
+            result.error = str(exc)
+        result.duration = time.monotonic() - start
+        return result
+
+
+def format_results(results: list[RestoreResult]) -> str:
+    lines = [f"{'site':<40} {'database':>9} {'files':>9} {'total':>9}"]
+    for r in sorted(results, key=lambda r: r.site):
+        if r.error:
+            lines.append(f"{r.site:<40} failed after {r.duration:.1f}s: {r.error}")
+            continue
+        lines.append(
+            f"{r.site:<40} {r.database_time:>8.1f}s {r.files_time:>8.1f}s "
+            f"{r.duration:>8.1f}s"
+        )
+    return "\n".join(lines)
+
+
+def main(_args: list[str]) -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--site",
+        action="append",
+        dest="sites",
+        help="Site to restore, can be repeated, default: all sites in the backup",
+    )
+    parser.add_argument(
+        "--layout", choices=("bench", "sites"), default="bench", help="default: bench"
+    )
+    parser.add_argument(
+        "--snapshot", default="latest", help="Snapshot of bench layout, default: latest"
+    )
+    parser.add_argument(
+        "--bench-path", default=BENCH_PATH, help=f"default: {BENCH_PATH}"
+    )
+    parser.add_argument(
+        "--jobs", type=int, default=4, help="Sites restored at the same time"
+    )
+    parser.add_argument(
+        "--db-root-username", help="default: root_login from common_site_config.json"
+    )
+    parser.add_argument(
+        "--db-root-password",
+        help="default: root_password from common_site_config.json",
+    )
+    parser.add_argument("--restic", default="restic", help="restic binary")
+    args = parser.parse_args(_args)
+
+    if args.layout == "bench":
+        restores = find_bench_backups(args.restic, args.snapshot)
+    else:
+        restores = find_site_snapshots(args.restic)
+    missing = set(args.sites or ()) - set(restores)
+    if missing:
+        print(f"No backup of {', '.join(sorted(missing))}", file=sys.stderr)
+        return 1
+    if args.sites:
+        restores = {site: restores[site] for site in args.sites}
+    if not restores:
+        print("No site backups found", file=sys.stderr)
+        return 1
+
+    runner = SiteRestoreRunner(
+        args.bench_path, args.restic, args.db_root_username, args.db_root_password
+    )
+    print(f"Restoring {len(restores)} sites: {', '.join(restores)}", flush=True)
+    start = time.monotonic()
+    results = []
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        futures = [
+            executor.submit(runner.restore_site, restore)
+            for restore in restores.values()
+        ]
+        for future in as_completed(futures):
+            result = future.result()
+            status = f"failed: {result.error}" if result.error else "restored"
+            print(f"{result.site}: {status} in {result.duration:.1f}s", flush=True)
+            results.append(result)
+
+    # Restored databases may be older than the apps, migrate_sites.py must
+    # not skip them as migrated
+    forget_sites(runner.sites_path, restores)
+
+    print(format_results(results))
+    failed = sum(1 for r in results if r.error)
+    print(
+        f"Restored {len(results) - failed} of {len(results)} sites "
+        f"in {time.monotonic() - start:.1f}s"
+    )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
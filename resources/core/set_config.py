@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Set many keys in common_site_config.json at once.
+
+Works like a batch of `bench set-config -g` calls in a single process: values
+passed with `-p` are parsed as Python literals (like `bench set-config -p`),
+the config is written atomically and only if something changed.
+"""
+
+from __future__ import annotations
+
+import argparse
+import ast
+import json
+import os
+import sys
+import tempfile
+from contextlib import suppress
+from typing import Any, Iterable, Tuple
+
+CONFIG_PATH = "sites/common_site_config.json"
+
+KeyValue = Tuple[str, Any]
+
+
+def parse_value(value: str) -> Any:
+    try:
+        return ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        raise ValueError(f"Can't parse value {value!r}, quote strings or drop -p")
+
+
+def read_config(path: str) -> dict[str, Any]:
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_config(path: str, config: dict[str, Any]) -> None:
+    directory = os.path.dirname(os.path.abspath(path))
+    mode = os.stat(path).st_mode & 0o777 if os.path.exists(path) else 0o644
+    # Write to temporary file in the same directory and rename it over
+    # the config so readers never see partially written file.
+    fd, tmp_path = tempfile.mkstemp(
+        prefix=".common_site_config.", suffix=".json", dir=directory
+    )
+    try:
+        with os.fdopen(fd, "w") as f:
+            # Same format as `bench set-config`
+            json.dump(config, f, indent=1, sort_keys=True)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        with suppress(FileNotFoundError):
+            os.remove(tmp_path)
+        raise
+
+
+def update_config(path: str, values: Iterable[KeyValue]) -> bool:
+    """Merge `values` into config at `path`. Return whether file was written."""
+    config = read_config(path)
+    updated = {**config, **dict(values)}
+    if updated == config:
+        return False
+    write_config(path, updated)
+    return True
+
+
+def get_values(args: argparse.Namespace) -> list[KeyValue]:
+    values: list[KeyValue] = [(key, value) for key, value in args.set]
+    for key, value in args.parse:
+        if value == "":
+            # Unset environment variable, `bench set-config -p` would fail
+            # without changing the config as well.
+            print(f"Skipping {key}: empty value")
+            continue
+        values.append((key, parse_value(value)))
+    return values
+
+
+def main(_args: list[str]) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "-c",
+        "--config",
+        default=CONFIG_PATH,
+        help=f"Path to config file, default: {CONFIG_PATH}",
+    )
+    parser.add_argument(
+        "-s",
+        "--set",
+        nargs=2,
+        action="append",
+        default=[],
+        metavar=("KEY", "VALUE"),
+        help="Set KEY to string VALUE",
+    )
+    parser.add_argument(
+        "-p",
+        "--parse",
+        nargs=2,
+        action="append",
+        default=[],
+        metavar=("KEY", "VALUE"),
+        help="Set KEY to VALUE parsed as Python literal (number, bool, list...)",
+    )
+    args = parser.parse_args(_args)
+
+    try:
+        values = get_values(args)
+    except ValueError as exc:
+        parser.error(str(exc))
+
+    if update_config(args.config, values):
+        print(f"Updated {', '.join(k for k, _ in values)} in {args.config}")
+    else:
+        print(f"{args.config} is up to date")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+Run the Frappe scheduler as one of several replicas that split the sites.
+
+`bench schedule` enqueues due scheduled jobs for every site of the bench in
+one loop, with many sites a tick takes longer than the tick interval and
+jobs run late. Every replica of this scheduler only handles the sites it
+owns on a consistent hash ring of all live replicas.
+
+Replicas announce themselves with a heartbeat in redis_queue and drop out
+of the ring when it stops. No replica coordinates the others: each builds
+the same ring from the same heartbeats, and when one comes or goes only the
+sites between it and its neighbours on the ring move. While replicas
+disagree for a tick a site may be handled twice or skipped. Frappe doesn't
+enqueue a scheduled job that's queued already and catches up on jobs that
+are due in the next tick, so neither case loses or duplicates jobs.
+
+Every tick logs its lag behind the tick schedule and how long the shard
+took. The last report of every replica is kept in Redis, see --status.
+Run it with the Python of the bench environment:
+
+    env/bin/python /usr/local/bin/sharded_scheduler.py
+"""
+
+from __future__ import annotations
+
+import argparse
+import bisect
+import hashlib
+import json
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from typing import Any, Iterable, Optional
+
+BENCH_PATH = "/home/frappe/frappe-bench"
+# Points of every replica on the ring, more spread sites more evenly
+VIRTUAL_NODES = 512
+
+
+def log(message: str) -> None:
+    print(f"[scheduler] {message}", file=sys.stderr, flush=True)
+
+
+def ring_hash(key: str) -> int:
+    return int.from_bytes(hashlib.sha1(key.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """Consistent hash ring of replica names."""
+
+    def __init__(self, replicas: Iterable[str], virtual_nodes: int = VIRTUAL_NODES):
+        points = sorted(
+            (ring_hash(f"{replica}#{i}"), replica)
+            for replica in set(replicas)
+            for i in range(virtual_nodes)
+        )
+        self.hashes = [h for h, _ in points]
+        self.replicas = [r for _, r in points]
+
+    def get_replica(self, site: str) -> str:
+        # First point clockwise of the site
+        index = bisect.bisect(self.hashes, ring_hash(site)) % len(self.hashes)
+        return self.replicas[index]
+
+    def get_shard(self, replica: str, sites: Iterable[str]) -> list[str]:
+        return [site for site in sites if self.get_replica(site) == replica]
+
+
+class Membership:
+    """Heartbeats of the replicas in a sorted set scored by time."""
+
+    def __init__(self, redis: Any, prefix: str, replica: str, ttl: float):
+        self.redis = redis
+        self.replica = replica
+        self.ttl = ttl
+        self.replicas_key = f"{prefix}:scheduler:replicas"
+        self.reports_key = f"{prefix}:scheduler:reports"
+
+    def heartbeat(self) -> None:
+        self.redis.zadd(self.replicas_key, {self.replica: time.time()})
+
+    def get_replicas(self) -> list[str]:
+        # Drop replicas that stopped without leaving
+        self.redis.zremrangebyscore(self.replicas_key, "-inf", time.time() - self.ttl)
+        return sorted(
+            r.decode() if isinstance(r, bytes) else r
+            for r in self.redis.zrange(self.replicas_key, 0, -1)
+        )
+
+    def report(self, report: dict[str, Any], replicas: list[str]) -> None:
+        self.redis.hset(self.reports_key, self.replica, json.dumps(report))
+        # Hostnames of replaced containers don't come back
+        stale = set(self.get_reports()) - set(replicas)
+        if stale:
+            self.redis.hdel(self.reports_key, *stale)
+
+    def get_reports(self) -> dict[str, dict[str, Any]]:
+        return {
+            (k.decode() if isinstance(k, bytes) else k): json.loads(v)
+            for k, v in self.redis.hgetall(self.reports_key).items()
+        }
+
+    def leave(self) -> None:
+        self.redis.zrem(self.replicas_key, self.replica)
+        self.redis.hdel(self.reports_key, self.replica)
+
+
+class ShardedScheduler:
+    def __init__(self, args: argparse.Namespace, membership: Membership):
+        self.args = args
+        self.membership = membership
+        self.stopping = threading.Event()
+
+    def get_sites(self) -> list[str]:
+        from frappe.utils import get_sites
+
+        return sorted(get_sites("."))
+
+    def tick(self, lag: float, skipped: int = 0) -> dict[str, Any]:
+        from frappe.utils.scheduler import enqueue_events_for_site
+
+        start = time.monotonic()
+        self.membership.heartbeat()
+        replicas = self.membership.get_replicas()
+        sites = self.get_sites()
+        shard = HashRing(replicas).get_shard(self.membership.replica, sites)
+        failed = []
+        for site in shard:
+            if self.stopping.is_set():
+                break
+            try:
+                enqueue_events_for_site(site)
+            except Exception as exc:
+                # A broken site doesn't hold up the others
+                log(f"{site}: {exc!r}")
+                failed.append(site)
+        report = {
+            "at": time.time(),
+            "lag": round(lag, 3),
+            # Ticks skipped before this one because the last one overran
+            "skipped": skipped,
+            "duration": round(time.monotonic() - start, 3),
+            "replicas": len(replicas),
+            "sites": len(sites),
+            "shard": len(shard),
+            "failed": failed,
+        }
+        self.membership.report(report, replicas)
+        return report
+
+    def send_heartbeats(self) -> None:
+        while not self.stopping.wait(self.args.heartbeat):
+            try:
+                self.membership.heartbeat()
+            except Exception as exc:
+                log(f"Heartbeat failed: {exc!r}")
+
+    def stop(self, *_args: Any) -> None:
+        self.stopping.set()
+
+    def run(self) -> None:
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        self.membership.heartbeat()
+        threading.Thread(target=self.send_heartbeats, daemon=True).start()
+        interval = self.args.interval
+        log(f"Replica {self.membership.replica} ticking every {interval:g}s")
+        # Ticks are scheduled at a fixed rate, lag is how late one starts
+        next_tick = time.monotonic() + interval
+        skipped = 0
+        try:
+            while not self.stopping.wait(max(next_tick - time.monotonic(), 0)):
+                lag = time.monotonic() - next_tick
+                try:
+                    report = self.tick(lag, skipped)
+                except Exception as exc:
+                    # E.g. Redis unavailable, try again next tick
+                    log(f"Tick failed: {exc!r}")
+                else:
+                    log(
+                        f"tick lag {report['lag']:.1f}s, {report['shard']} of "
+                        f"{report['sites']} sites on {report['replicas']} replicas "
+                        f"in {report['duration']:.1f}s"
+                    )
+                next_tick += interval
+                skipped = max(int((time.monotonic() - next_tick) // interval) + 1, 0)
+                if skipped:
+                    # The shard took longer than a tick, don't try to catch up
+                    log(f"Tick overran the interval, skipping {skipped} ticks")
+                    next_tick += skipped * interval
+        finally:
+            self.membership.leave()
+
+
+def get_bench_id(config: dict[str, Any], bench_path: str) -> str:
+    # Same as the queue name prefix of frappe.utils.background_jobs
+    return config.get("bench_id") or bench_path.strip("/").replace("/", "-")
+
+
+def main(_args: list[str]) -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--replica",
+        default=socket.gethostname(),
+        help="Name of this replica, default: hostname",
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        help="Seconds between ticks, default: scheduler_tick_interval or 60",
+    )
+    parser.add_argument(
+        "--heartbeat",
+        type=float,
+        default=10,
+        help="Seconds between heartbeats, default: 10",
+    )
+    parser.add_argument(
+        "--ttl",
+        type=float,
+        default=30,
+        help="Seconds without heartbeat until a replica's sites move, default: 30",
+    )
+    parser.add_argument(
+        "--once",
+        action="store_true",
+        help="Run one tick for the shard of this replica and print its report",
+    )
+    parser.add_argument(
+        "--status",
+        action="store_true",
+        help="Print live replicas, their shards and last reports",
+    )
+    parser.add_argument(
+        "--bench-path", default=BENCH_PATH, help=f"default: {BENCH_PATH}"
+    )
+    args = parser.parse_args(_args)
+
+    # Same working directory as bench commands
+    os.chdir(os.path.join(args.bench_path, "sites"))
+    import frappe
+    from frappe.utils.background_jobs import get_redis_conn
+
+    with frappe.init_site():
+        config = frappe.get_conf()
+        redis = get_redis_conn()
+    args.interval = args.interval or int(config.get("scheduler_tick_interval") or 60)
+    prefix = get_bench_id(config, args.bench_path)
+    membership = Membership(redis, prefix, args.replica, args.ttl)
+    scheduler = ShardedScheduler(args, membership)
+
+    if args.status:
+        replicas = membership.get_replicas()
+        ring: Optional[HashRing] = HashRing(replicas) if replicas else None
+        sites = scheduler.get_sites()
+        reports = membership.get_reports()
+        status = {
+            replica: {
+                "sites": ring.get_shard(replica, sites) if ring else [],
+                "report": reports.get(replica),
+            }
+            for replica in replicas
+        }
+        print(json.dumps(status, indent=2))
+        return 0
+
+    if args.once:
+        try:
+            report = scheduler.tick(0)
+        finally:
+            membership.leave()
+        print(json.dumps(report, indent=2))
+        return 1 if report["failed"] else 0
+
+    scheduler.run()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
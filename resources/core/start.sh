@@ -5,6 +5,21 @@ set -e
 GUNICORN_THREADS=${GUNICORN_THREADS:-4}
 GUNICORN_WORKERS=${GUNICORN_WORKERS:-2}
 GUNICORN_TIMEOUT=${GUNICORN_TIMEOUT:-120}
+# Longer than keepalive_timeout of nginx upstream, so idle connections are
+# closed by nginx and never reused after Gunicorn dropped them
+GUNICORN_KEEPALIVE=${GUNICORN_KEEPALIVE:-75}
+
+# Pick workers and threads that fit container CPU quota and memory limit
+if [[ "$GUNICORN_WORKERS" == "auto" || "$GUNICORN_THREADS" == "auto" ]]; then
+  # set -e doesn't stop on a failing substitution inside eval
+  if settings=$(GUNICORN_WORKERS="$GUNICORN_WORKERS" GUNICORN_THREADS="$GUNICORN_THREADS" gunicorn_autotune.py); then
+    eval "$settings"
+  else
+    echo "gunicorn_autotune.py failed, falling back to the defaults for auto values" >&2
+  fi
+  if [[ "$GUNICORN_WORKERS" == "auto" ]]; then GUNICORN_WORKERS=2; fi
+  if [[ "$GUNICORN_THREADS" == "auto" ]]; then GUNICORN_THREADS=4; fi
+fi
 
 echo "Booting Gunicorn with $GUNICORN_WORKERS workers and $GUNICORN_THREADS threads..."
 
@@ -16,5 +31,6 @@ exec /home/frappe/frappe-bench/env/bin/gunicorn \
   --worker-class=gthread \
   --worker-tmp-dir=/dev/shm \
   --timeout="$GUNICORN_TIMEOUT" \
+  --keep-alive="$GUNICORN_KEEPALIVE" \
   --preload \
   frappe.app:application
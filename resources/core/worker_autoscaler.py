@@ -0,0 +1,449 @@
+#!/usr/bin/env python3
+"""
+Run `bench worker` processes and scale them with the RQ queue backlog.
+
+Every few seconds the length of the short, default and long queues and the
+age of their oldest job are read from redis_queue. Each pool of workers is
+sized to one worker per --jobs-per-worker queued jobs, within its minimum and
+maximum, and gets another worker while its oldest job waits longer than
+--max-job-age. New workers start after --up-cooldown since the last change,
+surplus workers are drained one at a time after --down-cooldown: they get
+SIGTERM, finish their current job (RQ warm shutdown) and exit. Idle workers
+are drained first.
+
+Pools are given as name=queues:min:max, e.g.:
+
+    worker_autoscaler.py --pool long=long,default,short:1:8
+
+With --metrics-port the queue stats and scaling decisions are served in
+Prometheus text format on /metrics.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Optional
+
+from check_connections import get_redis_dependency
+
+BENCH_PATH = "/home/frappe/frappe-bench"
+CONFIG_PATH = f"{BENCH_PATH}/sites/common_site_config.json"
+QUEUE_TYPES = ("short", "default", "long")
+
+
+def log(message: str) -> None:
+    print(f"[worker-autoscaler] {message}", file=sys.stderr, flush=True)
+
+
+class RedisClient:
+    """Blocking Redis client for the few commands used here."""
+
+    def __init__(self, url: str, timeout: float = 5):
+        self.dep = get_redis_dependency("redis_queue", url)
+        self.timeout = timeout
+        self._sock: Optional[socket.socket] = None
+        self._file: Any = None
+
+    def _connect(self) -> None:
+        sock = socket.create_connection((self.dep.host, self.dep.port), self.timeout)
+        self._sock, self._file = sock, sock.makefile("rb")
+        if self.dep.password:
+            dep = self.dep
+            auth = (dep.username, dep.password) if dep.username else (dep.password,)
+            self.command("AUTH", *auth)
+
+    def close(self) -> None:
+        if self._sock:
+            self._file.close()
+            self._sock.close()
+        self._sock = self._file = None
+
+    def command(self, *args: str) -> Any:
+        if not self._sock:
+            self._connect()
+        assert self._sock
+        parts = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            encoded = arg.encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(encoded), encoded))
+        try:
+            self._sock.sendall(b"".join(parts))
+            return self._read_reply()
+        except OSError:
+            # Reconnect on the next command
+            self.close()
+            raise
+
+    def _read_reply(self) -> Any:
+        line = self._file.readline().rstrip(b"\r\n")
+        if not line:
+            raise ConnectionError("Connection closed by Redis")
+        kind, rest = line[:1], line[1:]
+        if kind == b"-":
+            raise RuntimeError(f"Redis: {rest.decode(errors='replace')}")
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            if int(rest) < 0:
+                return None
+            return self._file.read(int(rest) + 2)[:-2].decode(errors="replace")
+        if kind == b"*":
+            return [self._read_reply() for _ in range(max(int(rest), 0))]
+        return rest.decode()
+
+
+@dataclass
+class QueueStats:
+    depth: int = 0
+    # Seconds the oldest queued job is waiting
+    oldest_age: float = 0
+
+
+def parse_enqueued_at(value: str) -> datetime:
+    # RQ stores UTC timestamps like 2024-01-31T12:00:00.123456Z
+    value = value.rstrip("Z")
+    fmt = "%Y-%m-%dT%H:%M:%S.%f" if "." in value else "%Y-%m-%dT%H:%M:%S"
+    return datetime.strptime(value, fmt).replace(tzinfo=timezone.utc)
+
+
+def get_queue_keys(bench_id: str, queue_type: str) -> tuple[str, ...]:
+    # Frappe prefixes queue names with the bench id since v15
+    return (f"rq:queue:{bench_id}:{queue_type}", f"rq:queue:{queue_type}")
+
+
+def read_queue_stats(redis: RedisClient, bench_id: str) -> dict[str, QueueStats]:
+    now = datetime.now(timezone.utc)
+    stats = {}
+    for queue_type in QUEUE_TYPES:
+        queue = QueueStats()
+        for key in get_queue_keys(bench_id, queue_type):
+            queue.depth += redis.command("LLEN", key)
+            # Jobs are pushed to the right, the oldest is first
+            job_id = redis.command("LINDEX", key, "0")
+            if not job_id:
+                continue
+            enqueued_at = redis.command("HGET", f"rq:job:{job_id}", "enqueued_at")
+            if enqueued_at:
+                age = (now - parse_enqueued_at(enqueued_at)).total_seconds()
+                queue.oldest_age = max(queue.oldest_age, age)
+        stats[queue_type] = queue
+    return stats
+
+
+def get_idle_worker_pids(redis: RedisClient) -> set[int]:
+    """Pids of RQ workers of this container that wait for a job."""
+    hostname = socket.gethostname()
+    pids = set()
+    for key in redis.command("SMEMBERS", "rq:workers") or ():
+        pid, host, state = redis.command("HMGET", key, "pid", "hostname", "state")
+        if pid and host == hostname and state == "idle":
+            pids.add(int(pid))
+    return pids
+
+
+@dataclass
+class Pool:
+    name: str
+    queues: list[str]
+    min_workers: int
+    max_workers: int
+    workers: list[subprocess.Popen] = field(default_factory=list)
+    draining: list[subprocess.Popen] = field(default_factory=list)
+    desired: int = 0
+    last_change: float = -math.inf
+    scale_events: dict[str, int] = field(
+        default_factory=lambda: {"up": 0, "down": 0, "crashed": 0}
+    )
+
+    @classmethod
+    def parse(cls, value: str) -> Pool:
+        try:
+            name, spec = value.split("=", 1)
+            queues, min_workers, max_workers = spec.split(":")
+            pool = cls(name, queues.split(","), int(min_workers), int(max_workers))
+        except ValueError:
+            raise argparse.ArgumentTypeError(
+                f"Expected name=queues:min:max, e.g. long=long,default:1:4, "
+                f"got {value!r}"
+            )
+        unknown = set(pool.queues) - set(QUEUE_TYPES)
+        if unknown or not 0 <= pool.min_workers <= pool.max_workers:
+            raise argparse.ArgumentTypeError(f"Invalid pool {value!r}")
+        return pool
+
+
+class Autoscaler:
+    def __init__(self, args: argparse.Namespace, pools: list[Pool]):
+        self.args = args
+        self.pools = pools
+        with open(args.config) as f:
+            config = json.load(f)
+        self.redis = RedisClient(config["redis_queue"])
+        self.bench_id = config.get("bench_id") or args.bench_path.strip("/").replace(
+            "/", "-"
+        )
+        self.stats: dict[str, QueueStats] = {}
+        self.stopping = False
+        self._lock = threading.Lock()
+
+    def get_desired(self, pool: Pool) -> int:
+        stats = [self.stats[q] for q in pool.queues]
+        backlog = sum(s.depth for s in stats)
+        desired = math.ceil(backlog / self.args.jobs_per_worker)
+        current = len(pool.workers)
+        if any(s.oldest_age > self.args.max_job_age for s in stats):
+            # Jobs wait too long although workers keep up with the count
+            desired = max(desired, current + 1)
+        return min(max(desired, pool.min_workers), pool.max_workers)
+
+    def start_worker(self, pool: Pool) -> None:
+        cmd = (*self.args.worker_command, "--queue", ",".join(pool.queues))
+        pool.workers.append(subprocess.Popen(cmd, cwd=self.args.bench_path))
+
+    def drain_worker(self, pool: Pool) -> None:
+        try:
+            idle = get_idle_worker_pids(self.redis)
+        except (OSError, RuntimeError):
+            idle = set()
+        # Idle workers exit right away, otherwise drain the newest one
+        worker = next((w for w in pool.workers if w.pid in idle), pool.workers[-1])
+        pool.workers.remove(worker)
+        # RQ finishes the current job on first SIGTERM
+        worker.send_signal(signal.SIGTERM)
+        pool.draining.append(worker)
+
+    def reap(self, pool: Pool) -> None:
+        for worker in list(pool.workers):
+            if worker.poll() is not None:
+                log(f"{pool.name}: worker {worker.pid} exited with {worker.returncode}")
+                pool.workers.remove(worker)
+                pool.scale_events["crashed"] += 1
+        pool.draining = [w for w in pool.draining if w.poll() is None]
+
+    def scale(self, pool: Pool, now: float) -> None:
+        self.reap(pool)
+        pool.desired = self.get_desired(pool)
+        current = len(pool.workers)
+        since_change = now - pool.last_change
+        if current < pool.min_workers or (
+            pool.desired > current and since_change >= self.args.up_cooldown
+        ):
+            log(
+                f"{pool.name}: {current} -> {pool.desired} workers "
+                f"({self.describe(pool)})"
+            )
+            for _ in range(pool.desired - current):
+                self.start_worker(pool)
+            pool.scale_events["up"] += 1
+            pool.last_change = now
+        elif pool.desired < current and since_change >= self.args.down_cooldown:
+            log(f"{pool.name}: draining 1 of {current} workers ({self.describe(pool)})")
+            self.drain_worker(pool)
+            pool.scale_events["down"] += 1
+            pool.last_change = now
+
+    def describe(self, pool: Pool) -> str:
+        return ", ".join(
+            f"{q}: {self.stats[q].depth} queued, oldest {self.stats[q].oldest_age:.0f}s"
+            for q in pool.queues
+        )
+
+    def poll(self) -> None:
+        try:
+            stats = read_queue_stats(self.redis, self.bench_id)
+        except (OSError, RuntimeError) as exc:
+            # Keep the workers as they are until Redis is back
+            log(f"Can't read queues: {exc}")
+            return
+        now = time.monotonic()
+        with self._lock:
+            self.stats = stats
+            for pool in self.pools:
+                self.scale(pool, now)
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "queues": {q: vars(s) for q, s in self.stats.items()},
+            "pools": {
+                p.name: {
+                    "queues": p.queues,
+                    "workers": len(p.workers),
+                    "draining": len(p.draining),
+                    "desired": p.desired,
+                    "min": p.min_workers,
+                    "max": p.max_workers,
+                    "scale_events": dict(p.scale_events),
+                }
+                for p in self.pools
+            },
+        }
+
+    def metrics(self) -> str:
+        with self._lock:
+            lines = [
+                "# TYPE frappe_queue_depth gauge",
+                "# TYPE frappe_queue_oldest_job_age_seconds gauge",
+            ]
+            for queue, stats in self.stats.items():
+                lines.append(f'frappe_queue_depth{{queue="{queue}"}} {stats.depth}')
+                lines.append(
+                    f'frappe_queue_oldest_job_age_seconds{{queue="{queue}"}} '
+                    f"{stats.oldest_age:.1f}"
+                )
+            lines += [
+                "# TYPE frappe_workers gauge",
+                "# TYPE frappe_workers_desired gauge",
+                "# TYPE frappe_workers_scale_events_total counter",
+            ]
+            for pool in self.pools:
+                label = f'pool="{pool.name}"'
+                lines.append(
+                    f'frappe_workers{{{label},state="running"}} {len(pool.workers)}'
+                )
+                lines.append(
+                    f'frappe_workers{{{label},state="draining"}} {len(pool.draining)}'
+                )
+                lines.append(f"frappe_workers_desired{{{label}}} {pool.desired}")
+                for event, count in pool.scale_events.items():
+                    lines.append(
+                        f'frappe_workers_scale_events_total{{{label},event="{event}"}} '
+                        f"{count}"
+                    )
+        return "\n".join(lines) + "\n"
+
+    def stop(self, *_args: Any) -> None:
+        self.stopping = True
+
+    def shutdown(self) -> None:
+        workers = [w for p in self.pools for w in p.workers + p.draining]
+        log(f"Stopping {len(workers)} workers")
+        for worker in workers:
+            if worker.poll() is None:
+                worker.send_signal(signal.SIGTERM)
+        for worker in workers:
+            worker.wait()
+
+    def run(self) -> None:
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        try:
+            while not self.stopping:
+                self.poll()
+                # Sleep in steps to react to signals quickly
+                deadline = time.monotonic() + self.args.interval
+                while not self.stopping and time.monotonic() < deadline:
+                    time.sleep(0.2)
+        finally:
+            self.shutdown()
+            self.redis.close()
+
+
+def serve_metrics(autoscaler: Autoscaler, port: int) -> None:
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = autoscaler.metrics().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args: Any) -> None:
+            pass
+
+    server = ThreadingHTTPServer(("", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+
+def main(_args: list[str]) -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--pool",
+        action="append",
+        dest="pools",
+        type=Pool.parse,
+        required=True,
+        help="Worker pool as name=queues:min:max, can be repeated",
+    )
+    parser.add_argument(
+        "--jobs-per-worker",
+        type=int,
+        default=20,
+        help="Queued jobs per worker, default: 20",
+    )
+    parser.add_argument(
+        "--max-job-age",
+        type=float,
+        default=60,
+        help="Add a worker while the oldest job waits longer, default: 60s",
+    )
+    parser.add_argument(
+        "--interval", type=float, default=5, help="Seconds between polls, default: 5"
+    )
+    parser.add_argument(
+        "--up-cooldown",
+        type=float,
+        default=30,
+        help="Seconds after a change before adding workers, default: 30",
+    )
+    parser.add_argument(
+        "--down-cooldown",
+        type=float,
+        default=300,
+        help="Seconds after a change before draining a worker, default: 300",
+    )
+    parser.add_argument("--metrics-port", type=int, help="Serve /metrics on this port")
+    parser.add_argument(
+        "--once",
+        action="store_true",
+        help="Print queue stats and desired workers as JSON and exit",
+    )
+    parser.add_argument("--config", default=CONFIG_PATH, help=f"default: {CONFIG_PATH}")
+    parser.add_argument(
+        "--bench-path", default=BENCH_PATH, help=f"default: {BENCH_PATH}"
+    )
+    parser.add_argument(
+        "--worker-command",
+        nargs="+",
+        default=["bench", "worker"],
+        help="Command of a worker, --queue is appended, default: bench worker",
+    )
+    args = parser.parse_args(_args)
+
+    autoscaler = Autoscaler(args, args.pools)
+    if args.once:
+        autoscaler.stats = read_queue_stats(autoscaler.redis, autoscaler.bench_id)
+        for pool in autoscaler.pools:
+            pool.desired = autoscaler.get_desired(pool)
+        print(json.dumps(autoscaler.snapshot(), indent=2))
+        return 0
+
+    if args.metrics_port:
+        serve_metrics(autoscaler, args.metrics_port)
+    pools = ", ".join(
+        f"{p.name} ({','.join(p.queues)}: {p.min_workers}-{p.max_workers})"
+        for p in args.pools
+    )
+    log(f"Scaling {pools} every {args.interval:g}s")
+    autoscaler.run()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Run a pool of preloaded RQ workers that execute jobs in their own process.
+
+`bench worker` forks a work horse for every job, so every job imports the
+code it needs, initializes its site and connects to the database again. For
+small jobs that costs more than the job itself. Here frappe and the apps are
+imported once, then --workers processes are forked that take jobs from the
+same queues and run them in-process. The database connection of every site
+is kept open between jobs. A process exits after --max-jobs jobs and is
+replaced by a fresh fork, so state leaked by jobs doesn't pile up.
+
+Run it with the Python of the bench environment (Frappe v15 or newer):
+
+    env/bin/python /usr/local/bin/worker_pool.py --queue short,default
+
+Workers stop after their current job on SIGTERM, like `bench worker`.
+"""
+
+from __future__ import annotations
+
+import argparse
+import gc
+import importlib
+import os
+import signal
+import sys
+import time
+import traceback
+from contextlib import suppress
+from typing import Any
+
+BENCH_PATH = "/home/frappe/frappe-bench"
+# Imported by every job, the rest of a job's code is imported on first use
+PRELOAD_MODULES = (
+    "frappe",
+    "frappe.utils.background_jobs",
+    "frappe.model.document",
+    "frappe.database.query",
+    "frappe.query_builder",
+    "rq",
+)
+# Processes exiting sooner are restarted with a delay
+MIN_UPTIME = 10
+MAX_RESTART_DELAY = 30
+
+
+def log(message: str) -> None:
+    print(f"[worker-pool] {message}", file=sys.stderr, flush=True)
+
+
+def preload(bench_path: str, modules: list[str]) -> None:
+    for module in modules:
+        importlib.import_module(module)
+    with open(os.path.join(bench_path, "sites", "apps.txt")) as f:
+        apps = [line.strip() for line in f if line.strip()]
+    for app in apps:
+        for module in (app, f"{app}.hooks"):
+            with suppress(ImportError):
+                importlib.import_module(module)
+    # Objects of the parent are never collected in the forks, so their
+    # memory pages stay shared
+    gc.freeze()
+
+
+class SiteConnections:
+    """Keep the database connection of every site open between jobs."""
+
+    def __init__(self):
+        self.connections: dict[str, Any] = {}
+
+    def install(self) -> None:
+        # execute_job calls frappe.connect and frappe.destroy around
+        # every job
+        import frappe
+
+        self._connect, self._destroy = frappe.connect, frappe.destroy
+        frappe.connect, frappe.destroy = self.connect, self.destroy
+
+    def connect(self, *args: Any, **kwargs: Any) -> None:
+        import frappe
+
+        # Sets up the site, the new database object connects on first query
+        self._connect(*args, **kwargs)
+        db = self.connections.pop(frappe.local.site, None)
+        if db is None:
+            return
+        if db.cur_db_name != frappe.local.db.cur_db_name:
+            self.close(db)
+            return
+        try:
+            db.sql("select 1")
+        except Exception:
+            # Closed by the server in the meantime
+            self.close(db)
+            return
+        frappe.local.db = db
+
+    def destroy(self) -> None:
+        import frappe
+
+        db = getattr(frappe.local, "db", None)
+        site = getattr(frappe.local, "site", None)
+        if db is not None and site and site not in self.connections:
+            try:
+                db.rollback()
+            except Exception:
+                self.close(db)
+            else:
+                self.connections[site] = db
+            # Keep frappe.destroy from closing it
+            frappe.local.db = None
+        self._destroy()
+
+    def close(self, db: Any) -> None:
+        with suppress(Exception):
+            db.close()
+
+
+def run_worker(queues: list[str], max_jobs: int, quiet: bool) -> None:
+    import frappe
+    from frappe.utils.background_jobs import get_queue_list, get_redis_conn
+    from rq import SimpleWorker
+
+    # Same setup as frappe.utils.background_jobs.start_worker
+    with frappe.init_site():
+        connection = get_redis_conn()
+        queue_names = get_queue_list(queues, build_queue_name=True)
+    SiteConnections().install()
+    # SimpleWorker runs jobs in this process instead of forking
+    worker = SimpleWorker(queue_names, connection=connection)
+    worker.work(
+        logging_level="WARNING" if quiet else "INFO",
+        max_jobs=max_jobs,
+        with_scheduler=False,
+    )
+
+
+class WorkerPool:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.queues = [q.strip() for q in args.queue.split(",")]
+        # pid -> start time
+        self.children: dict[int, float] = {}
+        self.failures = 0
+        self.stopping = False
+
+    def fork(self) -> None:
+        pid = os.fork()
+        if pid == 0:
+            # RQ installs its own handlers for warm shutdown
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            code = 0
+            try:
+                run_worker(self.queues, self.args.max_jobs, self.args.quiet)
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(code)
+        self.children[pid] = time.monotonic()
+
+    def reap(self) -> None:
+        while self.children:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                return
+            uptime = time.monotonic() - self.children.pop(pid)
+            code = os.waitstatus_to_exitcode(status)
+            if code == 0:
+                # Done with --max-jobs
+                self.failures = 0
+                continue
+            log(f"Worker {pid} exited with {code} after {uptime:.0f}s")
+            if uptime < MIN_UPTIME:
+                self.failures += 1
+
+    def stop(self, *_args: Any) -> None:
+        self.stopping = True
+
+    def run(self) -> None:
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        log(
+            f"Starting {self.args.workers} workers for {','.join(self.queues)}, "
+            f"{self.args.max_jobs} jobs each"
+        )
+        while not self.stopping:
+            self.reap()
+            missing = self.args.workers - len(self.children)
+            if missing and self.failures:
+                # Don't spin on a worker that can't start, e.g. Redis down
+                delay = min(2**self.failures, MAX_RESTART_DELAY)
+                log(f"Restarting workers in {delay}s")
+                deadline = time.monotonic() + delay
+                while not self.stopping and time.monotonic() < deadline:
+                    time.sleep(0.2)
+                if self.stopping:
+                    break
+            for _ in range(missing):
+                self.fork()
+            time.sleep(0.2)
+        self.shutdown()
+
+    def shutdown(self) -> None:
+        log(f"Stopping {len(self.children)} workers")
+        for pid in self.children:
+            with suppress(ProcessLookupError):
+                os.kill(pid, signal.SIGTERM)
+        for pid in self.children:
+            with suppress(ChildProcessError):
+                os.waitpid(pid, 0)
+
+
+def main(_args: list[str]) -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--queue", default="short,default,long", help="default: short,default,long"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=4, help="Worker processes, default: 4"
+    )
+    parser.add_argument(
+        "--max-jobs",
+        type=int,
+        default=500,
+        help="Jobs of a process before it's replaced, default: 500",
+    )
+    parser.add_argument(
+        "--preload",
+        action="append",
+        default=[],
+        help="Module to import before forking, can be repeated",
+    )
+    parser.add_argument(
+        "--bench-path", default=BENCH_PATH, help=f"default: {BENCH_PATH}"
+    )
+    parser.add_argument("--quiet", action="store_true", help="Don't log every job")
+    args = parser.parse_args(_args)
+
+    # Same working directory as bench commands
+    os.chdir(os.path.join(args.bench_path, "sites"))
+    start = time.monotonic()
+    preload(args.bench_path, [*PRELOAD_MODULES, *args.preload])
+    log(f"Preloaded modules in {time.monotonic() - start:.1f}s")
+    WorkerPool(args).run()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
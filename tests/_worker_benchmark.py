@@ -0,0 +1,78 @@
+"""
+Throughput benchmark of the queue workers.
+
+Enqueues tiny jobs on a queue and waits until the workers running in the
+stack finished all of them. Prints a JSON report with jobs per second and
+the time from enqueueing to the end of every job. Run it with the bench
+Python in a backend container:
+
+    env/bin/python _worker_benchmark.py --site tests.localhost --jobs 500
+"""
+
+import argparse
+import json
+import sys
+import time
+
+import frappe
+from frappe.utils.background_jobs import get_redis_conn
+from rq.job import Job
+
+
+def percentile(values: list[float], pct: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def main(_args: list[str]) -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--site", default="tests.localhost")
+    parser.add_argument("--jobs", type=int, default=500)
+    parser.add_argument("--queue", default="short")
+    parser.add_argument("--method", default="frappe.ping")
+    parser.add_argument("--timeout", type=float, default=300)
+    args = parser.parse_args(_args)
+
+    frappe.connect(site=args.site)
+    start = time.monotonic()
+    job_ids = [
+        frappe.enqueue(args.method, queue=args.queue).id for _ in range(args.jobs)
+    ]
+    enqueued = time.monotonic() - start
+
+    connection = get_redis_conn()
+    pending = set(job_ids)
+    failed = 0
+    latencies = []
+    while pending and time.monotonic() - start < args.timeout:
+        time.sleep(0.1)
+        job_ids = list(pending)
+        for job_id, job in zip(job_ids, Job.fetch_many(job_ids, connection=connection)):
+            if job is None:
+                # Result expired already
+                pending.discard(job_id)
+                continue
+            if not (job.is_finished or job.is_failed):
+                continue
+            pending.discard(job.id)
+            failed += job.is_failed
+            if job.ended_at:
+                latencies.append((job.ended_at - job.enqueued_at).total_seconds())
+    duration = time.monotonic() - start
+
+    report = {
+        "jobs": args.jobs,
+        "enqueue_seconds": round(enqueued, 3),
+        "seconds": round(duration, 3),
+        "jobs_per_second": round((args.jobs - len(pending)) / duration, 1),
+        "failed": failed,
+        "timed_out": len(pending),
+        "latency_p50": round(percentile(latencies, 50), 3) if latencies else None,
+        "latency_p95": round(percentile(latencies, 95), 3) if latencies else None,
+    }
+    print(json.dumps(report))
+    return 1 if failed or pending else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -0,0 +1,323 @@
+"""
+HTTP load benchmark for the frontend → backend path.
+
+Drives concurrent load at the endpoints checked by the test suite and reports
+throughput and latency percentiles per endpoint. Results are written as JSON,
+so runs can be compared against each other, e.g. when tuning Gunicorn workers
+or bumping ERPNEXT_VERSION:
+
+    python -m tests.benchmark --site-name tests.localhost --output before.json
+    python -m tests.benchmark --site-name tests.localhost --compare before.json
+
+Use --stand-in to run against a local WSGI app instead of the compose stack.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import ssl
+import sys
+import threading
+import time
+from dataclasses import asdict, dataclass
+from http.client import HTTPConnection, HTTPException, HTTPSConnection
+from socketserver import ThreadingMixIn
+from typing import Any, Callable, Iterable, Optional
+from urllib.parse import urlsplit
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+# Public file served by nginx from the sites volume, create it first:
+#   echo benchmark > sites/<site>/public/files/benchmark.txt
+FILES_ENDPOINT = "/files/benchmark.txt"
+ENDPOINTS = (
+    "/",
+    "/api/method/ping",
+    "/assets/frappe/images/frappe-framework-logo.svg",
+    FILES_ENDPOINT,
+)
+# Connection errors in a row before a worker gives up, the server is down
+MAX_CONSECUTIVE_ERRORS = 20
+MAX_BACKOFF = 1.0
+
+
+@dataclass
+class EndpointResult:
+    path: str
+    requests: int
+    errors: int
+    duration: float
+    throughput: float
+    mean: Optional[float]
+    p50: Optional[float]
+    p95: Optional[float]
+    p99: Optional[float]
+    max: Optional[float]
+
+
+def percentile(values: list[float], pct: float) -> Optional[float]:
+    # Nearest-rank method, values have to be sorted
+    if not values:
+        return None
+    rank = max(1, round(pct / 100 * len(values)))
+    return values[min(rank, len(values)) - 1]
+
+
+def get_connection(base_url: str) -> HTTPConnection:
+    parsed = urlsplit(base_url)
+    if parsed.scheme == "https":
+        ctx = ssl.create_default_context()
+        ctx.check_hostname = False
+        ctx.verify_mode = ssl.CERT_NONE
+        return HTTPSConnection(parsed.hostname, parsed.port, timeout=30, context=ctx)
+    return HTTPConnection(parsed.hostname, parsed.port, timeout=30)
+
+
+class Worker(threading.Thread):
+    def __init__(
+        self,
+        base_url: str,
+        path: str,
+        site_name: str,
+        should_continue: Callable[[], bool],
+    ):
+        super().__init__(daemon=True)
+        self.base_url = base_url
+        self.path = path
+        self.site_name = site_name
+        self.should_continue = should_continue
+        self.latencies: list[float] = []
+        self.errors = 0
+
+    def run(self) -> None:
+        # One persistent connection per worker, like a keep-alive browser
+        conn = get_connection(self.base_url)
+        consecutive_errors = 0
+        while self.should_continue():
+            start = time.perf_counter()
+            try:
+                conn.request("GET", self.path, headers={"Host": self.site_name})
+                response = conn.getresponse()
+                response.read()
+            except (OSError, HTTPException):
+                self.errors += 1
+                conn.close()
+                consecutive_errors += 1
+                if consecutive_errors >= MAX_CONSECUTIVE_ERRORS:
+                    break
+                # Don't spin while the server is unreachable
+                time.sleep(min(0.01 * 2**consecutive_errors, MAX_BACKOFF))
+                conn = get_connection(self.base_url)
+                continue
+            consecutive_errors = 0
+            if response.status >= 400:
+                self.errors += 1
+            else:
+                self.latencies.append(time.perf_counter() - start)
+            if response.will_close:
+                conn.close()
+                conn = get_connection(self.base_url)
+        conn.close()
+
+
+def run_endpoint(
+    base_url: str,
+    path: str,
+    site_name: str,
+    concurrency: int,
+    duration: float,
+    requests: Optional[int] = None,
+) -> EndpointResult:
+    lock = threading.Lock()
+    sent = 0
+    deadline = time.monotonic() + duration
+
+    def should_continue() -> bool:
+        nonlocal sent
+        if requests is None:
+            return time.monotonic() < deadline
+        with lock:
+            sent += 1
+            return sent <= requests
+
+    workers = [
+        Worker(base_url, path, site_name, should_continue) for _ in range(concurrency)
+    ]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(lat for w in workers for lat in w.latencies)
+    errors = sum(w.errors for w in workers)
+
+    def ms(value: Optional[float]) -> Optional[float]:
+        return None if value is None else round(value * 1000, 3)
+
+    return EndpointResult(
+        path=path,
+        requests=len(latencies) + errors,
+        errors=errors,
+        duration=round(elapsed, 3),
+        throughput=round(len(latencies) / elapsed, 2),
+        mean=ms(sum(latencies) / len(latencies)) if latencies else None,
+        p50=ms(percentile(latencies, 50)),
+        p95=ms(percentile(latencies, 95)),
+        p99=ms(percentile(latencies, 99)),
+        max=ms(latencies[-1] if latencies else None),
+    )
+
+
+def run_benchmark(
+    base_url: str,
+    site_name: str,
+    paths: Iterable[str] = ENDPOINTS,
+    concurrency: int = 10,
+    duration: float = 10,
+    requests: Optional[int] = None,
+) -> dict[str, Any]:
+    results = [
+        run_endpoint(base_url, path, site_name, concurrency, duration, requests)
+        for path in paths
+    ]
+    return {
+        "timestamp": time.time(),
+        "base_url": base_url,
+        "site_name": site_name,
+        "concurrency": concurrency,
+        "erpnext_version": os.getenv("ERPNEXT_VERSION"),
+        "endpoints": [asdict(r) for r in results],
+    }
+
+
+def format_report(report: dict[str, Any]) -> str:
+    lines = [
+        f"{'endpoint':<50} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} "
+        f"{'p99 ms':>9} {'errors':>7}"
+    ]
+    for r in report["endpoints"]:
+        lines.append(
+            f"{r['path'][:50]:<50} {r['throughput']:>9.1f} {r['p50'] or 0:>9.2f} "
+            f"{r['p95'] or 0:>9.2f} {r['p99'] or 0:>9.2f} {r['errors']:>7}"
+        )
+    return "\n".join(lines)
+
+
+def compare_reports(report: dict[str, Any], baseline: dict[str, Any]) -> str:
+    def change(new: Optional[float], old: Optional[float]) -> str:
+        if not new or not old:
+            return "n/a"
+        return f"{(new - old) / old * 100:+.1f}%"
+
+    previous = {r["path"]: r for r in baseline["endpoints"]}
+    lines = [f"{'endpoint':<50} {'req/s':>9} {'p95':>9} {'p99':>9}"]
+    for r in report["endpoints"]:
+        old = previous.get(r["path"])
+        if not old:
+            continue
+        lines.append(
+            f"{r['path'][:50]:<50} {change(r['throughput'], old['throughput']):>9} "
+            f"{change(r['p95'], old['p95']):>9} {change(r['p99'], old['p99']):>9}"
+        )
+    return "\n".join(lines)
+
+
+def stand_in_app(environ: dict[str, Any], start_response: Callable[..., Any]):
+    """Minimal WSGI app that answers the benchmarked endpoints."""
+    path = environ["PATH_INFO"]
+    if path == "/":
+        status, content_type, body = "200 OK", "text/html", b"<html>Home</html>"
+    elif path == "/api/method/ping":
+        status, content_type, body = "200 OK", "application/json", b'{"message":"pong"}'
+    elif path.startswith(("/assets/", "/files/")):
+        status, content_type, body = "200 OK", "image/svg+xml", b"<svg></svg>"
+    else:
+        status, content_type, body = "404 Not Found", "text/plain", b"Not found"
+    start_response(
+        status, [("Content-Type", content_type), ("Content-Length", str(len(body)))]
+    )
+    return [body]
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+    # Default backlog of 5 drops connections under concurrent load
+    request_queue_size = 128
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args: Any) -> None:
+        pass
+
+
+def serve_stand_in(port: int = 0) -> tuple[WSGIServer, str]:
+    server = make_server(
+        "127.0.0.1",
+        port,
+        stand_in_app,
+        server_class=ThreadingWSGIServer,
+        handler_class=QuietHandler,
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def main(_args: list[str]) -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--base-url", default="http://127.0.0.1")
+    parser.add_argument("--site-name", default="tests.localhost")
+    parser.add_argument(
+        "--endpoint",
+        action="append",
+        dest="endpoints",
+        help=f"Path to benchmark, can be repeated, default: {', '.join(ENDPOINTS)}",
+    )
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument(
+        "--duration", type=float, default=10, help="Seconds per endpoint"
+    )
+    parser.add_argument(
+        "--requests", type=int, help="Requests per endpoint, overrides --duration"
+    )
+    parser.add_argument("--output", help="Write JSON results to this file")
+    parser.add_argument("--compare", help="JSON results of previous run")
+    parser.add_argument(
+        "--stand-in", action="store_true", help="Benchmark local stand-in WSGI app"
+    )
+    args = parser.parse_args(_args)
+
+    base_url = args.base_url
+    server = None
+    if args.stand_in:
+        server, base_url = serve_stand_in()
+
+    try:
+        report = run_benchmark(
+            base_url=base_url,
+            site_name=args.site_name,
+            paths=args.endpoints or ENDPOINTS,
+            concurrency=args.concurrency,
+            duration=args.duration,
+            requests=args.requests,
+        )
+    finally:
+        if server:
+            server.shutdown()
+
+    print(format_report(report))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            print(compare_reports(report, json.load(f)))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
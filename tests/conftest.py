@@ -4,10 +4,24 @@ import shutil
 import subprocess
 from dataclasses import dataclass
 from pathlib import Path
+from typing import Callable, Optional
 
 import pytest
 
-from tests.utils import CI, Compose
+# Imported by tests.utils before pytest_plugins registers it
+pytest.register_assert_rewrite("tests.timing")
+
+from tests.utils import CI, Compose, VolumeSnapshots  # noqa: E402
+
+pytest_plugins = ("tests.timing",)
+
+
+def pytest_addoption(parser: pytest.Parser):
+    parser.addoption(
+        "--snapshot-dir",
+        help="Restore test sites from volume snapshots in this directory, "
+        "snapshots are taken on first run and whenever images change",
+    )
 
 
 def _add_version_var(name: str, env_path: Path):
@@ -58,6 +72,22 @@ def compose(env_file: str):
     return Compose(project_name="test", env_file=env_file)
 
 
+@pytest.fixture(scope="session")
+def volume_snapshots(compose: Compose, pytestconfig: pytest.Config):
+    directory = pytestconfig.getoption("snapshot_dir")
+    if directory:
+        return VolumeSnapshots(compose, os.path.abspath(directory))
+
+
+def _setup_site(
+    name: str, create: Callable[[], None], snapshots: Optional[VolumeSnapshots]
+):
+    if snapshots:
+        snapshots.restore_or_create(name, create)
+    else:
+        create()
+
+
 @pytest.fixture(autouse=True, scope="session")
 def frappe_setup(compose: Compose):
     compose.stop()
@@ -69,17 +99,21 @@ def frappe_setup(compose: Compose):
 
 
 @pytest.fixture(scope="session")
-def frappe_site(compose: Compose):
+def frappe_site(compose: Compose, volume_snapshots: Optional[VolumeSnapshots]):
     site_name = "tests.localhost"
-    compose.bench(
-        "new-site",
-        # TODO: change to --mariadb-user-host-login-scope=%
-        "--no-mariadb-socket",
-        "--db-root-password=123",
-        "--admin-password=admin",
-        site_name,
-    )
-    compose("restart", "backend")
+
+    def create():
+        compose.bench(
+            "new-site",
+            # TODO: change to --mariadb-user-host-login-scope=%
+            "--no-mariadb-socket",
+            "--db-root-password=123",
+            "--admin-password=admin",
+            site_name,
+        )
+        compose("restart", "backend")
+
+    _setup_site("frappe-site", create, volume_snapshots)
     yield site_name
 
 
@@ -93,7 +127,7 @@ def erpnext_setup(compose: Compose):
 
 
 @pytest.fixture(scope="class")
-def erpnext_site(compose: Compose):
+def erpnext_site(compose: Compose, volume_snapshots: Optional[VolumeSnapshots]):
     site_name = "test-erpnext-site.localhost"
     args = [
         "new-site",
@@ -104,8 +138,12 @@ def erpnext_site(compose: Compose):
         "--install-app=erpnext",
         site_name,
     ]
-    compose.bench(*args)
-    compose("restart", "backend")
+
+    def create():
+        compose.bench(*args)
+        compose("restart", "backend")
+
+    _setup_site("erpnext-site", create, volume_snapshots)
     yield site_name
 
 
@@ -113,8 +151,10 @@ def erpnext_site(compose: Compose):
 def postgres_setup(compose: Compose):
     compose.stop()
     compose("-f", "overrides/compose.postgres.yaml", "up", "-d", "--quiet-pull")
-    compose.bench("set-config", "-g", "root_login", "postgres")
-    compose.bench("set-config", "-g", "root_password", "123")
+    compose.bench_batch(
+        ("set-config", "-g", "root_login", "postgres"),
+        ("set-config", "-g", "root_password", "123"),
+    )
     yield
     compose.stop()
 
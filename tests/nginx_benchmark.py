@@ -0,0 +1,282 @@
+"""
+Benchmark nginx frontend templates against each other.
+
+Every template is rendered like nginx-entrypoint.sh does and served by a local
+nginx in front of a stand-in upstream, which counts the TCP connections it
+accepts. The report shows throughput, latency percentiles and requests that
+reached the upstream per endpoint, upstream connections and, with --upstreams,
+the split of requests between replicas per template, e.g. to compare the current template with an older
+revision:
+
+    git show <rev>:resources/core/nginx/nginx-template.conf > /tmp/old.conf
+    python -m tests.nginx_benchmark --template /tmp/old.conf \\
+        --template resources/core/nginx/nginx-template.conf
+
+Requires the nginx binary, e.g. run it inside the frontend image.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+from tests.benchmark import run_benchmark
+
+TEMPLATE_PATH = "resources/core/nginx/nginx-template.conf"
+SNIPPETS_PATH = "resources/core/nginx"
+# API calls always reach the upstream, guest pages may come from the cache
+PATHS = ("/api/method/ping", "/about")
+
+MAIN_CONFIG = """
+daemon off;
+worker_processes {workers};
+pid {prefix}/nginx.pid;
+error_log {prefix}/error.log;
+events {{
+	worker_connections 1024;
+}}
+http {{
+	access_log off;
+	client_body_temp_path {prefix}/client_body;
+	proxy_temp_path {prefix}/proxy;
+	fastcgi_temp_path {prefix}/fastcgi;
+	uwsgi_temp_path {prefix}/uwsgi;
+	scgi_temp_path {prefix}/scgi;
+	include {prefix}/frappe.conf;
+}}
+"""
+
+
+class UpstreamHandler(BaseHTTPRequestHandler):
+    # Keep-alive like Gunicorn gthread workers
+    protocol_version = "HTTP/1.1"
+    # Headers and body are separate writes, don't wait for delayed ACK
+    disable_nagle_algorithm = True
+
+    def do_GET(self) -> None:
+        self.server.count_request(self.path)  # type: ignore[attr-defined]
+        time.sleep(self.server.delay)  # type: ignore[attr-defined]
+        body = b'{"message":"pong"}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+
+class CountingServer(ThreadingHTTPServer):
+    """Stand-in upstream that counts accepted connections and requests."""
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, delay: float):
+        super().__init__(("127.0.0.1", 0), UpstreamHandler)
+        self.delay = delay
+        self.connections = 0
+        self.requests = 0
+        self.requests_by_path: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def count_request(self, path: str) -> None:
+        with self._lock:
+            self.requests += 1
+            self.requests_by_path[path] = self.requests_by_path.get(path, 0) + 1
+
+    def process_request(self, request: Any, client_address: Any) -> None:
+        with self._lock:
+            self.connections += 1
+        super().process_request(request, client_address)
+
+
+def get_free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def render_template(template: str, variables: dict[str, str]) -> str:
+    # Like envsubst with explicit list of variables in nginx-entrypoint.sh
+    def replace(match: re.Match[str]) -> str:
+        return variables.get(match.group(1), match.group(0))
+
+    return re.sub(r"\$\{(\w+)\}", replace, template)
+
+
+def get_variables(
+    upstream_ports: list[int], keepalive: int, proxy_cache_valid: str
+) -> dict[str, str]:
+    addresses = [f"127.0.0.1:{port}" for port in upstream_ports]
+    # Same as upstream_servers() in nginx-entrypoint.sh
+    servers = "\n\t".join(
+        f"server {address} max_fails=3 fail_timeout=10s;" for address in addresses
+    )
+    return {
+        # Older templates take a single address
+        "BACKEND": addresses[0],
+        "SOCKETIO": addresses[0],
+        "BACKEND_SERVERS": servers,
+        "SOCKETIO_SERVERS": servers,
+        "UPSTREAM_REAL_IP_ADDRESS": "127.0.0.1",
+        "UPSTREAM_REAL_IP_HEADER": "X-Forwarded-For",
+        "UPSTREAM_REAL_IP_RECURSIVE": "off",
+        "FRAPPE_SITE_NAME_HEADER": "$host",
+        "PROXY_READ_TIMEOUT": "120",
+        "CLIENT_MAX_BODY_SIZE": "50m",
+        "UPSTREAM_KEEPALIVE": str(keepalive),
+        # Same as nginx-entrypoint.sh
+        "MICROCACHE_LOCATION": "@microcache" if proxy_cache_valid else "@webserver",
+        "PROXY_CACHE_VALID": proxy_cache_valid or "1s",
+    }
+
+
+def write_config(
+    prefix: str, template_path: str, variables: dict[str, str], port: int, workers: int
+) -> str:
+    with open(template_path) as f:
+        config = render_template(f.read(), variables)
+    config = config.replace("listen 8080;", f"listen 127.0.0.1:{port};")
+    config = config.replace("/etc/nginx/snippets", os.path.abspath(SNIPPETS_PATH))
+    config = config.replace("/var/lib/nginx", prefix)
+    with open(os.path.join(prefix, "frappe.conf"), "w") as f:
+        f.write(config)
+    main_path = os.path.join(prefix, "nginx.conf")
+    with open(main_path, "w") as f:
+        f.write(MAIN_CONFIG.format(prefix=prefix, workers=workers))
+    return main_path
+
+
+def wait_for_port(port: int, process: subprocess.Popen, timeout: float = 10) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"nginx exited with code {process.returncode}")
+        with socket.socket() as s:
+            if s.connect_ex(("127.0.0.1", port)) == 0:
+                return
+        time.sleep(0.05)
+    raise RuntimeError(f"nginx didn't listen on {port} in {timeout}s")
+
+
+def benchmark_template(args: argparse.Namespace, template_path: str) -> dict[str, Any]:
+    upstreams = [
+        CountingServer(args.upstream_delay / 1000) for _ in range(args.upstreams)
+    ]
+    for upstream in upstreams:
+        threading.Thread(target=upstream.serve_forever, daemon=True).start()
+    port = get_free_port()
+
+    with tempfile.TemporaryDirectory(prefix="nginx-benchmark-") as prefix:
+        variables = get_variables(
+            [upstream.server_port for upstream in upstreams],
+            args.keepalive,
+            args.proxy_cache_valid,
+        )
+        config_path = write_config(prefix, template_path, variables, port, args.workers)
+        process = subprocess.Popen((args.nginx, "-p", prefix, "-c", config_path))
+        try:
+            wait_for_port(port, process)
+            report = run_benchmark(
+                base_url=f"http://127.0.0.1:{port}",
+                site_name="localhost",
+                paths=PATHS,
+                concurrency=args.concurrency,
+                duration=args.duration,
+            )
+        finally:
+            process.terminate()
+            process.wait()
+            for upstream in upstreams:
+                upstream.shutdown()
+
+    report["template"] = template_path
+    report["upstream_connections"] = sum(u.connections for u in upstreams)
+    report["upstream_requests"] = [u.requests for u in upstreams]
+    for result in report["endpoints"]:
+        # Requests not answered from the guest page cache
+        result["upstream_requests"] = sum(
+            u.requests_by_path.get(result["path"], 0) for u in upstreams
+        )
+    return report
+
+
+def format_reports(reports: list[dict[str, Any]]) -> str:
+    lines = [
+        f"{'template':<40} {'path':<18} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} "
+        f"{'errors':>7} {'upstream':>9}"
+    ]
+    for report in reports:
+        for result in report["endpoints"]:
+            lines.append(
+                f"{report['template'][-40:]:<40} {result['path'][:18]:<18} "
+                f"{result['throughput']:>9.1f} {result['p50'] or 0:>9.2f} "
+                f"{result['p99'] or 0:>9.2f} {result['errors']:>7} "
+                f"{result['upstream_requests']:>9}"
+            )
+        lines.append(f"  upstream connections: {report['upstream_connections']}")
+        if len(report["upstream_requests"]) > 1:
+            split = ", ".join(str(n) for n in report["upstream_requests"])
+            lines.append(f"  requests per upstream: {split}")
+    return "\n".join(lines)
+
+
+def main(_args: list[str]) -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--template",
+        action="append",
+        dest="templates",
+        help=f"nginx template to benchmark, can be repeated, default: {TEMPLATE_PATH}",
+    )
+    parser.add_argument("--nginx", default="nginx", help="nginx binary")
+    parser.add_argument("--workers", type=int, default=1, help="nginx workers")
+    parser.add_argument(
+        "--keepalive", type=int, default=32, help="UPSTREAM_KEEPALIVE, default: 32"
+    )
+    parser.add_argument(
+        "--proxy-cache-valid", help="PROXY_CACHE_VALID, guest cache is off by default"
+    )
+    parser.add_argument(
+        "--upstreams", type=int, default=1, help="Stand-in upstream replicas"
+    )
+    parser.add_argument(
+        "--upstream-delay",
+        type=float,
+        default=2,
+        help="Milliseconds the stand-in upstream takes per request, default: 2",
+    )
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument(
+        "--duration", type=float, default=10, help="Seconds per template"
+    )
+    parser.add_argument("--output", help="Write JSON results to this file")
+    args = parser.parse_args(_args)
+
+    reports = [
+        benchmark_template(args, template)
+        for template in args.templates or [TEMPLATE_PATH]
+    ]
+    print(format_reports(reports))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(reports, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -1,10 +1,14 @@
+import json
 import os
+import time
 from pathlib import Path
 from typing import Any
 
 import pytest
 
+from tests.benchmark import FILES_ENDPOINT, run_benchmark
 from tests.conftest import S3ServiceResult
+from tests.timing import tracer
 from tests.utils import Compose, check_url_content, wait_for_url
 
 BACKEND_SERVICES = (
@@ -15,11 +19,13 @@ BACKEND_SERVICES = (
 )
 
 
-@pytest.mark.parametrize("service", BACKEND_SERVICES)
-def test_links_in_backends(service: str, compose: Compose, python_path: str):
-    filename = "_check_connections.py"
-    compose("cp", f"tests/{filename}", f"{service}:/tmp/")
-    compose.exec(service, python_path, f"/tmp/{filename}")
+def test_links_in_backends(compose: Compose, python_path: str):
+    compose.run_script(
+        BACKEND_SERVICES,
+        "resources/core/check_connections.py",
+        python_path,
+        "--timeout=5",
+    )
 
 
 def index_cb(text: str):
@@ -57,6 +63,38 @@ def test_assets_endpoint(frappe_site: str):
     )
 
 
+@pytest.mark.skipif(
+    os.environ["FRAPPE_VERSION"][0:3] == "v12", reason="v12 doesn't have assets.json"
+)
+def test_assets_cache_headers(frappe_site: str, compose: Compose):
+    compose.exec("backend", "python3", "/usr/local/bin/compress_assets.py", "--verify")
+    response = wait_for_url("http://127.0.0.1/assets/assets.json", frappe_site)
+    assert "immutable" not in response.headers["Cache-Control"]
+    assert response.headers["ETag"]
+
+    bundles: dict[str, str] = json.loads(response.read())
+    response = wait_for_url(f"http://127.0.0.1{bundles['desk.bundle.js']}", frappe_site)
+    assert "immutable" in response.headers["Cache-Control"]
+
+
+def test_benchmark_endpoints(frappe_site: str, compose: Compose):
+    compose.exec(
+        "backend",
+        "sh",
+        "-c",
+        f"echo benchmark > sites/{frappe_site}/public/files/benchmark.txt",
+    )
+    report = run_benchmark(
+        base_url="http://127.0.0.1",
+        site_name=frappe_site,
+        paths=("/", "/api/method/ping", FILES_ENDPOINT),
+        concurrency=4,
+        requests=50,
+    )
+    for result in report["endpoints"]:
+        assert result["errors"] == 0, result
+
+
 def test_files_reachable(frappe_site: str, tmp_path: Path, compose: Compose):
     content = "lalala\n"
     file_path = tmp_path / "testfile.txt"
@@ -105,20 +143,97 @@ def test_files_html_security_headers(
     assert response.headers["X-Content-Type-Options"] == "nosniff"
 
 
-@pytest.mark.parametrize("service", BACKEND_SERVICES)
 @pytest.mark.usefixtures("frappe_site")
-def test_frappe_connections_in_backends(
-    service: str, python_path: str, compose: Compose
-):
-    filename = "_ping_frappe_connections.py"
-    compose("cp", f"tests/{filename}", f"{service}:/tmp/")
-    compose.exec(
-        "-w",
-        "/home/frappe/frappe-bench/sites",
-        service,
+def test_frappe_connections_in_backends(python_path: str, compose: Compose):
+    compose.run_script(
+        BACKEND_SERVICES,
+        "tests/_ping_frappe_connections.py",
+        python_path,
+        options=("-w", "/home/frappe/frappe-bench/sites"),
+    )
+
+
+@pytest.mark.usefixtures("frappe_site")
+def test_worker_autoscaler(compose: Compose):
+    (result,) = compose.exec_many(
+        ("queue-long",),
+        "worker_autoscaler.py",
+        "--once",
+        "--pool",
+        "long=long,default,short:1:4",
+    )
+    assert result.returncode == 0, result.output
+    pool = json.loads(result.output)["pools"]["long"]
+    assert 1 <= pool["desired"] <= 4
+
+
+def run_worker_benchmark(
+    compose: Compose, python_path: str, name: str
+) -> dict[str, Any]:
+    start = time.perf_counter()
+    (result,) = compose.run_script(
+        ("backend",),
+        "tests/_worker_benchmark.py",
+        python_path,
+        "--jobs",
+        "200",
+        options=("-w", "/home/frappe/frappe-bench/sites"),
+    )
+    report = json.loads(result.output.splitlines()[-1])
+    # Throughput goes to the timing report, it's too noisy on CI to assert
+    tracer.add(
+        f"{name}: {report['jobs_per_second']} jobs/s",
+        "worker benchmark",
+        start,
+        **report,
+    )
+    return report
+
+
+@pytest.mark.usefixtures("frappe_site")
+def test_worker_pool_benchmark(compose: Compose, python_path: str):
+    # queue-long takes short jobs too, only queue-short may run them
+    compose("stop", "queue-long")
+    try:
+        fork_report = run_worker_benchmark(compose, python_path, "bench worker")
+        compose("-f", "overrides/compose.worker-pool.yaml", "up", "-d", "queue-short")
+        try:
+            pool_report = run_worker_benchmark(compose, python_path, "worker pool")
+        finally:
+            compose("up", "-d", "queue-short")
+    finally:
+        compose("start", "queue-long")
+    speedup = pool_report["jobs_per_second"] / fork_report["jobs_per_second"]
+    print(
+        f"bench worker: {fork_report}\nworker pool: {pool_report}\n"
+        f"worker pool runs {speedup:.1f}x the jobs per second"
+    )
+    for report in (fork_report, pool_report):
+        assert report["failed"] == report["timed_out"] == 0, report
+
+
+@pytest.mark.usefixtures("frappe_site")
+def test_sharded_scheduler(compose: Compose, python_path: str):
+    (result,) = compose.exec_many(
+        ("backend",),
         python_path,
-        f"/tmp/{filename}",
+        "/usr/local/bin/sharded_scheduler.py",
+        "--once",
+        "--replica",
+        "test",
     )
+    assert result.returncode == 0, result.output
+    report = json.loads(result.output[result.output.index("{") :])
+    assert report["shard"] == report["sites"] >= 1
+
+
+def get_restic_args(s3_service: S3ServiceResult, repository: str) -> list[str]:
+    return [
+        f"--env=RESTIC_REPOSITORY=s3:http://minio:9000/{repository}",
+        f"--env=AWS_ACCESS_KEY_ID={s3_service.access_key}",
+        f"--env=AWS_SECRET_ACCESS_KEY={s3_service.secret_key}",
+        "--env=RESTIC_PASSWORD=secret",
+    ]
 
 
 def test_push_backup(
@@ -126,19 +241,53 @@ def test_push_backup(
     s3_service: S3ServiceResult,
     compose: Compose,
 ):
-    restic_password = "secret"
     compose.bench("--site", frappe_site, "backup", "--with-files")
-    restic_args = [
-        "--env=RESTIC_REPOSITORY=s3:http://minio:9000/frappe",
-        f"--env=AWS_ACCESS_KEY_ID={s3_service.access_key}",
-        f"--env=AWS_SECRET_ACCESS_KEY={s3_service.secret_key}",
-        f"--env=RESTIC_PASSWORD={restic_password}",
-    ]
+    restic_args = get_restic_args(s3_service, "frappe")
     compose.exec(*restic_args, "backend", "restic", "init")
     compose.exec(*restic_args, "backend", "restic", "backup", "sites")
     compose.exec(*restic_args, "backend", "restic", "snapshots")
 
 
+def test_backup_sites(
+    frappe_site: str,
+    s3_service: S3ServiceResult,
+    compose: Compose,
+):
+    restic_args = get_restic_args(s3_service, "frappe/sites")
+    compose.exec(*restic_args, "backend", "backup_sites.py", "--init", "--with-files")
+    compose.exec(
+        *restic_args,
+        "backend",
+        "sh",
+        "-c",
+        f"restic dump --tag {frappe_site},database latest /{frappe_site}.sql.gz"
+        " | gzip --test",
+    )
+
+
+def test_restore_sites(
+    frappe_site: str,
+    s3_service: S3ServiceResult,
+    compose: Compose,
+):
+    compose.bench("--site", frappe_site, "backup", "--with-files")
+    restic_args = get_restic_args(s3_service, "frappe/restore")
+    compose.exec(*restic_args, "backend", "restic", "init")
+    compose.exec(*restic_args, "backend", "restic", "backup", "sites")
+    compose.exec(
+        *restic_args,
+        "backend",
+        "restore_sites.py",
+        "--site",
+        frappe_site,
+        "--db-root-password",
+        "123",
+    )
+    check_url_content(
+        url="http://127.0.0.1/api/method/ping", callback=api_cb, site_name=frappe_site
+    )
+
+
 def test_https(frappe_site: str, compose: Compose):
     compose("-f", "overrides/compose.https.yaml", "up", "-d")
     check_url_content(url="https://127.0.0.1", callback=index_cb, site_name=frappe_site)
@@ -0,0 +1,166 @@
+"""
+Timing tracer for the integration suite.
+
+Records the duration of every fixture setup and teardown, test call and
+`Compose` subprocess. A summary of the slowest spans is printed at the end of
+the session. With `--timing-output=trace.json` spans are also written as
+Chrome trace events (open in chrome://tracing or https://ui.perfetto.dev) and
+the full summary is written next to it as `trace.txt`.
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Iterator, Optional
+
+import pytest
+
+
+@dataclass
+class Span:
+    name: str
+    category: str
+    start: float
+    end: float
+    thread: int
+    args: dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+
+class Tracer:
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.spans: list[Span] = []
+        self.threads: dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, category: str, start: float, **args: Any) -> None:
+        thread = threading.current_thread()
+        span = Span(name, category, start, time.perf_counter(), thread.ident or 0, args)
+        with self._lock:
+            self.threads.setdefault(span.thread, thread.name)
+            self.spans.append(span)
+
+    @contextmanager
+    def span(self, name: str, category: str, **args: Any) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, category, start, **args)
+
+    def to_chrome_trace(self) -> dict[str, Any]:
+        tids = {ident: tid for tid, ident in enumerate(self.threads, 1)}
+        events: list[dict[str, Any]] = [
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": 1,
+                "tid": tids[ident],
+                "args": {"name": name},
+            }
+            for ident, name in self.threads.items()
+        ]
+        for span in sorted(self.spans, key=lambda s: s.start):
+            events.append(
+                {
+                    "name": span.name,
+                    "cat": span.category,
+                    "ph": "X",
+                    # Microseconds since start of the session
+                    "ts": round((span.start - self.origin) * 1e6),
+                    "dur": round(span.duration * 1e6),
+                    "pid": 1,
+                    "tid": tids[span.thread],
+                    "args": span.args,
+                }
+            )
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def summary(self, limit: Optional[int] = None) -> list[str]:
+        totals: dict[str, float] = {}
+        for span in self.spans:
+            totals[span.category] = totals.get(span.category, 0) + span.duration
+        lines = [
+            "Total time by category (spans nest, so categories overlap):",
+            *(
+                f"{duration:>10.2f}s  {category}"
+                for category, duration in sorted(
+                    totals.items(), key=lambda i: i[1], reverse=True
+                )
+            ),
+            "",
+            "Slowest spans:",
+        ]
+        spans = sorted(self.spans, key=lambda s: s.duration, reverse=True)
+        for span in spans[:limit]:
+            lines.append(f"{span.duration:>10.2f}s  {span.category:<18} {span.name}")
+        return lines
+
+
+tracer = Tracer()
+# Fixture teardowns that have started, by id of FixtureDef
+_teardowns: dict[int, tuple[str, dict[str, Any], float]] = {}
+
+
+def pytest_addoption(parser: pytest.Parser):
+    parser.addoption(
+        "--timing-output",
+        help="Write Chrome trace of fixtures, tests and compose calls to this file",
+    )
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_fixture_setup(fixturedef: pytest.FixtureDef, request: pytest.FixtureRequest):
+    name = fixturedef.argname
+    if fixturedef.params is not None:
+        name += f"[{request.param}]"
+    args = {"scope": fixturedef.scope, "node": request.node.nodeid}
+    with tracer.span(name, "fixture setup", **args):
+        yield
+
+    # Finalizers run in reverse order, so this one runs right before
+    # the fixture's own teardown, pytest_fixture_post_finalizer right after.
+    def start_teardown():
+        _teardowns[id(fixturedef)] = (name, args, time.perf_counter())
+
+    fixturedef.addfinalizer(start_teardown)
+
+
+def pytest_fixture_post_finalizer(fixturedef: pytest.FixtureDef):
+    state = _teardowns.pop(id(fixturedef), None)
+    if state:
+        name, args, start = state
+        tracer.add(name, "fixture teardown", start, **args)
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_call(item: pytest.Item):
+    with tracer.span(item.nodeid, "test call"):
+        yield
+
+
+def pytest_terminal_summary(
+    terminalreporter: pytest.TerminalReporter, config: pytest.Config
+):
+    if not tracer.spans:
+        return
+    terminalreporter.section("timing")
+    for line in tracer.summary(limit=15):
+        terminalreporter.write_line(line)
+
+    output = config.getoption("timing_output")
+    if output:
+        with open(output, "w") as f:
+            json.dump(tracer.to_chrome_trace(), f)
+        summary_path = os.path.splitext(output)[0] + ".txt"
+        with open(summary_path, "w") as f:
+            f.write("\n".join(tracer.summary()) + "\n")
+        terminalreporter.write_line(f"Timing trace written to {output}")
+        terminalreporter.write_line(f"Timing summary written to {summary_path}")
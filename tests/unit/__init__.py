@@ -0,0 +1,39 @@
+import importlib.util
+import os
+import subprocess
+import sys
+from pathlib import Path
+from types import ModuleType
+
+ROOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")
+
+
+def import_script(path: str) -> ModuleType:
+    """Import a script of the repository that isn't part of a package."""
+    path = os.path.join(ROOT_PATH, path)
+    # Scripts import their neighbours, like they do in /usr/local/bin
+    directory = os.path.dirname(os.path.abspath(path))
+    if directory not in sys.path:
+        sys.path.insert(0, directory)
+    name = os.path.splitext(os.path.basename(path))[0]
+    spec = importlib.util.spec_from_file_location(name, path)
+    assert spec and spec.loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def git(*args: str, cwd: Path) -> str:
+    return subprocess.check_output(
+        ("git", "-c", "user.name=test", "-c", "user.email=test@localhost", *args),
+        cwd=cwd,
+        text=True,
+        stderr=subprocess.STDOUT,
+    ).strip()
+
+
+def commit(repo: Path, name: str) -> None:
+    (repo / name).write_text(name)
+    git("add", name, cwd=repo)
+    git("commit", "--quiet", "-m", name, cwd=repo)
@@ -0,0 +1,30 @@
+from pathlib import Path
+
+import pytest
+
+from tests.unit import commit, git
+
+
+@pytest.fixture(autouse=True, scope="session")
+def frappe_setup():
+    # Unit tests don't need the compose stack of tests/conftest.py
+    yield
+
+
+@pytest.fixture
+def make_bare_repo(tmp_path: Path):
+    """Create a bare repository with commits and tags, served from disk."""
+
+    def make(path: Path, commits: int = 1, tags: tuple[str, ...] = ()) -> Path:
+        work = tmp_path / f".work-{path.name}"
+        work.mkdir()
+        git("init", "--quiet", "--initial-branch=main", cwd=work)
+        for i in range(commits):
+            commit(work, f"file{i}")
+        for tag in tags:
+            git("tag", tag, cwd=work)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        git("clone", "--quiet", "--bare", str(work), str(path), cwd=tmp_path)
+        return work
+
+    return make
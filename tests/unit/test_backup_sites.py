@@ -0,0 +1,30 @@
+import os
+
+import pytest
+
+from tests.unit import import_script
+
+backup_sites = import_script("resources/core/backup_sites.py")
+
+
+def open_fds() -> int:
+    return len(os.listdir("/proc/self/fd"))
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc/self/fd"), reason="needs procfs")
+def test_run_pipeline_closes_files():
+    before = open_fds()
+    pipeline = [(("printf", "a\\nb\\n"), None), (("sort", "-r"), None)]
+    assert backup_sites.run_pipeline(pipeline) == "b\na\n"
+    assert open_fds() == before
+
+    pipeline = [(("sh", "-c", "echo broken >&2; exit 3"), None), (("cat",), None)]
+    with pytest.raises(backup_sites.PipelineError) as exc_info:
+        backup_sites.run_pipeline(pipeline)
+    assert exc_info.value.returncode == 3
+    assert exc_info.value.stderr == "broken\n"
+    assert open_fds() == before
+
+    with pytest.raises(FileNotFoundError):
+        backup_sites.run_pipeline([(("printf", "a"), None), (("missing-cmd",), None)])
+    assert open_fds() == before
@@ -0,0 +1,45 @@
+import asyncio
+
+from tests.unit import import_script
+
+check_connections = import_script("resources/core/check_connections.py")
+
+
+def mysql_packet(payload: bytes) -> bytes:
+    return len(payload).to_bytes(3, "little") + b"\0" + payload
+
+
+async def probe_mysql(*greetings: bytes):
+    replies = list(greetings)
+
+    async def greet(_reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        writer.write(mysql_packet(replies.pop(0)))
+        await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(greet, "127.0.0.1", 0)
+    async with server:
+        port = server.sockets[0].getsockname()[1]
+        dep = check_connections.Dependency("db", "mysql", "127.0.0.1", port)
+        return await check_connections.probe_dependency(
+            dep, timeout=5, base_delay=0.01, max_delay=0.01
+        )
+
+
+def test_mysql_greeting():
+    result = asyncio.run(probe_mysql(b"\x0a10.6.16-MariaDB\0"))
+    assert result.ready
+    assert result.attempts == 1
+
+
+def test_mysql_empty_greeting_is_retried():
+    result = asyncio.run(probe_mysql(b"", b"\x0a10.6.16-MariaDB\0"))
+    assert result.ready
+    assert result.attempts == 2
+
+
+def test_mysql_error_packet_is_retried():
+    error = b"\xff\x69\x04#HY000Host is blocked"
+    result = asyncio.run(probe_mysql(error, error, b"\x0a10.6.16-MariaDB\0"))
+    assert result.ready
+    assert result.attempts == 3
@@ -0,0 +1,118 @@
+import json
+import stat
+import sys
+from pathlib import Path
+
+import pytest
+
+from tests.utils import Compose, ExecError
+
+# Stand-in for `docker`. `compose config --output` writes a rendered file,
+# `compose exec` waits until every service of the call has started, then
+# fails in services named bad-*.
+DOCKER = """\
+#!{python}
+import json, os, sys, time
+
+args = sys.argv[1:]
+with open({calls!r}, "a") as f:
+    f.write(json.dumps(args) + "\\n")
+if "config" in args:
+    with open(args[args.index("--output") + 1], "w") as f:
+        f.write("services: {{}}\\n")
+elif "exec" in args:
+    service = args[args.index("-T") + 1]
+    open(os.path.join({started!r}, service), "w").close()
+    deadline = time.monotonic() + 5
+    while len(os.listdir({started!r})) < int(os.environ.get("SERVICES", 1)):
+        if time.monotonic() > deadline:
+            print("services didn't run concurrently")
+            sys.exit(3)
+        time.sleep(0.01)
+    print(f"output of {{service}}")
+    sys.exit(2 if service.startswith("bad-") else 0)
+"""
+
+
+@pytest.fixture
+def calls_path(tmp_path: Path) -> Path:
+    return tmp_path / "calls.jsonl"
+
+
+@pytest.fixture
+def compose(tmp_path: Path, calls_path: Path) -> Compose:
+    started = tmp_path / "started"
+    started.mkdir()
+    docker = tmp_path / "docker"
+    docker.write_text(
+        DOCKER.format(
+            python=sys.executable, calls=str(calls_path), started=str(started)
+        )
+    )
+    docker.chmod(docker.stat().st_mode | stat.S_IEXEC)
+    env_file = tmp_path / "test.env"
+    env_file.touch()
+    return Compose("test", str(env_file), docker=str(docker))
+
+
+def read_calls(calls_path: Path) -> list[list[str]]:
+    return [json.loads(line) for line in calls_path.read_text().splitlines()]
+
+
+def test_config_rendered_once_per_file_set(compose: Compose, calls_path: Path):
+    compose("ps")
+    compose("ps")
+    compose("-f", "overrides/compose.https.yaml", "up", "-d")
+    compose("-f", "overrides/compose.https.yaml", "ps")
+
+    calls = read_calls(calls_path)
+    configs = [c for c in calls if "config" in c]
+    assert len(configs) == 2
+    assert "overrides/compose.https.yaml" not in configs[0]
+    assert configs[1][-5:-3] == ["-f", "overrides/compose.https.yaml"]
+
+    # Later calls use the rendered file instead of the compose files
+    default, https = (c[c.index("--output") + 1] for c in configs)
+    commands = [c[c.index("-f") :] for c in calls if "config" not in c]
+    assert commands == [
+        ["-f", default, "ps"],
+        ["-f", default, "ps"],
+        ["-f", https, "up", "-d"],
+        ["-f", https, "ps"],
+    ]
+
+
+def test_exec_many_runs_services_concurrently(
+    compose: Compose, monkeypatch: pytest.MonkeyPatch
+):
+    services = ("backend", "queue-short", "queue-long", "scheduler")
+    monkeypatch.setenv("SERVICES", str(len(services)))
+    results = compose.exec_many(services, "true")
+    assert [r.service for r in results] == list(services)
+    for result in results:
+        assert result.returncode == 0
+        assert result.output == f"output of {result.service}\n"
+
+
+def test_exec_many_reports_every_failed_service(
+    compose: Compose, monkeypatch: pytest.MonkeyPatch
+):
+    services = ("backend", "bad-1", "scheduler", "bad-2")
+    monkeypatch.setenv("SERVICES", str(len(services)))
+    with pytest.raises(ExecError) as exc_info:
+        compose.exec_many(services, "true")
+    assert [(r.service, r.returncode) for r in exc_info.value.results] == [
+        ("bad-1", 2),
+        ("bad-2", 2),
+    ]
+    assert str(exc_info.value) == "Command failed in bad-1 (2), bad-2 (2)"
+
+
+def test_run_script_copies_then_runs(compose: Compose, calls_path: Path):
+    (result,) = compose.run_script(("backend",), "tests/_check.py", "python")
+    calls = [c for c in read_calls(calls_path) if "config" not in c]
+    assert [c[c.index("-f") + 2 :] for c in calls] == [
+        ["cp", "tests/_check.py", "backend:/tmp/"],
+        ["exec", "-T", "backend", "python", "/tmp/_check.py"],
+    ]
+    assert result.returncode == 0
@@ -0,0 +1,133 @@
+import json
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from tests.unit import import_script
+
+get_latest_tags = import_script(".github/scripts/get_latest_tags.py")
+
+TAGS = {
+    "frappe": ("v15.1.0", "v15.10.0", "v15.2.0", "v16.0.0-beta.1", "v16.0.0"),
+    "erpnext": ("v15.3.1", "v15.20.0", "v16.0.0-beta.2"),
+}
+
+
+@pytest.fixture
+def remote_base(tmp_path: Path, make_bare_repo) -> Path:
+    base = tmp_path / "remote"
+    for repo, tags in TAGS.items():
+        make_bare_repo(base / repo, tags=tags)
+    return base
+
+
+@pytest.fixture
+def cache_dir(tmp_path: Path) -> Path:
+    return tmp_path / "cache"
+
+
+def count_listings(monkeypatch: pytest.MonkeyPatch) -> list[str]:
+    urls: list[str] = []
+    list_refs = get_latest_tags.RefsCache.list_refs
+
+    def counting_list_refs(self, url: str) -> list[str]:
+        urls.append(url)
+        return list_refs(self, url)
+
+    monkeypatch.setattr(get_latest_tags.RefsCache, "list_refs", counting_list_refs)
+    return urls
+
+
+def test_resolve_matrix(
+    remote_base: Path, cache_dir: Path, monkeypatch: pytest.MonkeyPatch
+):
+    urls = count_listings(monkeypatch)
+    cache = get_latest_tags.RefsCache(str(remote_base), str(cache_dir), ttl=0)
+    matrix = get_latest_tags.resolve_matrix(["erpnext"], ["15", "16", "develop"], cache)
+    assert matrix == {
+        # Version order, not string order
+        "15": {"frappe": "v15.10.0", "erpnext": "v15.20.0"},
+        # Releases sort after their pre-releases
+        "16": {"frappe": "v16.0.0", "erpnext": "v16.0.0-beta.2"},
+        "develop": {"frappe": "develop", "erpnext": "develop"},
+    }
+    # Every repository is listed once for all versions
+    assert sorted(urls) == [f"{remote_base}/erpnext", f"{remote_base}/frappe"]
+
+
+def test_frappe_only(remote_base: Path, cache_dir: Path):
+    cache = get_latest_tags.RefsCache(str(remote_base), str(cache_dir), ttl=0)
+    matrix = get_latest_tags.resolve_matrix(["frappe"], ["15"], cache)
+    assert matrix == {"15": {"frappe": "v15.10.0", "erpnext": None}}
+
+
+def test_cache_reused_within_ttl(
+    remote_base: Path, cache_dir: Path, monkeypatch: pytest.MonkeyPatch
+):
+    get_latest_tags.RefsCache(str(remote_base), str(cache_dir), ttl=600).get("frappe")
+    shutil.rmtree(remote_base)
+
+    # A later invocation doesn't list the remote again
+    urls = count_listings(monkeypatch)
+    cache = get_latest_tags.RefsCache(str(remote_base), str(cache_dir), ttl=600)
+    assert get_latest_tags.get_latest_tag("frappe", "15", cache) == "v15.10.0"
+    assert urls == []
+
+
+def test_cache_expires(remote_base: Path, cache_dir: Path):
+    cache = get_latest_tags.RefsCache(str(remote_base), str(cache_dir), ttl=600)
+    cache.get("frappe")
+    (path,) = cache_dir.iterdir()
+    data = json.loads(path.read_text())
+    data["fetched_at"] -= 601
+    path.write_text(json.dumps(data))
+    shutil.rmtree(remote_base)
+
+    cache = get_latest_tags.RefsCache(str(remote_base), str(cache_dir), ttl=600)
+    with pytest.raises(subprocess.CalledProcessError):
+        cache.get("frappe")
+
+
+def test_cache_disabled(remote_base: Path, cache_dir: Path):
+    get_latest_tags.RefsCache(str(remote_base), str(cache_dir), ttl=0).get("frappe")
+    assert not cache_dir.exists()
+
+
+def test_main_matrix_output(
+    remote_base: Path,
+    cache_dir: Path,
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    capsys: pytest.CaptureFixture[str],
+):
+    output = tmp_path / "github_output"
+    monkeypatch.setenv("GITHUB_OUTPUT", str(output))
+    args = ["--repo", "erpnext", "--version", "15", "--version", "16"]
+    args += ["--remote-base", str(remote_base), "--cache-dir", str(cache_dir)]
+    assert get_latest_tags.main(args) == 0
+
+    expected = {
+        "15": {"frappe": "v15.10.0", "erpnext": "v15.20.0"},
+        "16": {"frappe": "v16.0.0", "erpnext": "v16.0.0-beta.2"},
+    }
+    assert output.read_text() == f"matrix={json.dumps(expected)}\n"
+    assert json.loads(capsys.readouterr().out) == expected
+
+
+def test_main_single_version_output(
+    remote_base: Path,
+    cache_dir: Path,
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    output, env = tmp_path / "github_output", tmp_path / "github_env"
+    monkeypatch.setenv("GITHUB_OUTPUT", str(output))
+    monkeypatch.setenv("GITHUB_ENV", str(env))
+    args = ["--repo", "erpnext", "--version", "15"]
+    args += ["--remote-base", str(remote_base), "--cache-dir", str(cache_dir)]
+    assert get_latest_tags.main(args) == 0
+
+    assert output.read_text() == "frappe_version=v15.10.0\nerpnext_version=v15.20.0\n"
+    assert env.read_text() == "\nFRAPPE_VERSION=v15.10.0\nERPNEXT_VERSION=v15.20.0"
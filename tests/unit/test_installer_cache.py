@@ -0,0 +1,109 @@
+import os
+import stat
+import subprocess
+from argparse import Namespace
+from pathlib import Path
+
+import pytest
+
+from tests.unit import commit, git, import_script
+
+installer = import_script("development/installer.py")
+
+# Never resolved, clones only work through the mirror
+FRAPPE_URL = "https://git.invalid/frappe/frappe"
+APP_URL = "https://git.invalid/frappe/payments.git"
+
+
+@pytest.fixture
+def args(tmp_path: Path) -> Namespace:
+    return Namespace(
+        frappe_repo=FRAPPE_URL,
+        cache_dir=str(tmp_path / "cache"),
+        bench_name="frappe-bench",
+        jobs=2,
+    )
+
+
+def clone(args: Namespace, url: str, dest: Path) -> None:
+    env = {**os.environ, **installer.get_cache_env(args, [{"url": APP_URL}])}
+    subprocess.check_call(
+        ("git", "clone", "--quiet", "--depth", "1", url, str(dest)), env=env
+    )
+
+
+def test_get_mirror_path(args: Namespace):
+    git_path = os.path.join(os.path.abspath(args.cache_dir), "git")
+    assert installer.get_mirror_path(args.cache_dir, FRAPPE_URL) == os.path.join(
+        git_path, "git.invalid_frappe_frappe.git"
+    )
+    # Same mirror with or without .git and trailing slash
+    assert installer.get_mirror_path(
+        args.cache_dir, APP_URL
+    ) == installer.get_mirror_path(args.cache_dir, APP_URL[:-4] + "/")
+
+
+def test_clone_from_mirror_is_shallow(args: Namespace, tmp_path: Path, make_bare_repo):
+    upstream = tmp_path / "upstream.git"
+    make_bare_repo(upstream, commits=3)
+    installer.update_mirror(
+        str(upstream), installer.get_mirror_path(args.cache_dir, FRAPPE_URL)
+    )
+
+    dest = tmp_path / "frappe"
+    clone(args, FRAPPE_URL, dest)
+    assert git("rev-parse", "--is-shallow-repository", cwd=dest) == "true"
+    assert git("rev-list", "--count", "HEAD", cwd=dest) == "1"
+
+
+def test_update_mirror_fetches_new_commits(
+    args: Namespace, tmp_path: Path, make_bare_repo
+):
+    upstream = tmp_path / "upstream.git"
+    work = make_bare_repo(upstream)
+    mirror_path = installer.get_mirror_path(args.cache_dir, APP_URL)
+    installer.update_mirror(str(upstream), mirror_path)
+
+    commit(work, "new")
+    git("push", "--quiet", str(upstream), "main", cwd=work)
+    installer.update_mirror(str(upstream), mirror_path)
+
+    dest = tmp_path / "payments"
+    clone(args, APP_URL, dest)
+    assert git("log", "-1", "--format=%s", cwd=dest) == "new"
+
+
+def test_cache_env_shares_wheelhouse(args: Namespace):
+    env = installer.get_cache_env(args, [])
+    wheelhouse = installer.get_wheelhouse_path(args.cache_dir)
+    assert os.path.isdir(wheelhouse)
+    assert env["PIP_FIND_LINKS"] == env["UV_FIND_LINKS"] == wheelhouse
+    # Later runs find the wheels of earlier ones
+    assert installer.get_cache_env(args, []) == env
+
+
+def test_cache_wheels(args: Namespace, tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    bench_path = tmp_path / args.bench_name
+    (bench_path / "logs").mkdir(parents=True)
+    python = bench_path / "env" / "bin" / "python"
+    python.parent.mkdir(parents=True)
+    calls = tmp_path / "calls.txt"
+    # Stand-in for the bench Python, pip freeze prints one requirement
+    python.write_text(
+        "#!/bin/sh\n"
+        f'echo "$*" >> {calls}\n'
+        'if [ "$3" = freeze ]; then echo "six==1.16.0"; fi\n'
+    )
+    python.chmod(python.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.chdir(tmp_path)
+
+    installer.cache_wheels(args)
+
+    wheelhouse = installer.get_wheelhouse_path(args.cache_dir)
+    requirements = bench_path / "logs" / "cached-requirements.txt"
+    assert requirements.read_text() == "six==1.16.0\n"
+    freeze, wheel = calls.read_text().splitlines()
+    assert freeze == "-m pip freeze --exclude-editable"
+    assert f"--wheel-dir={wheelhouse}" in wheel.split()
+    assert f"--find-links={wheelhouse}" in wheel.split()
+    assert f"--requirement={requirements}" in wheel.split()
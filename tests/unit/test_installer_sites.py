@@ -0,0 +1,81 @@
+import stat
+from argparse import Namespace
+from pathlib import Path
+
+import pytest
+
+from tests.unit import import_script
+
+installer = import_script("development/installer.py")
+
+# Stand-in for `bench new-site`, like bench it refuses existing sites without
+# --force and leaves the site directory behind when it fails
+BENCH = """\
+#!/bin/sh
+echo "$*" >> {calls}
+site=$(eval echo \\${{$#}})
+[ "$site" = --force ] && site=$(eval echo \\${{$(($# - 1))}})
+case " $* " in
+  *" --force "*) ;;
+  *) [ -d "sites/$site" ] && echo "Site $site already exists" && exit 1 ;;
+esac
+mkdir -p "sites/$site"
+echo "creating $site"
+[ -e {fail} ] && echo "installing apps failed" && exit 1
+exit 0
+"""
+
+
+@pytest.fixture
+def bench_path(tmp_path: Path) -> Path:
+    path = tmp_path / "frappe-bench"
+    (path / "sites").mkdir(parents=True)
+    return path
+
+
+@pytest.fixture
+def new_site_cmd(tmp_path: Path) -> list:
+    bench = tmp_path / "bench"
+    bench.write_text(BENCH.format(calls=tmp_path / "calls.txt", fail=tmp_path / "fail"))
+    bench.chmod(bench.stat().st_mode | stat.S_IEXEC)
+    return [str(bench), "new-site", "--admin-password=admin"]
+
+
+def read_calls(tmp_path: Path) -> list[str]:
+    return (tmp_path / "calls.txt").read_text().splitlines()
+
+
+def test_single_site_is_logged_and_retried(
+    tmp_path: Path,
+    bench_path: Path,
+    new_site_cmd: list,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    monkeypatch.setattr(installer, "get_new_site_cmd", lambda args: new_site_cmd)
+    args = Namespace(
+        from_template=False, site_name=["one.localhost"], sites_file=None, jobs=1
+    )
+    log_path = bench_path / "logs" / "new-site-one.localhost.log"
+
+    (tmp_path / "fail").touch()
+    assert not installer.create_sites(args, installer.InstallerState(str(bench_path)))
+    assert log_path.read_text() == "creating one.localhost\ninstalling apps failed\n"
+
+    # Rerun recreates the site the failed attempt left behind
+    (tmp_path / "fail").unlink()
+    state = installer.InstallerState(str(bench_path))
+    assert installer.create_sites(args, state)
+    assert state.is_done("new-site:one.localhost")
+    assert log_path.read_text() == "creating one.localhost\n"
+    assert read_calls(tmp_path) == [
+        "new-site --admin-password=admin one.localhost",
+        "new-site --admin-password=admin one.localhost --force",
+    ]
+
+
+def test_new_site_without_leftover(
+    tmp_path: Path, bench_path: Path, new_site_cmd: list
+):
+    (bench_path / "logs").mkdir()
+    installer.create_site(new_site_cmd, "two.localhost", str(bench_path))
+    assert read_calls(tmp_path) == ["new-site --admin-password=admin two.localhost"]
@@ -0,0 +1,212 @@
+import json
+import signal
+import socket
+import socketserver
+import sys
+import threading
+from argparse import Namespace
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Iterator
+
+import pytest
+
+from tests.unit import import_script
+
+worker_autoscaler = import_script("resources/core/worker_autoscaler.py")
+
+# Stand-in for `bench worker`, exits on SIGTERM
+WORKER_COMMAND = [sys.executable, "-c", "import time; time.sleep(60)"]
+
+
+class FakeRedis(socketserver.ThreadingTCPServer):
+    """Serves the RESP commands of the autoscaler from in-memory data."""
+
+    daemon_threads = True
+
+    def __init__(self) -> None:
+        super().__init__(("127.0.0.1", 0), FakeRedisHandler)
+        self.lists: dict[str, list[str]] = {}
+        self.hashes: dict[str, dict[str, str]] = {}
+        self.sets: dict[str, set[str]] = {}
+
+    def execute(self, name: str, *args: str) -> Any:
+        if name == "LLEN":
+            return len(self.lists.get(args[0], ()))
+        if name == "LINDEX":
+            items = self.lists.get(args[0], [])
+            return items[int(args[1])] if items else None
+        if name == "HGET":
+            return self.hashes.get(args[0], {}).get(args[1])
+        if name == "HMGET":
+            return [self.hashes.get(args[0], {}).get(f) for f in args[1:]]
+        if name == "SMEMBERS":
+            return sorted(self.sets.get(args[0], ()))
+        raise ValueError(f"Unknown command {name}")
+
+
+class FakeRedisHandler(socketserver.StreamRequestHandler):
+    server: FakeRedis
+
+    def handle(self) -> None:
+        while line := self.rfile.readline():
+            args = []
+            for _ in range(int(line[1:])):
+                length = int(self.rfile.readline()[1:])
+                args.append(self.rfile.read(length + 2)[:-2].decode())
+            self.wfile.write(encode(self.server.execute(*args)))
+
+
+def encode(value: Any) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, list):
+        return b"*%d\r\n" % len(value) + b"".join(encode(v) for v in value)
+    return b"$%d\r\n%s\r\n" % (len(value.encode()), value.encode())
+
+
+def enqueue(redis: FakeRedis, key: str, job_id: str, age: float) -> None:
+    enqueued_at = datetime.now(timezone.utc) - timedelta(seconds=age)
+    redis.lists.setdefault(key, []).append(job_id)
+    redis.hashes[f"rq:job:{job_id}"] = {
+        "enqueued_at": enqueued_at.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+    }
+
+
+@pytest.fixture
+def redis() -> Iterator[FakeRedis]:
+    server = FakeRedis()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def autoscaler(redis: FakeRedis, tmp_path: Path) -> Iterator[Any]:
+    host, port = redis.server_address
+    config = tmp_path / "common_site_config.json"
+    config.write_text(
+        json.dumps({"redis_queue": f"redis://{host}:{port}", "bench_id": "bench"})
+    )
+    args = Namespace(
+        config=str(config),
+        bench_path=str(tmp_path),
+        worker_command=WORKER_COMMAND,
+        jobs_per_worker=10,
+        max_job_age=60,
+        up_cooldown=30,
+        down_cooldown=300,
+    )
+    pool = worker_autoscaler.Pool.parse("short=short,default:0:4")
+    autoscaler = worker_autoscaler.Autoscaler(args, [pool])
+    yield autoscaler
+    for worker in pool.workers + pool.draining:
+        worker.kill()
+        worker.wait()
+    autoscaler.redis.close()
+
+
+def set_stats(autoscaler: Any, depth: int, oldest_age: float = 0) -> None:
+    autoscaler.stats = {
+        queue: worker_autoscaler.QueueStats() for queue in worker_autoscaler.QUEUE_TYPES
+    }
+    autoscaler.stats["short"] = worker_autoscaler.QueueStats(depth, oldest_age)
+
+
+def test_read_queue_stats(redis: FakeRedis):
+    # Frappe v15+ prefixes queues with the bench id, older jobs may remain
+    enqueue(redis, "rq:queue:bench:short", "a", age=5)
+    enqueue(redis, "rq:queue:bench:short", "b", age=1)
+    enqueue(redis, "rq:queue:short", "c", age=120)
+    enqueue(redis, "rq:queue:bench:long", "d", age=30)
+
+    host, port = redis.server_address
+    client = worker_autoscaler.RedisClient(f"{host}:{port}")
+    try:
+        stats = worker_autoscaler.read_queue_stats(client, "bench")
+    finally:
+        client.close()
+
+    assert {q: s.depth for q, s in stats.items()} == {
+        "short": 3,
+        "default": 0,
+        "long": 1,
+    }
+    assert stats["short"].oldest_age == pytest.approx(120, abs=5)
+    assert stats["long"].oldest_age == pytest.approx(30, abs=5)
+    assert stats["default"].oldest_age == 0
+
+
+def test_get_desired(autoscaler: Any):
+    (pool,) = autoscaler.pools
+    set_stats(autoscaler, depth=25)
+    assert autoscaler.get_desired(pool) == 3
+    set_stats(autoscaler, depth=100)
+    assert autoscaler.get_desired(pool) == pool.max_workers
+
+    pool.min_workers = 1
+    set_stats(autoscaler, depth=0)
+    assert autoscaler.get_desired(pool) == 1
+
+    # Old jobs add a worker although the backlog is covered
+    pool.workers = [None, None]
+    set_stats(autoscaler, depth=5, oldest_age=61)
+    assert autoscaler.get_desired(pool) == 3
+    pool.workers = []
+
+
+def test_scale_cooldowns(autoscaler: Any):
+    (pool,) = autoscaler.pools
+    set_stats(autoscaler, depth=30)
+    autoscaler.scale(pool, now=100)
+    assert len(pool.workers) == 3
+
+    # No more workers before the up cooldown passed
+    set_stats(autoscaler, depth=40)
+    autoscaler.scale(pool, now=110)
+    assert len(pool.workers) == 3
+    autoscaler.scale(pool, now=130)
+    assert len(pool.workers) == 4
+
+    # Surplus workers are drained one at a time after the down cooldown
+    set_stats(autoscaler, depth=0)
+    autoscaler.scale(pool, now=400)
+    assert len(pool.workers) == 4
+    autoscaler.scale(pool, now=430)
+    assert (len(pool.workers), len(pool.draining)) == (3, 1)
+    autoscaler.scale(pool, now=500)
+    assert len(pool.workers) == 3
+    assert pool.scale_events == {"up": 2, "down": 1, "crashed": 0}
+
+
+def test_drain_idle_worker_first(autoscaler: Any, redis: FakeRedis):
+    (pool,) = autoscaler.pools
+    for _ in range(3):
+        autoscaler.start_worker(pool)
+    first, idle, newest = pool.workers
+    redis.sets["rq:workers"] = {"rq:worker:busy", "rq:worker:idle"}
+    hostname = socket.gethostname()
+    redis.hashes["rq:worker:busy"] = {
+        "pid": str(first.pid),
+        "hostname": hostname,
+        "state": "busy",
+    }
+    redis.hashes["rq:worker:idle"] = {
+        "pid": str(idle.pid),
+        "hostname": hostname,
+        "state": "idle",
+    }
+
+    autoscaler.drain_worker(pool)
+    assert pool.workers == [first, newest]
+    assert pool.draining == [idle]
+    assert idle.wait(5) == -signal.SIGTERM
+
+    # Without idle workers the newest one is drained
+    autoscaler.drain_worker(pool)
+    assert pool.workers == [first]
+    assert pool.draining == [idle, newest]
+    assert newest.wait(5) == -signal.SIGTERM
@@ -1,45 +1,118 @@
+import hashlib
+import io
 import os
+import shlex
+import shutil
 import ssl
 import subprocess
 import sys
+import tempfile
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import suppress
-from http.client import HTTPResponse
-from typing import Callable, Optional
-from urllib.error import HTTPError, URLError
-from urllib.request import Request, urlopen
+from dataclasses import dataclass
+from http.client import HTTPConnection, HTTPException, HTTPMessage, HTTPSConnection
+from typing import Any, Callable, Iterable, Optional, Sequence, Tuple
+from urllib.error import HTTPError
+from urllib.parse import urljoin, urlsplit
+
+from tests.timing import tracer
 
 CI = os.getenv("CI")
 
 
+@dataclass
+class ExecResult:
+    service: str
+    returncode: int
+    output: str
+    duration: float
+
+
+class ExecError(Exception):
+    def __init__(self, results: list[ExecResult]):
+        self.results = results
+        failed = ", ".join(f"{r.service} ({r.returncode})" for r in results)
+        super().__init__(f"Command failed in {failed}")
+
+
 class Compose:
-    def __init__(self, project_name: str, env_file: str):
+    """
+    Wrapper around `docker compose` for the test project.
+
+    Compose files are merged and rendered with `docker compose config` once per
+    set of files, later calls only parse the rendered file. Commands that
+    should run in several services are run concurrently.
+    """
+
+    def __init__(self, project_name: str, env_file: str, docker: str = "docker"):
         self.project_name = project_name
+        self.env_file = env_file
         self.base_cmd = (
-            "docker",
+            docker,
             "compose",
             "-p",
             project_name,
             "--env-file",
             env_file,
         )
+        self.configs: dict[Tuple[str, ...], str] = {}
+        self._lock = threading.Lock()
+
+    def get_config(self, extra_files: Tuple[str, ...] = ()) -> str:
+        with self._lock:
+            if extra_files not in self.configs:
+                file_args = [
+                    "-f",
+                    "compose.yaml",
+                    "-f",
+                    "overrides/compose.proxy.yaml",
+                    "-f",
+                    "overrides/compose.mariadb.yaml",
+                    "-f",
+                    "overrides/compose.redis.yaml",
+                ]
+                if CI:
+                    file_args += ("-f", "tests/compose.ci.yaml")
+                for file in extra_files:
+                    file_args += ("-f", file)
+
+                fd, path = tempfile.mkstemp(
+                    prefix="compose.",
+                    suffix=".yaml",
+                    dir=os.path.dirname(os.path.abspath(self.env_file)),
+                )
+                os.close(fd)
+                self._run(
+                    ("config", *file_args[1::2]),
+                    self.base_cmd + tuple(file_args) + ("config", "--output", path),
+                    check=True,
+                )
+                self.configs[extra_files] = path
+            return self.configs[extra_files]
+
+    def _run(
+        self, cmd: Sequence[str], args: Sequence[str], **kwargs: Any
+    ) -> subprocess.CompletedProcess:
+        with tracer.span(shlex.join(("compose", *cmd)), "compose"):
+            return subprocess.run(args, **kwargs)
+
+    def get_args(self, cmd: Sequence[str]) -> Tuple[str, ...]:
+        # Leading `-f <file>` pairs add compose files on top of the default ones
+        extra_files: list[str] = []
+        while len(cmd) >= 2 and cmd[0] == "-f":
+            extra_files.append(cmd[1])
+            cmd = cmd[2:]
+        return self.base_cmd + ("-f", self.get_config(tuple(extra_files))) + tuple(cmd)
 
     def __call__(self, *cmd: str) -> None:
-        file_args = [
-            "-f",
-            "compose.yaml",
-            "-f",
-            "overrides/compose.proxy.yaml",
-            "-f",
-            "overrides/compose.mariadb.yaml",
-            "-f",
-            "overrides/compose.redis.yaml",
-        ]
-        if CI:
-            file_args += ("-f", "tests/compose.ci.yaml")
-
-        args = self.base_cmd + tuple(file_args) + cmd
-        subprocess.check_call(args)
+        self._run(cmd, self.get_args(cmd), check=True)
+
+    def output(self, *cmd: str) -> str:
+        return self._run(
+            cmd, self.get_args(cmd), check=True, stdout=subprocess.PIPE, text=True
+        ).stdout
 
     def exec(self, *cmd: str) -> None:
         if sys.stdout.isatty():
@@ -51,18 +124,335 @@ class Compose:
         # Stop all containers in `test` project if they are running.
         # We don't care if it fails.
         with suppress(subprocess.CalledProcessError):
-            subprocess.check_call(self.base_cmd + ("down", "-v", "--remove-orphans"))
+            cmd = ("down", "-v", "--remove-orphans")
+            self._run(cmd, self.base_cmd + cmd, check=True)
 
     def bench(self, *cmd: str) -> None:
         self.exec("backend", "bench", *cmd)
 
+    def bench_batch(self, *commands: Sequence[str], service: str = "backend") -> None:
+        """Run several bench commands in one exec session, stop on first failure."""
+        script = "\n".join(shlex.join(("bench", *cmd)) for cmd in commands)
+        self.exec(service, "sh", "-ec", script)
+
+    def _run_captured(self, service: str, calls: Iterable[Sequence[str]]) -> ExecResult:
+        start = time.monotonic()
+        output = []
+        returncode = 0
+        for cmd in calls:
+            proc = self._run(
+                cmd,
+                self.get_args(cmd),
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                encoding="utf-8",
+                errors="replace",
+            )
+            output.append(proc.stdout)
+            returncode = proc.returncode
+            if returncode:
+                break
+        return ExecResult(
+            service=service,
+            returncode=returncode,
+            output="".join(output),
+            duration=time.monotonic() - start,
+        )
+
+    def run_in_services(
+        self,
+        services: Iterable[str],
+        get_calls: Callable[[str], Iterable[Sequence[str]]],
+    ) -> list[ExecResult]:
+        """
+        Run compose commands returned by `get_calls` for every service.
+
+        Commands for one service run in order, services run concurrently.
+        Output is printed per service once all of them finish. Raises
+        ExecError listing every service that failed.
+        """
+        services = list(services)
+        with ThreadPoolExecutor(max_workers=len(services) or 1) as executor:
+            results = list(
+                executor.map(lambda s: self._run_captured(s, get_calls(s)), services)
+            )
+
+        for result in results:
+            for line in result.output.splitlines():
+                print(f"{result.service} | {line}")
+            print(
+                f"{result.service}: exit code {result.returncode} "
+                f"in {result.duration:.2f}s"
+            )
+        failed = [r for r in results if r.returncode]
+        if failed:
+            raise ExecError(failed)
+        return results
+
+    def exec_many(
+        self, services: Iterable[str], *cmd: str, options: Sequence[str] = ()
+    ) -> list[ExecResult]:
+        return self.run_in_services(
+            services, lambda s: [("exec", "-T", *options, s, *cmd)]
+        )
+
+    def run_script(
+        self,
+        services: Iterable[str],
+        script: str,
+        *cmd: str,
+        options: Sequence[str] = (),
+    ) -> list[ExecResult]:
+        """Copy `script` to /tmp of every service and run it with `cmd`."""
+        path = f"/tmp/{os.path.basename(script)}"
+        return self.run_in_services(
+            services,
+            lambda s: [
+                ("cp", script, f"{s}:/tmp/"),
+                ("exec", "-T", *options, s, *cmd[:1], path, *cmd[1:]),
+            ],
+        )
+
+
+class VolumeSnapshots:
+    """
+    Tar snapshots of the `db-data` and `sites` volumes.
+
+    Snapshots are taken and restored with the stack stopped, so database files
+    are consistent. They are stored per IDs of images used in the project and
+    are invalidated when an image tag changes or gets pulled again.
+    """
+
+    volumes = ("db-data", "sites")
+
+    def __init__(self, compose: Compose, directory: str):
+        self.compose = compose
+        self.directory = directory
+
+    def get_key(self) -> str:
+        images = self.compose.output("config", "--images").split()
+        ids = subprocess.check_output(
+            (self.compose.base_cmd[0], "image", "inspect", "--format={{.Id}}")
+            + tuple(sorted(set(images))),
+            text=True,
+        )
+        return hashlib.sha256(ids.encode()).hexdigest()[:16]
+
+    def get_path(self, name: str) -> str:
+        return os.path.join(self.directory, f"{name}-{self.get_key()}")
+
+    def _run_in_volumes(self, path: str, get_script: Callable[[str], str]) -> None:
+        self.compose("stop")
+        try:
+            # Volumes are mounted into one-off backend containers, run as root
+            # to read and write files of the database server as well.
+            self.compose.run_in_services(
+                self.volumes,
+                lambda volume: [
+                    (
+                        "run",
+                        "--rm",
+                        "--no-deps",
+                        "-T",
+                        "--user=root",
+                        "--entrypoint=sh",
+                        f"--volume={self.compose.project_name}_{volume}:/volume",
+                        f"--volume={path}:/snapshot",
+                        "backend",
+                        "-ec",
+                        get_script(volume),
+                    )
+                ],
+            )
+        finally:
+            self.compose("start")
+
+    def take(self, name: str) -> None:
+        path = self.get_path(name)
+        tmp_path = os.path.join(self.directory, f".{os.path.basename(path)}.tmp")
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        self._run_in_volumes(
+            tmp_path,
+            lambda volume: (
+                f"tar -C /volume --numeric-owner -cf /snapshot/{volume}.tar ."
+            ),
+        )
+        # Drop snapshots of previous images
+        for entry in os.listdir(self.directory):
+            if entry.startswith(f"{name}-"):
+                shutil.rmtree(os.path.join(self.directory, entry))
+        os.rename(tmp_path, path)
+
+    def restore(self, name: str) -> bool:
+        """Restore volumes from snapshot `name`. Return False if there's none."""
+        path = self.get_path(name)
+        if not os.path.isdir(path):
+            return False
+        self._run_in_volumes(
+            path,
+            lambda volume: (
+                "find /volume -mindepth 1 -delete; "
+                f"tar -C /volume --numeric-owner -xpf /snapshot/{volume}.tar"
+            ),
+        )
+        return True
+
+    def restore_or_create(self, name: str, create: Callable[[], None]) -> None:
+        if self.restore(name):
+            print(f"Restored {name} from volume snapshot")
+            return
+        create()
+        self.take(name)
+
+
+class ProbeResponse:
+    def __init__(self, status: int, headers: HTTPMessage, body: bytes):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def read(self) -> bytes:
+        return self.body
+
+
+@dataclass
+class ProbeStats:
+    attempts: int = 0
+    time_to_first_success: Optional[float] = None
+    # Duration of the last successful request
+    latency: Optional[float] = None
+
+
+class ProbeClient:
+    """
+    HTTP client for endpoint checks.
+
+    Keeps one persistent HTTP/1.1 connection per host and reopens it only
+    after a failure. Attempts and time to first success are recorded per URL
+    since the last `reset` of it.
+    """
+
+    redirect_codes = (301, 302, 303, 307, 308)
+    retry_codes = (404, 502)
+
+    def __init__(self, base_delay: float = 0.05, max_delay: float = 0.5):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        # This is needed to check https override
+        self.ssl_context = ssl.create_default_context()
+        self.ssl_context.check_hostname = False
+        self.ssl_context.verify_mode = ssl.CERT_NONE
+        self.connections: dict[Tuple[str, str, int], HTTPConnection] = {}
+        self.stats: dict[str, ProbeStats] = {}
+        self._started: dict[str, float] = {}
+
+    def _get_connection(self, key: Tuple[str, str, int]) -> HTTPConnection:
+        if key not in self.connections:
+            scheme, host, port = key
+            if scheme == "https":
+                self.connections[key] = HTTPSConnection(
+                    host, port, timeout=10, context=self.ssl_context
+                )
+            else:
+                self.connections[key] = HTTPConnection(host, port, timeout=10)
+        return self.connections[key]
+
+    def _drop_connection(self, key: Tuple[str, str, int]) -> None:
+        conn = self.connections.pop(key, None)
+        if conn:
+            conn.close()
+
+    def _send(self, url: str, site_name: str) -> ProbeResponse:
+        parsed = urlsplit(url)
+        default_port = 443 if parsed.scheme == "https" else 80
+        key = (parsed.scheme, parsed.hostname or "", parsed.port or default_port)
+        path = parsed.path or "/"
+        if parsed.query:
+            path += f"?{parsed.query}"
+
+        # Connection may be closed by server after keep-alive timeout,
+        # in this case retry once on a new one.
+        for retry in (True, False):
+            reused = key in self.connections
+            conn = self._get_connection(key)
+            try:
+                conn.request("GET", path, headers={"Host": site_name})
+                response = conn.getresponse()
+                body = response.read()
+            except (OSError, HTTPException):
+                self._drop_connection(key)
+                if retry and reused:
+                    continue
+                raise
+            if response.will_close:
+                self._drop_connection(key)
+            return ProbeResponse(response.status, response.headers, body)
+        raise AssertionError("unreachable")
+
+    def request(self, url: str, site_name: str, redirects: int = 5) -> ProbeResponse:
+        for _ in range(redirects + 1):
+            response = self._send(url, site_name)
+            location = response.headers.get("Location")
+            if response.status not in self.redirect_codes or not location:
+                return response
+            url = urljoin(url, location)
+        return response
+
+    def get_delay(self, attempt: int) -> float:
+        return min(self.max_delay, self.base_delay * 1.5**attempt)
+
+    def reset(self, url: str) -> None:
+        """Start recording a new check of `url`, connections are kept."""
+        self.stats[url] = ProbeStats()
+        self._started[url] = time.monotonic()
+
+    def record_attempt(self, url: str) -> None:
+        self._started.setdefault(url, time.monotonic())
+        self.stats.setdefault(url, ProbeStats()).attempts += 1
+
+    def record_success(self, url: str, latency: float) -> None:
+        stats = self.stats[url]
+        stats.latency = latency
+        if stats.time_to_first_success is None:
+            stats.time_to_first_success = time.monotonic() - self._started[url]
+
+    def get(self, url: str, site_name: str, attempts: int = 100) -> ProbeResponse:
+        for attempt in range(attempts):
+            self.record_attempt(url)
+            start = time.monotonic()
+            try:
+                response = self.request(url, site_name)
+            except (OSError, HTTPException):
+                pass
+            else:
+                if response.status < 400:
+                    self.record_success(url, time.monotonic() - start)
+                    return response
+                if response.status not in self.retry_codes:
+                    raise HTTPError(
+                        url, response.status, "", response.headers, io.BytesIO()
+                    )
+
+            time.sleep(self.get_delay(attempt))
+
+        raise RuntimeError(f"Couldn't ping {url}")
+
+    def close(self) -> None:
+        for key in list(self.connections):
+            self._drop_connection(key)
+
+
+probe_client = ProbeClient()
+
 
 def check_url_content(
     url: str, callback: Callable[[str], Optional[str]], site_name: str
 ):
-    for _ in range(100):
+    probe_client.reset(url)
+    for attempt in range(100):
         try:
-            response = wait_for_url(url=url, site_name=site_name, attempts=1)
+            response = probe_client.get(url=url, site_name=site_name, attempts=1)
         except RuntimeError:
             pass
         else:
@@ -70,30 +460,19 @@ def check_url_content(
             ret = callback(text)
             if ret:
                 print(ret)
+                stats = probe_client.stats[url]
+                print(
+                    f"{url}: {stats.attempts} attempts, "
+                    f"first success after {stats.time_to_first_success:.3f}s, "
+                    f"latency {stats.latency:.3f}s"
+                )
                 return
 
-        time.sleep(0.1)
+        time.sleep(probe_client.get_delay(attempt))
 
     raise RuntimeError(f"Couldn't verify expected content from {url}")
 
 
-def wait_for_url(url: str, site_name: str, attempts: int = 100) -> HTTPResponse:
-    request = Request(url, headers={"Host": site_name})
-
-    # This is needed to check https override
-    ctx = ssl.create_default_context()
-    ctx.check_hostname = False
-    ctx.verify_mode = ssl.CERT_NONE
-
-    for _ in range(attempts):
-        try:
-            return urlopen(request, context=ctx)
-        except HTTPError as exc:
-            if exc.code not in (404, 502):
-                raise
-        except URLError:
-            pass
-
-        time.sleep(0.1)
-
-    raise RuntimeError(f"Couldn't ping {url}")
+def wait_for_url(url: str, site_name: str, attempts: int = 100) -> ProbeResponse:
+    probe_client.reset(url)
+    return probe_client.get(url=url, site_name=site_name, attempts=attempts)